@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import case, func, literal, union_all
+from cache import TTLCache, clear_on_commit
+from extensions import db
+from models import User, Timesheet
+from utils import get_week_start_end
+
+# Dashboard figures; configured from ADMIN_STATS_TTL and cleared on user/timesheet commits
+stats_cache = TTLCache('admin_stats', ttl=60, maxsize=8)
+clear_on_commit(stats_cache, User, Timesheet)
+
+STATUSES = ('draft', 'submitted', 'approved', 'rejected')
+
+
+def _compute_stats(week_start, overdue_before):
+    """Run the single grouped aggregate over users and timesheets."""
+    user_counts = (
+        db.select(
+            literal('user').label('kind'),
+            User.role.label('key'),
+            func.count().label('total'),
+            literal(0).label('this_week'),
+            literal(0).label('overdue'),
+        )
+        .group_by(User.role)
+    )
+    timesheet_counts = (
+        db.select(
+            literal('timesheet').label('kind'),
+            Timesheet.status.label('key'),
+            func.count().label('total'),
+            func.sum(case((Timesheet.week_start == week_start, 1), else_=0)).label('this_week'),
+            func.sum(case(
+                ((Timesheet.status == 'submitted') & (Timesheet.submitted_at < overdue_before), 1),
+                else_=0
+            )).label('overdue'),
+        )
+        .group_by(Timesheet.status)
+    )
+    rows = db.session.execute(union_all(user_counts, timesheet_counts)).all()
+
+    stats = {
+        'users_by_role': {'employee': 0, 'manager': 0, 'admin': 0},
+        'timesheets_by_status': {s: 0 for s in STATUSES},
+        'this_week_by_status': {s: 0 for s in STATUSES},
+        'overdue_submissions': 0,
+        'week_start': week_start,
+        'computed_at': datetime.utcnow(),
+    }
+    for kind, key, total, this_week, overdue in rows:
+        if kind == 'user':
+            stats['users_by_role'][key] = total
+        else:
+            stats['timesheets_by_status'][key] = total
+            stats['this_week_by_status'][key] = this_week or 0
+            stats['overdue_submissions'] += overdue or 0
+    stats['user_count'] = sum(stats['users_by_role'].values())
+    stats['timesheet_count'] = sum(stats['timesheets_by_status'].values())
+    return stats
+
+
+def dashboard_stats():
+    """
+    Counts for the admin landing page: users by role, timesheets by status
+    (overall and for the current week) and submissions pending for more
+    than PENDING_OVERDUE_DAYS. Served from a short-lived per-worker cache
+    so repeated page loads do not re-scan the tables.
+    """
+    overdue_days = current_app.config.get('PENDING_OVERDUE_DAYS', 3)
+    week_start, _ = get_week_start_end()
+    key = (week_start, overdue_days)
+    return stats_cache.get_or_load(
+        key, lambda: _compute_stats(week_start, datetime.utcnow() - timedelta(days=overdue_days))
+    )
@@ -5,20 +5,45 @@ from routes.auth_routes import auth_bp
 from routes.employee_routes import employee_bp
 from routes.manager_routes import manager_bp
 from routes.admin_routes import admin_bp
+from routes.api_routes import api_bp
+from user_cache import identity_cache
+from admin_stats import stats_cache
+from org_tree import reports_cache
+from project_catalog import project_index
+import assets
+import db_pool
+import instrumentation
+import metrics
+import reporting  # registers the project_week_hours rollup listeners
+import partitions  # partitions timesheet_entries when create_all() makes it on Postgres
+import entry_search  # and adds its full-text search index
 
-def create_app():
+def create_app(config_overrides=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    if config_overrides:
+        app.config.update(config_overrides)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        **db_pool.engine_options(app.config), **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+    }
 
     # Initialize extensions
     db.init_app(app)
     login_manager.init_app(app)
+    identity_cache.configure(ttl=app.config['USER_CACHE_TTL'], maxsize=app.config['USER_CACHE_MAX_SIZE'])
+    stats_cache.configure(ttl=app.config['ADMIN_STATS_TTL'])
+    reports_cache.configure(ttl=app.config['MANAGER_REPORTS_TTL'])
+    project_index.init_app(app)
+    assets.init_app(app)
+    instrumentation.init_app(app)
+    metrics.init_app(app)
 
     # Register Blueprints
     app.register_blueprint(auth_bp)
     app.register_blueprint(employee_bp, url_prefix='/employee')
     app.register_blueprint(manager_bp, url_prefix='/manager')
     app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
 
     return app
 
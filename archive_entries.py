@@ -0,0 +1,68 @@
+import argparse
+import csv
+import sys
+from datetime import datetime, timedelta
+from app import create_app
+from extensions import db
+import change_feed
+import entry_archive
+import partitions
+from timesheet_queries import ADMIN_EXPORT_HEADER
+
+app = create_app()
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old approved weeks, maintain entry partitions and purge old tombstones.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    run = sub.add_parser('run', help="move approved weeks older than the retention window to the archive, purge old tombstones")
+    run.add_argument('--months', type=int, default=None, help="retention in months (default: ARCHIVE_AFTER_MONTHS)")
+    run.add_argument('--dry-run', action='store_true', help="only report what would be archived")
+    sub.add_parser('partitions', help="create upcoming monthly partitions (Postgres)")
+    sub.add_parser('status', help="list archive files and partitions")
+    export = sub.add_parser('export', help="write one archived month as CSV")
+    export.add_argument('month', help="YYYY-MM")
+    export.add_argument('--out', help="output file (default: stdout)")
+    args = parser.parse_args()
+
+    with app.app_context():
+        months_ahead = app.config['ENTRY_PARTITION_MONTHS_AHEAD']
+        if args.command == 'run':
+            cutoff = entry_archive.archive_cutoff(months=args.months)
+            print(f"Archiving approved weeks starting before {cutoff}.")
+            done = entry_archive.archive_entries(cutoff, dry_run=args.dry_run)
+            with db.engine.begin() as connection:
+                partitions.ensure_partitions(connection, months_ahead)
+            print(f"{sum(t for t, _ in done.values())} timesheets, "
+                  f"{sum(e for _, e in done.values())} entries in {len(done)} month(s).")
+            if not args.dry_run:
+                purged = change_feed.purge_tombstones()
+                db.session.commit()
+                print(f"Purged {purged} tombstone(s) older than {app.config['CHANGE_RETENTION_DAYS']} days.")
+        elif args.command == 'partitions':
+            with db.engine.begin() as connection:
+                if not partitions.is_partitioned(connection):
+                    sys.exit("timesheet_entries is not partitioned (Postgres only; run `python migrate.py upgrade`).")
+                created = partitions.ensure_partitions(connection, months_ahead)
+            print(f"Created {len(created)} partition(s): {', '.join(created) or '-'}")
+        elif args.command == 'status':
+            for month in entry_archive.archived_months():
+                print(f"archive {month:%Y-%m}: {entry_archive.archive_path(month)}")
+            with db.engine.connect() as connection:
+                for name, rows in partitions.partition_sizes(connection):
+                    print(f"partition {name}: ~{rows} rows")
+        elif args.command == 'export':
+            try:
+                month = datetime.strptime(args.month, '%Y-%m').date()
+            except ValueError:
+                sys.exit("month must be YYYY-MM")
+            rows = entry_archive.export_rows(start_date=month,
+                                             end_date=partitions.add_months(month, 1) - timedelta(days=1))
+            out = open(args.out, 'w', newline='') if args.out else sys.stdout
+            writer = csv.writer(out)
+            writer.writerow(ADMIN_EXPORT_HEADER)
+            writer.writerows(rows)
+            if args.out:
+                out.close()
+
+if __name__ == '__main__':
+    main()
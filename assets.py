@@ -0,0 +1,76 @@
+"""
+Serving of the fingerprinted assets built by build_static.py.
+
+Templates call `asset_url('css/styles.css')` instead of
+`url_for('static', filename=...)`. When static/dist/manifest.json exists the
+helper returns the hashed URL under /assets/, which is served with a one-year
+immutable Cache-Control and the .br or .gz variant the client accepts.
+Without a build it falls back to the plain static URL.
+"""
+import json
+import logging
+import mimetypes
+import os
+from flask import Blueprint, current_app, request, send_from_directory, url_for, abort
+
+assets_bp = Blueprint('assets', __name__)
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+# Preferred first when the client accepts both
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _dist_dir(app=None):
+    return os.path.join((app or current_app).static_folder, DIST)
+
+
+def load_manifest(app):
+    path = os.path.join(_dist_dir(app), MANIFEST)
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError as e:
+        logging.error(f"Ignoring unreadable asset manifest {path}: {e}")
+        return {}
+
+
+def asset_url(filename):
+    """url_for('static')-compatible URL for `filename`, fingerprinted when built."""
+    hashed = current_app.extensions['asset_manifest'].get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.serve_asset', filename=hashed)
+
+
+@assets_bp.route('/assets/<path:filename>')
+def serve_asset(filename):
+    if filename == MANIFEST:
+        abort(404)
+    directory = _dist_dir()
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+
+    chosen, suffix = None, ''
+    for encoding, ext in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(directory, filename + ext)):
+            chosen, suffix = encoding, ext
+            break
+
+    response = send_from_directory(directory, filename + suffix, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+    if chosen:
+        response.headers['Content-Encoding'] = chosen
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_app(app):
+    """Load the asset manifest once per process and expose asset_url() to templates."""
+    app.extensions['asset_manifest'] = load_manifest(app)
+    app.add_template_global(asset_url)
+    app.register_blueprint(assets_bp)
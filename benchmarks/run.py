@@ -0,0 +1,280 @@
+"""
+Time the hot endpoints of each blueprint against a seeded database.
+
+Every scenario is requested --repeat times through the Flask test client
+(after --warmup untimed runs). The runner records latency percentiles, the
+number of SQL statements per request and, in one extra traced run, the peak
+Python memory allocated while handling it. Results are written as JSON,
+named after the current git commit by default, and --compare prints the
+change against an earlier results file.
+
+    python -m benchmarks.seed --db sqlite:///bench.db --users 1000 --weeks 52
+    python -m benchmarks.run --db sqlite:///bench.db
+    python -m benchmarks.run --db sqlite:///bench.db --compare benchmarks/results/<old>.json
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+import sqlalchemy
+from sqlalchemy import event, func
+from app import create_app
+from extensions import db
+from models import User, Timesheet, TimesheetEntry
+from benchmarks.seed import PASSWORD
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def _git(*args):
+    try:
+        return subprocess.check_output(['git', *args], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _pick_subjects():
+    """Choose the users and timesheets the scenarios act on: the busiest manager and one of their reports."""
+    manager_id, _ = (
+        db.session.query(User.manager_id, func.count(User.id))
+        .filter(User.role == 'employee', User.manager_id.isnot(None))
+        .group_by(User.manager_id)
+        .order_by(func.count(User.id).desc())
+        .first()
+    )
+    manager = db.session.get(User, manager_id)
+    employee = (
+        User.query.filter_by(manager_id=manager_id, role='employee')
+        .join(Timesheet, Timesheet.user_id == User.id)
+        .group_by(User.id)
+        .order_by(func.count(Timesheet.id).desc())
+        .first()
+    )
+    admin = User.query.filter_by(role='admin').first()
+    editable = (
+        Timesheet.query.filter(Timesheet.user_id == employee.id, Timesheet.status.in_(['draft', 'rejected']))
+        .order_by(Timesheet.week_start.desc()).first()
+    )
+    reviewable = (
+        Timesheet.query.filter(Timesheet.user_id == employee.id, Timesheet.status.in_(['submitted', 'approved']))
+        .order_by(Timesheet.week_start.desc()).first()
+    )
+    return {
+        'admin': admin.username, 'manager': manager.username, 'employee': employee.username,
+        'editable_id': editable.id if editable else None,
+        'reviewable_id': reviewable.id if reviewable else None,
+    }
+
+
+def _edit_form(app, timesheet_id, run):
+    """Form data for re-saving a week; the first description alternates so every save writes."""
+    with app.app_context():
+        timesheet = db.session.get(Timesheet, timesheet_id)
+        week_start = timesheet.week_start
+        entries = (
+            TimesheetEntry.query.filter_by(timesheet_id=timesheet_id)
+            .order_by(TimesheetEntry.date, TimesheetEntry.id).all()
+        )
+    form = {'action': 'save'}
+    for i in range(5):
+        day = week_start + timedelta(days=i)
+        day_entries = [e for e in entries if e.date == day]
+        if not day_entries:
+            continue
+        form[f'clock_in_{i}'] = day_entries[0].clock_in.strftime('%H:%M') if day_entries[0].clock_in else ''
+        form[f'clock_out_{i}'] = day_entries[0].clock_out.strftime('%H:%M') if day_entries[0].clock_out else ''
+        form[f'project_{i}[]'] = [e.project for e in day_entries]
+        form[f'description_{i}[]'] = [e.description or '' for e in day_entries]
+        form[f'hours_{i}[]'] = [str(e.hours) for e in day_entries]
+    for key in sorted(k for k in form if k.startswith('description_')):
+        form[key][0] = f'benchmark run {run % 2}'
+        break
+    return form
+
+
+def build_scenarios(app, subjects):
+    """(name, role, method, url, form-builder or None). Dates span the seeded history."""
+    today = date.today()
+    three_years = (today - timedelta(weeks=156)).isoformat()
+    one_year = (today - timedelta(weeks=52)).isoformat()
+    month_start = today.replace(day=1).isoformat()
+    editable, reviewable = subjects['editable_id'], subjects['reviewable_id']
+
+    scenarios = [
+        ('employee.timesheet_list', 'employee', 'GET', f'/employee/timesheets?start_date={three_years}', None),
+        ('employee.export', 'employee', 'GET', f'/employee/timesheets/export?start_date={three_years}', None),
+        ('manager.dashboard', 'manager', 'GET', '/manager/dashboard', None),
+        ('manager.export_history', 'manager', 'GET', f'/manager/timesheets/export-history?start_date={one_year}', None),
+        ('admin.dashboard', 'admin', 'GET', '/admin/dashboard', None),
+        ('admin.users', 'admin', 'GET', '/admin/users', None),
+        ('admin.timesheets', 'admin', 'GET', f'/admin/timesheets?start_date={month_start}', None),
+        ('admin.export_month', 'admin', 'GET', f'/admin/timesheets/export?start_date={month_start}', None),
+        ('api.list', 'manager', 'GET', '/api/v1/timesheets?per_page=50', None),
+        ('manager.project_report', 'manager', 'GET', f'/manager/reports/projects?start_date={one_year}', None),
+        ('manager.project_report_export', 'manager', 'GET',
+         f'/manager/reports/projects/export?start_date={three_years}&period=month', None),
+        ('admin.project_report', 'admin', 'GET',
+         f'/admin/reports/projects?start_date={one_year}&view=project&period=month', None),
+    ]
+    if editable:
+        scenarios += [
+            ('employee.edit', 'employee', 'GET', f'/employee/timesheets/edit/{editable}', None),
+            ('employee.edit_save', 'employee', 'POST', f'/employee/timesheets/edit/{editable}',
+             lambda run: _edit_form(app, editable, run)),
+        ]
+    if reviewable:
+        scenarios += [
+            ('manager.view_timesheet', 'manager', 'GET', f'/manager/timesheets/view/{reviewable}', None),
+            ('api.detail', 'manager', 'GET', f'/api/v1/timesheets/{reviewable}', None),
+        ]
+    return scenarios
+
+
+def _request(client, method, url, form):
+    response = client.open(url, method=method, data=form, buffered=False)
+    # Drain streamed bodies inside the timing, without holding them in memory
+    for _ in response.iter_encoded():
+        pass
+    response.close()
+    return response.status_code
+
+
+def run_scenario(counter, client, method, url, form_builder, repeat, warmup):
+    for i in range(warmup):
+        _request(client, method, url, form_builder(i) if form_builder else None)
+
+    timings, queries = [], []
+    for i in range(repeat):
+        form = form_builder(warmup + i) if form_builder else None
+        counter.count = 0
+        started = time.perf_counter()
+        status = _request(client, method, url, form)
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter.count)
+        if status >= 400:
+            raise RuntimeError(f"{method} {url} returned {status}")
+
+    form = form_builder(warmup + repeat) if form_builder else None
+    tracemalloc.start()
+    _request(client, method, url, form)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    return {
+        'method': method,
+        'url': url,
+        'runs': repeat,
+        'min_ms': round(timings[0], 2),
+        'median_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+        'max_ms': round(timings[-1], 2),
+        'queries': max(queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def _login(app, username):
+    client = app.test_client()
+    response = client.post('/', data={'username': username, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise RuntimeError(f"Could not log in as {username}; was the database built by benchmarks.seed?")
+    return client
+
+
+def run(db_url, repeat, warmup, only=None, log=print):
+    app = create_app({'SQLALCHEMY_DATABASE_URI': db_url})
+    results = {}
+    with app.app_context():
+        counter = QueryCounter(db.engine)
+        subjects = _pick_subjects()
+        sizes = {
+            'users': User.query.count(),
+            'timesheets': Timesheet.query.count(),
+            'entries': TimesheetEntry.query.count(),
+        }
+
+    # Requests run outside any app context so each gets its own `g`
+    # (Flask-Login caches the current user there).
+    clients = {role: _login(app, subjects[role]) for role in ('employee', 'manager', 'admin')}
+    for name, role, method, url, form_builder in build_scenarios(app, subjects):
+        if only and not any(fnmatch.fnmatch(name, pattern) for pattern in only):
+            continue
+        results[name] = run_scenario(counter, clients[role], method, url, form_builder, repeat, warmup)
+        r = results[name]
+        log(f"{name:28} median {r['median_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+            f"{r['queries']:4d} queries  peak {r['peak_kb']:9.1f} KB")
+
+    return {
+        'meta': {
+            'commit': _git('rev-parse', '--short', 'HEAD'),
+            'dirty': bool(_git('status', '--porcelain', '--untracked-files=no')),
+            'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlalchemy': sqlalchemy.__version__,
+            'database': sqlalchemy.engine.make_url(db_url).get_backend_name(),
+            'sizes': sizes,
+            'subjects': subjects,
+            'repeat': repeat,
+            'warmup': warmup,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, log=print):
+    """Print median latency, query count and peak memory against a baseline results file."""
+    log(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('created_at')}):")
+    for name, r in current['results'].items():
+        old = baseline['results'].get(name)
+        if not old:
+            log(f"{name:28} (new)")
+            continue
+        change = (r['median_ms'] - old['median_ms']) / old['median_ms'] * 100 if old['median_ms'] else 0.0
+        log(f"{name:28} median {old['median_ms']:9.2f} -> {r['median_ms']:9.2f} ms ({change:+6.1f}%)  "
+            f"queries {old['queries']:4d} -> {r['queries']:4d}  "
+            f"peak {old['peak_kb']:9.1f} -> {r['peak_kb']:9.1f} KB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hot endpoints against a seeded database.")
+    parser.add_argument('--db', required=True, help="SQLAlchemy URL of a database built by benchmarks.seed")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', action='append', help="run only scenarios matching this glob (repeatable)")
+    parser.add_argument('--output', help="results file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    current = run(args.db, args.repeat, args.warmup, args.only)
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{current['meta']['commit'] or 'results'}{'-dirty' if current['meta']['dirty'] else ''}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(current, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
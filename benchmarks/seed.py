@@ -0,0 +1,175 @@
+"""
+Generate a synthetic data set for benchmarking.
+
+Builds a fresh schema in the target database and fills it with an org
+chart (admins, directors, managers, employees) and weekly timesheets with
+entries going back --weeks weeks. Older weeks are mostly approved, the last
+few are a mix of submitted, rejected and draft, like a live system.
+The data is deterministic for a given --seed.
+
+    python -m benchmarks.seed --db sqlite:///bench.db --users 5000 --weeks 156
+
+Every generated user has the password "bench".
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, time as dtime, timedelta
+from werkzeug.security import generate_password_hash
+from app import create_app
+from extensions import db
+from models import User, Project, Timesheet, TimesheetEntry
+from project_catalog import project_key
+import migrations
+import partitions
+from reporting import rebuild_project_hours
+
+PASSWORD = 'bench'
+BATCH_SIZE = 5000
+
+PROJECTS = ['Apollo', 'Billing', 'Catalog', 'Data Platform', 'Endpoints', 'Finance Ops',
+            'Growth', 'Helpdesk', 'Infra', 'Mobile', 'Onboarding', 'Payments', 'Reporting',
+            'Search', 'Security', 'Support', 'Website']
+TASKS = ['Code review', 'Feature work', 'Bug fixes', 'Meetings', 'Planning', 'Testing',
+         'Documentation', 'Deployments', 'Customer call', 'Research']
+
+
+def _org_chart(rng, n_users):
+    """Return user dicts with ids, roles and manager_ids forming a 3-level hierarchy."""
+    n_admins = max(1, n_users // 1000)
+    n_managers = max(1, n_users // 12)
+    n_directors = max(1, n_managers // 10)
+
+    users = []
+
+    def add(role, manager_id=None):
+        uid = len(users) + 1
+        name = f'{role}{uid:05d}'
+        users.append({'id': uid, 'username': name, 'email': f'{name}@example.com',
+                      'role': role, 'manager_id': manager_id})
+        return uid
+
+    for _ in range(n_admins):
+        add('admin')
+    directors = [add('manager') for _ in range(n_directors)]
+    managers = directors + [add('manager', rng.choice(directors)) for _ in range(n_managers - n_directors)]
+    while len(users) < n_users:
+        add('employee', rng.choice(managers))
+    return users
+
+
+def _week_status(rng, weeks_ago):
+    if weeks_ago == 0:
+        return 'draft'
+    if weeks_ago <= 2:
+        return rng.choices(['submitted', 'draft', 'rejected', 'approved'], [5, 2, 1, 2])[0]
+    return rng.choices(['approved', 'rejected'], [97, 3])[0]
+
+
+def _entries_for_week(rng, week_start, entries_per_day):
+    rows = []
+    for day in range(5):
+        if rng.random() < 0.04:  # leave, holidays
+            continue
+        start = dtime(rng.choice([8, 9, 9, 10]), rng.choice([0, 15, 30]))
+        hours_left = rng.choice([7.5, 8.0, 8.0, 8.5])
+        per_entry = round(hours_left / entries_per_day, 2)
+        end = (datetime.combine(week_start, start) + timedelta(hours=hours_left + 0.5)).time()
+        for _ in range(entries_per_day):
+            rows.append({
+                'date': week_start + timedelta(days=day),
+                'clock_in': start,
+                'clock_out': end,
+                'project_id': rng.randrange(len(PROJECTS)) + 1,  # PROJECTS are ids 1..n
+                'description': rng.choice(TASKS),
+                'hours': per_entry,
+            })
+    return rows
+
+
+def _flush(table, rows):
+    if rows:
+        db.session.execute(db.insert(table), rows)
+        rows.clear()
+
+
+def seed(n_users, weeks, entries_per_day, rng, log=print):
+    started = time.perf_counter()
+    db.drop_all()
+    db.create_all()
+    migrations.stamp(db.engine)
+
+    password_hash = generate_password_hash(PASSWORD)  # one hash; hashing 5k passwords would take minutes
+    users = _org_chart(rng, n_users)
+    for u in users:
+        u['password_hash'] = password_hash
+    for i in range(0, len(users), BATCH_SIZE):
+        db.session.execute(db.insert(User), users[i:i + BATCH_SIZE])
+    log(f"{len(users)} users")
+    db.session.execute(db.insert(Project), [{'id': i, 'name': name, 'key': project_key(name)}
+                                            for i, name in enumerate(PROJECTS, 1)])
+
+    this_monday = date.today() - timedelta(days=date.today().weekday())
+    employees = [u for u in users if u['role'] == 'employee']
+    ts_rows, entry_rows = [], []
+    ts_id = entry_id = 0
+    for u in employees:
+        # Staggered start dates so history length varies per user
+        first = rng.randint(0, max(0, weeks // 4))
+        for weeks_ago in range(weeks - 1 - first, -1, -1):
+            week_start = this_monday - timedelta(weeks=weeks_ago)
+            status = _week_status(rng, weeks_ago)
+            entries = _entries_for_week(rng, week_start, entries_per_day)
+            ts_id += 1
+            submitted_at = (datetime.combine(week_start + timedelta(days=4), dtime(17, 0))
+                            if status != 'draft' else None)
+            ts_rows.append({
+                'id': ts_id, 'user_id': u['id'], 'week_start': week_start, 'status': status,
+                'submitted_at': submitted_at,
+                'approved_at': submitted_at + timedelta(days=1) if status == 'approved' else None,
+                'manager_comments': 'Please fix the hours' if status == 'rejected' else None,
+                'total_hours': sum(e['hours'] for e in entries),
+                'entry_count': len(entries),
+                'first_clock_in': min((e['clock_in'] for e in entries), default=None),
+                'last_clock_out': max((e['clock_out'] for e in entries), default=None),
+                'version': 1,
+            })
+            for e in entries:
+                entry_id += 1
+                e.update(id=entry_id, timesheet_id=ts_id)
+                entry_rows.append(e)
+            if len(entry_rows) >= BATCH_SIZE:
+                _flush(Timesheet, ts_rows)
+                _flush(TimesheetEntry, entry_rows)
+    _flush(Timesheet, ts_rows)
+    _flush(TimesheetEntry, entry_rows)
+    # History older than the initial partitions went to the default partition
+    partitions.ensure_partitions(db.session.connection())
+    rebuild_project_hours(db.session)
+
+    if db.engine.dialect.name == 'postgresql':
+        # Ids were assigned here, so move the sequences past them
+        for table in ('users', 'projects', 'timesheets', 'timesheet_entries'):
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+            ))
+    db.session.commit()
+    log(f"{ts_id} timesheets, {entry_id} entries in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a database with synthetic benchmark data.")
+    parser.add_argument('--db', required=True, help="SQLAlchemy URL of the database to (re)build, e.g. sqlite:///bench.db")
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--weeks', type=int, default=156, help="weeks of history per employee (156 = 3 years)")
+    parser.add_argument('--entries-per-day', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': args.db})
+    with app.app_context():
+        seed(args.users, args.weeks, args.entries_per_day, random.Random(args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Build fingerprinted, precompressed copies of static/ into static/dist.
+
+Each file is copied to a name that embeds a hash of its contents
+(css/styles.css -> css/styles.1a2b3c4d5e6f.css), and text assets also get
+.gz and, when the optional `brotli` package is installed, .br siblings.
+static/dist/manifest.json maps the original names to the hashed ones; it is
+read by assets.py at startup.
+
+    python build_static.py
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = 'manifest.json'
+
+# Already-compressed formats gain nothing from gzip/brotli
+COMPRESSIBLE = {'.css', '.js', '.svg', '.html', '.json', '.txt', '.ico', '.map', '.xml'}
+# Keep a compressed variant only if it is at least this much smaller
+MIN_SAVING = 0.1
+
+
+def _source_files():
+    for root, dirs, files in os.walk(STATIC_DIR):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and os.path.join(root, d) != DIST_DIR)
+        for name in sorted(files):
+            if not name.startswith('.'):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, STATIC_DIR).replace(os.sep, '/'), path
+
+
+def _write_compressed(path, data):
+    written = []
+    variants = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+    for suffix, compress in variants:
+        packed = compress(data)
+        if len(packed) <= len(data) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as f:
+                f.write(packed)
+            written.append(suffix)
+    return written
+
+
+def build():
+    if os.path.isdir(DIST_DIR):
+        shutil.rmtree(DIST_DIR)
+    manifest = {}
+    for name, path in _source_files():
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(name)
+        hashed = f'{stem}.{digest}{ext}'
+
+        target = os.path.join(DIST_DIR, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+        variants = _write_compressed(target, data) if ext.lower() in COMPRESSIBLE else []
+
+        manifest[name] = hashed
+        print(f"{name} -> {hashed} {' '.join(variants)}".rstrip())
+
+    with open(os.path.join(DIST_DIR, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if brotli is None:
+        print("brotli is not installed; only gzip variants were written.")
+    print(f"Wrote {len(manifest)} assets to {DIST_DIR}")
+
+
+if __name__ == '__main__':
+    build()
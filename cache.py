@@ -0,0 +1,142 @@
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Every cache created in this worker, by name, for stats reporting
+CACHES = {}
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Small thread-safe per-worker cache with LRU eviction and a TTL per entry.
+
+    Values are kept in an OrderedDict ordered by last use; once `maxsize`
+    entries are stored the least recently used one is evicted. Hit, miss
+    and eviction counters are kept for stats().
+    """
+
+    def __init__(self, name, ttl=60, maxsize=1024):
+        self.name = name
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    def configure(self, ttl=None, maxsize=None):
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if maxsize is not None:
+                self.maxsize = maxsize
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is not _MISSING and item[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not _MISSING:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for `key`, calling loader() and caching its result on a miss."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            self.set(key, value)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+def cache_stats():
+    """Stats of every cache in this worker, keyed by cache name."""
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+# (table names, cache) pairs cleared when a commit writes one of the tables
+_TABLE_WATCHERS = []
+
+
+def clear_on_commit(cache, *models):
+    """Clear `cache` after any commit in this worker that wrote to a table of `models`."""
+    _TABLE_WATCHERS.append(({m.__tablename__ for m in models}, cache))
+
+
+def _changed_tables(session):
+    return session.info.setdefault('changed_tables', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _track_flushed_tables(session, flush_context):
+    changed = _changed_tables(session)
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table:
+            changed.add(table)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _track_bulk_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _changed_tables(orm_execute_state.session).add(mapper.local_table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _clear_watched_caches(session):
+    changed = session.info.pop('changed_tables', None)
+    if not changed:
+        return
+    for tables, cache in _TABLE_WATCHERS:
+        if tables & changed:
+            cache.clear()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_tables(session):
+    session.info.pop('changed_tables', None)
@@ -0,0 +1,114 @@
+"""
+Change tracking for the incremental ("changed since") timesheet export.
+
+Timesheet.updated_at and TimesheetEntry.updated_at hold the time of the
+last change made through the app. Saving a week's entries also updates its
+timesheet (refresh_totals), so a timesheet's updated_at covers its entries.
+Deleted entries leave a row in timesheet_entry_tombstones: ORM deletes
+(e.g. deleting a draft week) through an event, bulk deletes by calling
+record_deleted_entries(). Archiving a week and repairing rollups are not
+changes, so they touch neither.
+
+An export covers a window of updated_at. The cursor it returns is an
+opaque token for the end of that window, and the next export starts there.
+Every entry of a timesheet changed in the window is sent (upsert, keyed by
+Entry ID), after a delete row for each tombstone of the window. The window
+ends CHANGE_CURSOR_LAG_SECONDS in the past, so rows stamped by a
+transaction that had not committed yet fall in the next window instead of
+being skipped.
+"""
+import base64
+import binascii
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event
+from extensions import db
+from models import User, Project, Timesheet, TimesheetEntry, EntryTombstone
+from timesheet_queries import entry_export_rows, ADMIN_EXPORT_HEADER
+
+CHANGE_EXPORT_HEADER = ["Change", "Entry ID"] + ADMIN_EXPORT_HEADER + ["Updated At"]
+_CURSOR_PREFIX = 'v1:'
+
+
+def encode_cursor(moment):
+    return base64.urlsafe_b64encode((_CURSOR_PREFIX + moment.isoformat()).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """The window end stored in `token`; ValueError if it is not a cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Malformed cursor.")
+    try:
+        if raw.startswith(_CURSOR_PREFIX):
+            return datetime.fromisoformat(raw[len(_CURSOR_PREFIX):])
+    except ValueError:
+        pass
+    raise ValueError("Malformed cursor.")
+
+
+def record_deleted_entries(executor, timesheet_id, entry_ids):
+    """Add tombstones for entries removed with a bulk DELETE. `executor` is a Session or Connection."""
+    if entry_ids:
+        now = datetime.utcnow()
+        executor.execute(db.insert(EntryTombstone), [
+            {'entry_id': entry_id, 'timesheet_id': timesheet_id, 'deleted_at': now} for entry_id in entry_ids
+        ])
+
+
+@event.listens_for(TimesheetEntry, 'after_delete')
+def _entry_deleted(mapper, connection, target):
+    record_deleted_entries(connection, target.timesheet_id, [target.id])
+
+
+def purge_tombstones():
+    """
+    Delete tombstones older than CHANGE_RETENTION_DAYS, whose cursors are
+    refused anyway. Run by `archive_entries.py run`. Returns the number
+    deleted; the caller commits.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=current_app.config['CHANGE_RETENTION_DAYS'])
+    return db.session.execute(db.delete(EntryTombstone).where(EntryTombstone.deleted_at < cutoff)).rowcount
+
+
+def change_rows(cursor=None):
+    """
+    (rows, next cursor) of the incremental export, rows matching
+    CHANGE_EXPORT_HEADER. Without a cursor every entry is sent, which is the
+    starting point of a sync. Raises ValueError for a malformed cursor or one
+    older than CHANGE_RETENTION_DAYS, whose deletions may be forgotten.
+    Only reads.
+    """
+    now = datetime.utcnow()
+    since = decode_cursor(cursor) if cursor else None
+    if since is not None and since < now - timedelta(days=current_app.config['CHANGE_RETENTION_DAYS']):
+        raise ValueError("The cursor has expired; run a full export and continue from its cursor.")
+    until = now - timedelta(seconds=current_app.config['CHANGE_CURSOR_LAG_SECONDS'])
+    if since is not None:
+        until = max(until, since)
+
+    def rows():
+        if since is not None:
+            tombstones = (
+                db.session.query(EntryTombstone.entry_id, EntryTombstone.timesheet_id, EntryTombstone.deleted_at)
+                .filter(EntryTombstone.deleted_at > since, EntryTombstone.deleted_at <= until)
+                .order_by(EntryTombstone.deleted_at, EntryTombstone.id)
+            )
+            # Deletions go first: on SQLite a deleted entry's id can be reused by a later insert
+            for entry_id, timesheet_id, deleted_at in tombstones:
+                yield ('delete', entry_id, timesheet_id) + (None,) * (len(ADMIN_EXPORT_HEADER) - 1) + (deleted_at,)
+
+        query = Timesheet.query.filter(Timesheet.updated_at <= until)
+        if since is not None:
+            query = query.filter(Timesheet.updated_at > since)
+        for row in entry_export_rows(
+            query,
+            TimesheetEntry.id, Timesheet.id, User.username, Timesheet.week_start, Timesheet.status,
+            Timesheet.submitted_at, Timesheet.approved_at,
+            TimesheetEntry.date, TimesheetEntry.clock_in, TimesheetEntry.clock_out,
+            Project.name, TimesheetEntry.description, TimesheetEntry.hours, TimesheetEntry.updated_at,
+        ):
+            yield ('upsert',) + row
+
+    return rows(), encode_cursor(until)
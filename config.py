@@ -1,8 +1,78 @@
+import os
 from constants import SECRET_KEY, DATABASE_URI
 
+
+def database_uri():
+    """DATABASE_URL from the environment (e.g. a local SQLite/Postgres for benchmarks), else constants."""
+    uri = os.environ.get('DATABASE_URL', DATABASE_URI)
+    # Heroku-style URLs use the scheme SQLAlchemy 1.4+ no longer accepts
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
 class Config:
     SECRET_KEY = SECRET_KEY
-    SQLALCHEMY_DATABASE_URI = DATABASE_URI
+    SQLALCHEMY_DATABASE_URI = database_uri()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
     POSTS_PER_PAGE = 10  # pagination
+    EXPORT_BATCH_SIZE = 1000  # rows fetched per round trip when streaming exports
+
+    # Per-worker cache of logged-in user identities (see user_cache.py)
+    USER_CACHE_TTL = 60  # seconds; bounds staleness in other workers after an edit
+    USER_CACHE_MAX_SIZE = 10000
+
+    # Admin dashboard counts (see admin_stats.py)
+    ADMIN_STATS_TTL = 60  # seconds; also cleared on user/timesheet commits in the same worker
+    PENDING_OVERDUE_DAYS = 3  # submissions waiting longer than this are flagged as overdue
+
+    # Manager approval scope (see org_tree.py)
+    MANAGER_INCLUDE_INDIRECT_REPORTS = False  # True: whole reporting subtree, False: direct reports
+    MANAGER_REPORTS_TTL = 300  # seconds; also cleared on user commits in the same worker
+
+    # Background CSV exports (see export_jobs.py)
+    EXPORT_DIR = None  # defaults to <instance path>/exports
+    EXPORT_WORKERS = 2  # export threads per app process
+    EXPORT_REUSE_SECONDS = 600  # identical filters within this window reuse the finished file
+    EXPORT_RETENTION_SECONDS = 86400  # finished files older than this are deleted
+
+    # Incremental "changed since" export (see change_feed.py)
+    CHANGE_CURSOR_LAG_SECONDS = 120  # changes newer than this wait for the next export; exceeds any write transaction
+    CHANGE_RETENTION_DAYS = 90  # deletions are remembered this long; older cursors must restart from a full export
+
+    # Entry partitions and the columnar archive of old weeks (see partitions.py, entry_archive.py)
+    ENTRY_PARTITION_MONTHS_AHEAD = 3  # monthly partitions created ahead of time; Postgres only
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR')  # defaults to <instance path>/archive
+    ARCHIVE_AFTER_MONTHS = int(os.environ.get('ARCHIVE_AFTER_MONTHS', 24))  # approved weeks older than this are archived
+
+    # Project catalog autocomplete (see project_catalog.py)
+    PROJECT_INDEX_REFRESH_SECONDS = 60  # how soon projects added by other workers are suggested here
+
+    # Full-text entry search (see entry_search.py)
+    SEARCH_PER_PAGE = 25
+    SEARCH_MAX_RESULTS = 1000  # ranked hits reachable by paging; narrower filters find the rest
+
+    # Bulk user import (see user_import.py); runs as a background job in EXPORT_DIR
+    IMPORT_BATCH_SIZE = 500  # users hashed and inserted per batch; each batch is committed
+    IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', 0))  # hashing processes; 0 = one per CPU
+    IMPORT_MAX_BYTES = 5 * 1024 * 1024
+
+    # Per-request timing and SQL instrumentation (see instrumentation.py)
+    INSTRUMENTATION_ENABLED = os.environ.get('INSTRUMENTATION_ENABLED', '').lower() in ('1', 'true', 'yes')
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 500))  # requests at least this slow are logged
+    INSTRUMENTATION_MAX_STATEMENTS = 500  # distinct statements tracked per worker
+
+    # Prometheus metrics at /metrics (see metrics.py); needs prometheus_client
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # if set, scrapes must send "Authorization: Bearer <token>"
+
+    # Connection pool, per worker process (see db_pool.py); ignored for SQLite
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))  # connections kept open
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))  # extra connections opened under load
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # seconds; below the server/proxy idle timeout
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1').lower() in ('1', 'true', 'yes')
+    DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 10))  # seconds; Postgres only
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 0))  # 0 = server default; Postgres only
+    DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 0))  # connections available to the app; 0 = don't check
@@ -1,6 +1,7 @@
 from app import create_app
 from extensions import db
 from models import User
+import migrations
 
 app = create_app()
 
@@ -9,6 +10,7 @@ def create_users():
         # Drop all old tables first (WARNING: deletes data)
         db.drop_all()
         db.create_all()
+        migrations.stamp(db.engine)
 
         if User.query.first():
             print("Users already exist, skipping creation.")
@@ -0,0 +1,83 @@
+"""
+Connection pool settings and stats.
+
+The pool is sized per process: each gunicorn worker holds up to
+DB_POOL_SIZE idle connections and opens up to DB_MAX_OVERFLOW more under
+load, so the server must allow workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+connections plus whatever else connects to it (migrations, psql, backups).
+DB_MAX_CONNECTIONS, when set, is checked against that at gunicorn startup.
+
+Connections are pre-pinged on checkout and recycled after DB_POOL_RECYCLE
+seconds, so idle periods and server-side timeouts don't surface as errors
+on the next request. SQLite uses SQLAlchemy's defaults.
+"""
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+from extensions import db
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database."""
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+    if url.get_backend_name() == 'postgresql':
+        connect_args = {'connect_timeout': config['DB_CONNECT_TIMEOUT']}
+        if config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['options'] = f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT_MS']}"
+        options['connect_args'] = connect_args
+    return options
+
+
+def connections_needed(workers, config):
+    """Most connections `workers` processes can hold at once."""
+    return workers * (config['DB_POOL_SIZE'] + config['DB_MAX_OVERFLOW'])
+
+
+def check_connection_budget(workers, config, log):
+    """Warn when the pools of all workers could exceed DB_MAX_CONNECTIONS."""
+    limit = config['DB_MAX_CONNECTIONS']
+    if not limit or make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() == 'sqlite':
+        return
+    needed = connections_needed(workers, config)
+    if needed > limit:
+        log(f"{workers} workers x (DB_POOL_SIZE {config['DB_POOL_SIZE']} + DB_MAX_OVERFLOW "
+            f"{config['DB_MAX_OVERFLOW']}) = {needed} connections, more than DB_MAX_CONNECTIONS {limit}. "
+            f"Lower the pool settings or WEB_CONCURRENCY.")
+
+
+def pool_status(engine):
+    """Current pool usage of this worker, for the admin performance page and metrics."""
+    pool = engine.pool
+    status = {'pool': type(pool).__name__, 'status': pool.status()}
+    if isinstance(pool, QueuePool):
+        status.update(
+            size=pool.size(),
+            capacity=pool.size() + pool._max_overflow,
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=max(0, pool.overflow()),
+            timeout=pool.timeout(),
+        )
+    return status
+
+
+def dispose_after_fork(app):
+    """
+    Drop connections inherited from the parent process.
+
+    With a preloaded app, anything the master connected (migrations, cache
+    warmup) would otherwise be shared by every forked worker. close=False
+    leaves the sockets to the parent and gives the child an empty pool.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
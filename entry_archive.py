@@ -0,0 +1,327 @@
+"""
+Columnar archive of the entries of old, approved weeks.
+
+archive_entries() moves the entries of approved timesheets whose week
+started before a cutoff out of timesheet_entries into one compressed NumPy
+file per month of week_start (ARCHIVE_DIR/timesheet_entries-YYYY-MM.npz).
+Each column is stored as its own array, and text columns are dictionary
+encoded (codes plus a UTF-8 dictionary), so a month compresses to a small
+fraction of its size in the table. The timesheet rows stay in the database
+with their rollup totals and project report rows; only `archived_at` is
+set, and archived weeks can no longer be edited. Entries are stored with
+their project's name rather than its catalog id, so a file reads on its own.
+
+Archived entries are still readable: week_entries() serves the weekly
+pages from the archive, and export_rows() yields them in the admin export
+format, so an export can include archived weeks on demand.
+"""
+import os
+from collections import namedtuple
+from datetime import date, datetime, time as dtime, timedelta
+from flask import current_app
+from extensions import db
+from models import User, Project, Timesheet, TimesheetEntry
+import partitions
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ArchivedEntry = namedtuple(
+    'ArchivedEntry',
+    'id timesheet_id user_id username week_start submitted_at approved_at '
+    'date clock_in clock_out project description hours'
+)
+
+_TEXT_COLUMNS = ('username', 'project', 'description')
+_TIME_COLUMNS = ('clock_in', 'clock_out')
+_DATETIME_COLUMNS = ('submitted_at', 'approved_at')
+_DATE_COLUMNS = ('week_start', 'date')
+_INT_COLUMNS = ('id', 'timesheet_id', 'user_id')
+
+# Timesheet ids per IN (...) list when marking and deleting
+ID_CHUNK = 900
+
+
+def _require_numpy():
+    if np is None:
+        raise RuntimeError("The entry archive needs NumPy (see requirements.txt).")
+
+
+def archive_dir(app=None):
+    app = app or current_app
+    path = app.config.get('ARCHIVE_DIR') or os.path.join(app.instance_path, 'archive')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def archive_path(month, app=None):
+    return os.path.join(archive_dir(app), f'timesheet_entries-{month:%Y-%m}.npz')
+
+
+def archived_months(app=None):
+    """Months that have an archive file, newest first."""
+    months = []
+    for name in os.listdir(archive_dir(app)):
+        if name.startswith('timesheet_entries-') and name.endswith('.npz'):
+            months.append(datetime.strptime(name[len('timesheet_entries-'):-len('.npz')], '%Y-%m').date())
+    return sorted(months, reverse=True)
+
+
+def archive_cutoff(today=None, months=None):
+    """First day of the month `months` (default ARCHIVE_AFTER_MONTHS) before the current one."""
+    months = current_app.config.get('ARCHIVE_AFTER_MONTHS', 24) if months is None else months
+    return partitions.add_months(partitions.month_start(today or date.today()), -months)
+
+
+# --- encoding ----------------------------------------------------------------
+
+def _encode_text(prefix, values, arrays):
+    dictionary = sorted({v for v in values if v is not None})
+    index = {v: i for i, v in enumerate(dictionary)}
+    encoded = [v.encode('utf-8') for v in dictionary]
+    arrays[f'{prefix}_codes'] = np.array([index.get(v, -1) for v in values], dtype=np.int32)
+    arrays[f'{prefix}_data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    arrays[f'{prefix}_offsets'] = np.cumsum([0] + [len(b) for b in encoded], dtype=np.int64)
+
+
+def _decode_text(prefix, arrays, rows):
+    data, offsets = arrays[f'{prefix}_data'].tobytes(), arrays[f'{prefix}_offsets']
+    dictionary = [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+    return [dictionary[c] if c >= 0 else None for c in arrays[f'{prefix}_codes'][rows].tolist()]
+
+
+def _time_to_us(value):
+    if value is None:
+        return -1
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * 1000000 + value.microsecond
+
+
+def _us_to_time(value):
+    if value < 0:
+        return None
+    seconds, micro = divmod(value, 1000000)
+    return dtime(seconds // 3600, seconds // 60 % 60, seconds % 60, micro)
+
+
+def _encode(entries):
+    """Column arrays for a list of ArchivedEntry."""
+    _require_numpy()
+    columns = list(zip(*entries)) if entries else [()] * len(ArchivedEntry._fields)
+    values = dict(zip(ArchivedEntry._fields, columns))
+    arrays = {}
+    for name in _INT_COLUMNS:
+        arrays[name] = np.array(values[name], dtype=np.int64)
+    for name in _DATE_COLUMNS:
+        arrays[name] = np.array(values[name], dtype='datetime64[D]')
+    for name in _DATETIME_COLUMNS:
+        arrays[name] = np.array([v if v is not None else 'NaT' for v in values[name]], dtype='datetime64[us]')
+    for name in _TIME_COLUMNS:
+        arrays[name] = np.array([_time_to_us(v) for v in values[name]], dtype=np.int64)
+    arrays['hours'] = np.array(values['hours'], dtype=np.float64)
+    for name in _TEXT_COLUMNS:
+        _encode_text(name, values[name], arrays)
+    return arrays
+
+
+def _decode(arrays, rows):
+    """ArchivedEntry tuples for the row indexes `rows` of the column arrays."""
+    columns = {}
+    for name in _INT_COLUMNS:
+        columns[name] = arrays[name][rows].tolist()
+    for name in _DATE_COLUMNS:
+        columns[name] = arrays[name][rows].tolist()
+    for name in _DATETIME_COLUMNS:
+        columns[name] = arrays[name][rows].tolist()  # NaT becomes None
+    for name in _TIME_COLUMNS:
+        columns[name] = [_us_to_time(v) for v in arrays[name][rows].tolist()]
+    columns['hours'] = arrays['hours'][rows].tolist()
+    for name in _TEXT_COLUMNS:
+        columns[name] = _decode_text(name, arrays, rows)
+    return [ArchivedEntry(*row) for row in zip(*(columns[f] for f in ArchivedEntry._fields))]
+
+
+def _load(path):
+    _require_numpy()
+    with np.load(path, allow_pickle=False) as archive:
+        return {name: archive[name] for name in archive.files}
+
+
+def _write(path, arrays):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_month(month, app=None):
+    """Every archived entry of timesheets whose week starts in `month`, in file order."""
+    path = archive_path(month, app)
+    if not os.path.exists(path):
+        return []
+    arrays = _load(path)
+    return _decode(arrays, np.arange(len(arrays['id'])))
+
+
+# --- archiving ---------------------------------------------------------------
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _archivable(month, cutoff):
+    """Approved, not yet archived timesheets whose week starts in `month` and before `cutoff`."""
+    return db.select(Timesheet.id).where(
+        Timesheet.status == 'approved',
+        Timesheet.archived_at.is_(None),
+        Timesheet.week_start >= month,
+        Timesheet.week_start < min(partitions.add_months(month, 1), cutoff),
+    ).order_by(Timesheet.id)
+
+
+def _entries_of(connection, timesheet_ids, month):
+    # Entries of weeks starting in `month` end at most six days into the next one
+    last_day = partitions.add_months(month, 1) + timedelta(days=6)
+    rows = []
+    for chunk in _chunks(timesheet_ids, ID_CHUNK):
+        rows.extend(connection.execute(
+            db.select(
+                TimesheetEntry.id, TimesheetEntry.timesheet_id, Timesheet.user_id, User.username,
+                Timesheet.week_start, Timesheet.submitted_at, Timesheet.approved_at,
+                TimesheetEntry.date, TimesheetEntry.clock_in, TimesheetEntry.clock_out,
+                Project.name, TimesheetEntry.description, TimesheetEntry.hours,
+            )
+            .join(Timesheet, Timesheet.id == TimesheetEntry.timesheet_id)
+            .join(Project, Project.id == TimesheetEntry.project_id)
+            .outerjoin(User, User.id == Timesheet.user_id)
+            .where(TimesheetEntry.timesheet_id.in_(chunk),
+                   TimesheetEntry.date >= month, TimesheetEntry.date <= last_day)
+        ))
+    return [ArchivedEntry(*row) for row in rows]
+
+
+def archive_month(month, cutoff, dry_run=False):
+    """
+    Archive the approved weeks of `month` that start before `cutoff`.
+    Returns (timesheets, entries) archived (or that would be, with dry_run).
+    """
+    with db.engine.begin() as connection:
+        # Locks the weeks until they are marked, so none can change while being copied
+        timesheet_ids = connection.execute(_archivable(month, cutoff).with_for_update()).scalars().all()
+        if not timesheet_ids:
+            return 0, 0
+        entries = _entries_of(connection, timesheet_ids, month)
+        if dry_run:
+            return len(timesheet_ids), len(entries)
+
+        # Merge with what earlier runs archived for the month; ids already there are replaced
+        path = archive_path(month)
+        new_ids = {e.id for e in entries}
+        previous = [e for e in read_month(month) if e.id not in new_ids]
+        _write(path, _encode(previous + entries))
+
+        now = datetime.utcnow()
+        last_day = partitions.add_months(month, 1) + timedelta(days=6)
+        for chunk in _chunks(timesheet_ids, ID_CHUNK):
+            connection.execute(
+                db.update(Timesheet.__table__).where(Timesheet.__table__.c.id.in_(chunk)).values(archived_at=now)
+            )
+            connection.execute(db.delete(TimesheetEntry.__table__).where(
+                TimesheetEntry.__table__.c.timesheet_id.in_(chunk),
+                TimesheetEntry.__table__.c.date >= month,
+                TimesheetEntry.__table__.c.date <= last_day,
+            ))
+    return len(timesheet_ids), len(entries)
+
+
+def archive_entries(cutoff=None, dry_run=False, log=print):
+    """
+    Archive every approved week that starts before `cutoff` (default:
+    archive_cutoff()), one month per transaction, then drop the entry
+    partitions left empty. Returns {month: (timesheets, entries)}.
+    """
+    cutoff = cutoff or archive_cutoff()
+    first = db.session.execute(
+        db.select(db.func.min(Timesheet.week_start)).where(
+            Timesheet.status == 'approved', Timesheet.archived_at.is_(None), Timesheet.week_start < cutoff)
+    ).scalar()
+    db.session.remove()
+
+    done = {}
+    month = partitions.month_start(first) if first else cutoff
+    while month < cutoff:
+        timesheets, entries = archive_month(month, cutoff, dry_run)
+        if timesheets:
+            done[month] = (timesheets, entries)
+            log(f"{month:%Y-%m}: {timesheets} timesheets, {entries} entries"
+                + (" (dry run)" if dry_run else ""))
+        month = partitions.add_months(month, 1)
+
+    if not dry_run:
+        with db.engine.begin() as connection:
+            dropped = partitions.drop_empty_partitions(connection, cutoff)
+        for name in dropped:
+            log(f"dropped empty partition {name}")
+    return done
+
+
+# --- reading -----------------------------------------------------------------
+
+def week_entries(timesheet):
+    """
+    The entries of a timesheet, ordered by date: live entries, or for an
+    archived week the ArchivedEntry rows from its month's file.
+    """
+    if timesheet.archived_at is None:
+        return (
+            TimesheetEntry.query
+            .filter(TimesheetEntry.timesheet_id == timesheet.id,
+                    TimesheetEntry.date >= timesheet.week_start,
+                    TimesheetEntry.date < timesheet.week_start + timedelta(days=7))
+            .order_by(TimesheetEntry.date, TimesheetEntry.id)
+            .all()
+        )
+    path = archive_path(partitions.month_start(timesheet.week_start))
+    if not os.path.exists(path):
+        return []
+    arrays = _load(path)
+    rows = np.flatnonzero(arrays['timesheet_id'] == timesheet.id)
+    return sorted(_decode(arrays, rows), key=lambda e: (e.date, e.id))
+
+
+def export_rows(status=None, start_date=None, end_date=None):
+    """
+    Archived entries in the admin export format (ADMIN_EXPORT_HEADER), newest
+    week first, for weeks starting within [start_date, end_date]. Only
+    approved weeks are archived, so any other status matches nothing.
+    """
+    if status and status != 'approved':
+        return
+    for month in archived_months():
+        if (end_date and month > end_date) or (start_date and partitions.add_months(month, 1) <= start_date):
+            continue
+        arrays = _load(archive_path(month))
+        # Leave out weeks deleted since archiving, and copies from a run that did not commit
+        archived_ids = db.session.execute(
+            db.select(Timesheet.id).where(
+                Timesheet.archived_at.is_not(None),
+                Timesheet.week_start >= month,
+                Timesheet.week_start < partitions.add_months(month, 1),
+            )
+        ).scalars().all()
+        keep = np.isin(arrays['timesheet_id'], np.array(archived_ids, dtype=np.int64))
+        if start_date:
+            keep &= arrays['week_start'] >= np.datetime64(start_date, 'D')
+        if end_date:
+            keep &= arrays['week_start'] <= np.datetime64(end_date, 'D')
+        rows = np.flatnonzero(keep)
+        # Newest week first, then timesheet, date and id, like the live export
+        order = np.lexsort((arrays['id'][rows], arrays['date'][rows], arrays['timesheet_id'][rows],
+                            -arrays['week_start'][rows].astype(np.int64)))
+        for e in _decode(arrays, rows[order]):
+            yield (e.timesheet_id, e.username, e.week_start, 'approved', e.submitted_at, e.approved_at,
+                   e.date, e.clock_in, e.clock_out, e.project, e.description, e.hours)
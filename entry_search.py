@@ -0,0 +1,177 @@
+"""
+Full-text search over the project and description of timesheet entries.
+
+A query is split into words, and an entry matches when every word is a
+prefix of a word in its project name or description, so "acme inv" finds
+"ACME" entries described as "invoicing". Each backend serves this from an
+index:
+
+- Postgres: a GIN index on to_tsvector('simple', description), ranked with
+  ts_rank_cd, and a pg_trgm GIN index that also matches the query as a
+  substring, which finds ticket numbers inside longer words. Project names
+  live in the catalog, so each word is also looked up in the in-memory
+  project index (project_catalog.py) and the matching projects' entries
+  are found through ix_timesheet_entries_project_date.
+- SQLite: a contentless FTS5 table over the project name and description,
+  kept current by triggers and ranked with bm25.
+- Anything else falls back to unindexed LIKE matching.
+
+The 'simple' configuration does no stemming, which suits the project names,
+client names and ticket ids people search for. Archived weeks have no
+entries in the database, so they are not searched.
+"""
+import re
+from flask import current_app
+from sqlalchemy import and_, column, event, func, literal, literal_column, or_, table, text
+from extensions import db
+from models import User, Project, Timesheet, TimesheetEntry
+from pagination import OffsetPage
+from project_catalog import project_index
+
+TABLE = TimesheetEntry.__tablename__
+SEARCH_INDEX = 'ix_timesheet_entries_search'
+TRIGRAM_INDEX = 'ix_timesheet_entries_search_trgm'
+FTS_TABLE = f'{TABLE}_fts'
+
+# The Postgres full-text index is on this expression; queries must spell it the same way
+VECTOR = "to_tsvector('simple', coalesce(description, ''))"
+# The project name of an entry row, for the SQLite triggers
+_PROJECT_NAME = "(SELECT name FROM projects WHERE id = {row}.project_id)"
+
+MAX_TERMS = 8
+# Trigram matching needs at least three characters to use its index
+TRIGRAM_MIN_LENGTH = 3
+
+
+def create_search_index(connection):
+    """
+    Create the search index on timesheet_entries if it is missing. On
+    SQLite the FTS5 table is refilled from the entries, so this also repairs
+    one that has fallen out of step.
+    """
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} ON {TABLE} USING gin ({VECTOR})"))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON {TABLE} USING gin (description gin_trgm_ops)"
+        ))
+    elif connection.dialect.name == 'sqlite':
+        # Contentless: the FTS table stores only the index, since the project name is not an entry column.
+        # Deleting from it takes the indexed values again; project names never change, so they are known.
+        connection.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"project, description, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        new_row = (f"INSERT INTO {FTS_TABLE} (rowid, project, description) "
+                   f"VALUES (new.id, {_PROJECT_NAME.format(row='new')}, new.description);")
+        old_row = (f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, project, description) "
+                   f"VALUES ('delete', old.id, {_PROJECT_NAME.format(row='old')}, old.description);")
+        connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN {new_row} END"))
+        connection.execute(text(f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN {old_row} END"))
+        connection.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF project_id, description ON {TABLE} "
+            f"BEGIN {old_row} {new_row} END"
+        ))
+        connection.execute(text(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('delete-all')"))
+        connection.execute(text(
+            f"INSERT INTO {FTS_TABLE} (rowid, project, description) "
+            f"SELECT e.id, p.name, e.description FROM {TABLE} e JOIN projects p ON p.id = e.project_id"
+        ))
+
+
+def drop_search_index(connection):
+    """Drop the search index, e.g. before a bulk load; create_search_index() rebuilds it."""
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f"DROP INDEX IF EXISTS {SEARCH_INDEX}"))
+        connection.execute(text(f"DROP INDEX IF EXISTS {TRIGRAM_INDEX}"))
+    elif connection.dialect.name == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            connection.execute(text(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}"))
+        connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def search_terms(q):
+    """The lower-cased words of a query, at most MAX_TERMS of them."""
+    return re.findall(r'\w+', (q or '').lower())[:MAX_TERMS]
+
+
+def _like_pattern(value):
+    return '%' + value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def search(q, user_ids=None, status=None, start_date=None, end_date=None, page=1, per_page=None):
+    """
+    Entries matching `q`, best match first, as an OffsetPage of rows with
+    the entry, its timesheet's week and status, the username and a `score`
+    (higher is better). `user_ids` limits the search to those users; the
+    dates bound the entry date. Results stop at SEARCH_MAX_RESULTS, since
+    ranking reads every match and deep pages are rarely useful.
+    """
+    per_page = per_page or current_app.config['SEARCH_PER_PAGE']
+    max_results = current_app.config['SEARCH_MAX_RESULTS']
+    terms = search_terms(q)
+    offset = (page - 1) * per_page
+    if not terms or offset >= max_results:
+        return OffsetPage([], page, False)
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        def tsquery(expression):
+            return func.to_tsquery(literal_column("'simple'"), expression)
+
+        # Each word matches the description through the GIN index or the project through the catalog
+        conditions = []
+        for t in terms:
+            in_description = literal_column(VECTOR).op('@@')(tsquery(f'{t}:*'))
+            project_ids = project_index.word_matches(t)
+            conditions.append(or_(in_description, TimesheetEntry.project_id.in_(project_ids))
+                              if project_ids else in_description)
+        match = and_(*conditions)
+        phrase = ' '.join(q.split())
+        if len(phrase) >= TRIGRAM_MIN_LENGTH:
+            alternatives = [TimesheetEntry.description.ilike(_like_pattern(phrase), escape='\\')]
+            project_ids = project_index.containing(phrase)
+            if project_ids:
+                alternatives.append(TimesheetEntry.project_id.in_(project_ids))
+            match = or_(match, *alternatives)
+        score = func.ts_rank_cd(literal_column(VECTOR), tsquery(' | '.join(f'{t}:*' for t in terms)))
+        order = [score.desc()]
+    elif dialect == 'sqlite':
+        fts = table(FTS_TABLE, column('rowid'), column('rank'))
+        score = -fts.c.rank  # bm25, where lower is better
+        match = literal_column(FTS_TABLE).op('MATCH')(' '.join(f'"{t}"*' for t in terms))
+        order = [fts.c.rank]
+    else:
+        score = literal(0.0)
+        match = and_(*[or_(Project.name.ilike(_like_pattern(t), escape='\\'),
+                           TimesheetEntry.description.ilike(_like_pattern(t), escape='\\')) for t in terms])
+        order = []
+
+    query = db.session.query(
+        TimesheetEntry.id, TimesheetEntry.date, Project.name.label('project'), TimesheetEntry.description,
+        TimesheetEntry.hours, TimesheetEntry.timesheet_id, Timesheet.week_start, Timesheet.status,
+        Timesheet.user_id, User.username, score.label('score'),
+    )
+    if dialect == 'sqlite':
+        query = query.select_from(fts).join(TimesheetEntry, TimesheetEntry.id == fts.c.rowid)
+    query = query.join(Project, Project.id == TimesheetEntry.project_id) \
+        .join(Timesheet, Timesheet.id == TimesheetEntry.timesheet_id) \
+        .join(User, User.id == Timesheet.user_id).filter(match)
+
+    if user_ids is not None:
+        query = query.filter(Timesheet.user_id.in_(list(user_ids)))
+    if status:
+        query = query.filter(Timesheet.status == status)
+    if start_date:
+        query = query.filter(TimesheetEntry.date >= start_date)
+    if end_date:
+        query = query.filter(TimesheetEntry.date <= end_date)
+
+    rows = query.order_by(*order, TimesheetEntry.date.desc(), TimesheetEntry.id.desc()) \
+        .offset(offset).limit(per_page + 1).all()
+    return OffsetPage(rows[:per_page], page, len(rows) > per_page and offset + per_page < max_results)
+
+
+@event.listens_for(TimesheetEntry.__table__, 'after_create')
+def _index_new_table(target, connection, **kw):
+    create_search_index(connection)
@@ -0,0 +1,282 @@
+"""
+Background jobs that produce a CSV file: exports, and the bulk user import
+(whose CSV is the per-row import report).
+
+A job is described by an export kind and its filters. enqueue() writes the
+job's metadata to EXPORT_DIR and hands it to a per-worker thread pool, which
+streams the rows into `<job id>.csv` while updating progress in
+`<job id>.json`. Because state lives on disk, any gunicorn worker can report
+status or serve the finished file.
+
+Jobs with the same kind and filters share a fingerprint; a queued, running
+or recently finished job (EXPORT_REUSE_SECONDS) is returned instead of
+building the same file again. Jobs that write (the user import) always run.
+
+A queued job records the worker process it waits in; it is failed once that
+process is gone. A running job rewrites its metadata at least every
+HEARTBEAT_SECONDS, and is failed when it has not for STALE_AFTER_SECONDS.
+"""
+import csv
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from itertools import chain
+from flask import current_app
+from extensions import db
+from models import Timesheet, TimesheetEntry
+from timesheet_queries import admin_export_query, admin_export_rows, entry_week_bounds, ADMIN_EXPORT_HEADER
+import entry_archive
+import user_import
+
+JOB_ID_RE = re.compile(r'^[0-9a-f]{16}-\d+$')
+
+# A running job whose progress has not been written for this long is treated as dead
+STALE_AFTER_SECONDS = 600
+# Running jobs rewrite their metadata this often even while no rows arrive
+HEARTBEAT_SECONDS = 60
+PROGRESS_EVERY_ROWS = 5000
+PROGRESS_EVERY_SECONDS = 2  # for jobs whose rows come slowly, like the user import
+
+_executor = None
+# Tells this process from a later one given the same pid (a restarted worker in a container)
+_WORKER_ID = uuid.uuid4().hex
+
+
+def _admin_timesheets(filters):
+    start_date = date.fromisoformat(filters['start_date']) if filters.get('start_date') else None
+    end_date = date.fromisoformat(filters['end_date']) if filters.get('end_date') else None
+    query = admin_export_query(filters.get('status'), start_date, end_date)
+    total = query.join(TimesheetEntry, TimesheetEntry.timesheet_id == Timesheet.id) \
+        .filter(*entry_week_bounds(start_date, end_date)) \
+        .with_entities(db.func.count(TimesheetEntry.id)).scalar()
+    rows = admin_export_rows(query, start_date, end_date)
+    if filters.get('include_archived'):
+        # Archived weeks are not counted in the total, so progress shows 99% while they are read
+        rows = chain(rows, entry_archive.export_rows(filters.get('status'), start_date, end_date))
+    return ADMIN_EXPORT_HEADER, rows, total
+
+
+def _user_import(filters):
+    with open(os.path.join(export_dir(), filters['upload']), 'rb') as f:
+        rows = user_import.read_rows(f.read(), filters['format'])
+    return user_import.REPORT_HEADER, user_import.import_rows(rows, dry_run=filters['dry_run']), len(rows)
+
+
+# kind -> builder(filters) returning (header, rows iterator, expected row count)
+EXPORT_KINDS = {
+    'admin_timesheets': _admin_timesheets,
+    'user_import': _user_import,
+}
+# Kinds that write to the database; every request runs them, so the same file can be imported again
+WRITE_KINDS = {'user_import'}
+
+
+def export_dir(app=None):
+    app = app or current_app
+    path = app.config.get('EXPORT_DIR') or os.path.join(app.instance_path, 'exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def fingerprint(kind, filters):
+    raw = json.dumps({'kind': kind, 'filters': filters}, sort_keys=True)
+    return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+
+def _meta_path(directory, job_id):
+    return os.path.join(directory, f'{job_id}.json')
+
+
+def artifact_path(job_id, app=None):
+    return os.path.join(export_dir(app), f'{job_id}.csv')
+
+
+def _write_meta(directory, meta):
+    meta['updated_at'] = time.time()
+    tmp = _meta_path(directory, meta['id']) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, _meta_path(directory, meta['id']))
+
+
+def _read_meta(directory, job_id):
+    try:
+        with open(_meta_path(directory, job_id)) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta['status'] == 'queued':
+        dead = not _worker_alive(meta)
+    else:
+        dead = meta['status'] == 'running' and time.time() - meta['updated_at'] > STALE_AFTER_SECONDS
+    if dead:
+        meta['status'] = 'failed'
+        meta['error'] = 'Export worker stopped before finishing.'
+    return meta
+
+
+def _worker_alive(meta):
+    """Whether the process a queued job waits in still runs; it may wait behind long jobs for any time."""
+    pid = meta.get('worker_pid')
+    if pid is None:
+        # Queued before workers were recorded
+        return time.time() - meta['updated_at'] <= STALE_AFTER_SECONDS
+    if pid == os.getpid():
+        return meta.get('worker_id') == _WORKER_ID
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, owned by another user
+    return True
+
+
+def get_job(job_id):
+    """Return a job's metadata, or None for an unknown or malformed id."""
+    if not JOB_ID_RE.match(job_id or ''):
+        return None
+    return _read_meta(export_dir(), job_id)
+
+
+def _purge_expired(directory, retention):
+    cutoff = time.time() - retention
+    for path in glob.glob(os.path.join(directory, '*')):
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def save_upload(data, fmt):
+    """Store an uploaded file next to the job files; returns its name, derived from the content."""
+    name = f"upload-{hashlib.sha256(data).hexdigest()[:16]}.{fmt}"
+    with open(os.path.join(export_dir(), name), 'wb') as f:
+        f.write(data)
+    return name
+
+
+def _reusable_job(directory, fp, reuse_seconds):
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(directory, f'{fp}-*.json')), reverse=True):
+        meta = _read_meta(directory, os.path.basename(path)[:-len('.json')])
+        if not meta:
+            continue
+        if meta['status'] in ('queued', 'running'):
+            return meta
+        if meta['status'] == 'done' and now - meta['finished_at'] <= reuse_seconds:
+            return meta
+    return None
+
+
+def _get_executor(app):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=app.config.get('EXPORT_WORKERS', 2),
+                                       thread_name_prefix='export')
+    return _executor
+
+
+def enqueue(kind, filters, requested_by=None):
+    """
+    Start an export of `kind` with JSON-serialisable `filters`, or reuse a
+    matching one unless the kind writes.
+    Returns the job metadata dict.
+    """
+    if kind not in EXPORT_KINDS:
+        raise ValueError(f"Unknown export kind: {kind}")
+    app = current_app._get_current_object()
+    directory = export_dir(app)
+    _purge_expired(directory, app.config.get('EXPORT_RETENTION_SECONDS', 86400))
+
+    fp = fingerprint(kind, filters)
+    if kind not in WRITE_KINDS:
+        existing = _reusable_job(directory, fp, app.config.get('EXPORT_REUSE_SECONDS', 600))
+        if existing:
+            return existing
+
+    meta = {
+        'id': f'{fp}-{time.time_ns()}',
+        'kind': kind,
+        'filters': filters,
+        'status': 'queued',
+        'worker_pid': os.getpid(),
+        'worker_id': _WORKER_ID,
+        'requested_by': requested_by,
+        'rows_written': 0,
+        'rows_total': None,
+        'created_at': time.time(),
+        'finished_at': None,
+        'error': None,
+    }
+    _write_meta(directory, meta)
+    _get_executor(app).submit(_run, app, directory, meta)
+    return meta
+
+
+def _heartbeat(directory, meta, lock, stop):
+    # Keeps a running job from looking dead while a query or a slow row blocks its thread
+    while not stop.wait(HEARTBEAT_SECONDS):
+        with lock:
+            _write_meta(directory, meta)
+
+
+def _run(app, directory, meta):
+    part = os.path.join(directory, f"{meta['id']}.csv.part")
+    lock, stop = threading.Lock(), threading.Event()
+
+    def save():
+        with lock:
+            _write_meta(directory, meta)
+
+    with app.app_context():
+        try:
+            with lock:
+                meta['status'] = 'running'
+                _write_meta(directory, meta)
+            threading.Thread(target=_heartbeat, args=(directory, meta, lock, stop),
+                             name=f"export-heartbeat-{meta['id']}", daemon=True).start()
+            header, rows, total = EXPORT_KINDS[meta['kind']](meta['filters'])
+            meta['rows_total'] = total
+            save()
+
+            with open(part, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(header)
+                last_progress = time.monotonic()
+                for row in rows:
+                    writer.writerow(row)
+                    meta['rows_written'] += 1
+                    if (meta['rows_written'] % PROGRESS_EVERY_ROWS == 0
+                            or time.monotonic() - last_progress >= PROGRESS_EVERY_SECONDS):
+                        save()
+                        last_progress = time.monotonic()
+            os.replace(part, os.path.join(directory, f"{meta['id']}.csv"))
+            meta.update(status='done', finished_at=time.time())
+        except Exception as e:
+            logging.exception(f"Export job {meta['id']} failed")
+            meta.update(status='failed', error=str(e), finished_at=time.time())
+            if os.path.exists(part):
+                os.remove(part)
+        finally:
+            stop.set()
+            db.session.remove()
+            save()
+
+
+def progress(meta):
+    """Percentage complete for display, or None when the total is not known yet."""
+    if meta['status'] == 'done':
+        return 100
+    if not meta.get('rows_total'):
+        return None
+    return min(99, int(100 * meta['rows_written'] / meta['rows_total']))
@@ -5,8 +5,9 @@ db = SQLAlchemy()
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'  # assuming auth blueprint
 
-from models import User
+from user_cache import load_user_identity
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # Served from a per-worker TTL/LRU cache instead of a query per request
+    return load_user_identity(int(user_id))
@@ -0,0 +1,320 @@
+"""
+Bulk load and dump of users, projects, timesheets and entries as compressed CSV.
+
+A fixture set is a directory with one file per table (users.csv.gz,
+projects.csv.gz, timesheets.csv.gz, timesheet_entries.csv.gz; plain .csv
+also loads), plus
+project_week_hours.csv.gz with the report rows of archived weeks. Each
+file has a header row naming the columns it carries, and an empty field is
+NULL in a nullable column. Columns a file leaves out get their default
+(updated_at: the load time). dump() writes this format from any database, so
+a production dump can be restored into staging or a local SQLite.
+
+load() replaces the contents of those tables in one transaction:
+
+- Secondary (non-unique) indexes and the full-text search index are
+  dropped first and rebuilt once the rows are in, which is far cheaper
+  than maintaining them row by row.
+- On Postgres the files are streamed to `COPY ... FROM STDIN` without
+  being parsed in Python. Elsewhere rows are converted and inserted with
+  executemany in batches of LOAD_BATCH_SIZE.
+- The timesheet rollup columns (when the file lacks them) and the project
+  hours rollups are then recomputed with set-based statements.
+"""
+import csv
+import gzip
+import os
+import time
+from datetime import date, datetime, time as dtime
+from sqlalchemy import inspect, text
+from extensions import db
+from models import User, Project, Timesheet, TimesheetEntry, ProjectWeekHours, ProjectWeekTotal, EntryTombstone
+from project_catalog import record_catalog_rewrite
+from reporting import rebuild_project_hours
+from timesheet_queries import rollup_update
+import entry_search
+import migrations
+import partitions
+
+# In load order: each table only references the ones before it
+FIXTURE_TABLES = (User.__table__, Project.__table__, Timesheet.__table__, TimesheetEntry.__table__)
+# Derived from the fixture tables; emptied before a load and rebuilt after it
+DERIVED_TABLES = (ProjectWeekHours.__table__, ProjectWeekTotal.__table__)
+# Archived weeks have no entries to rebuild their project hours from, so a fixture set
+# carries those rows in an optional project_week_hours file
+ARCHIVED_HOURS = ProjectWeekHours.__table__
+# Deletions recorded before a load mean nothing after it; incremental exports restart from a full one
+EMPTIED_TABLES = (EntryTombstone.__table__,)
+
+LOAD_BATCH_SIZE = 10000
+
+_PARSERS = {
+    int: int,
+    float: float,
+    date: date.fromisoformat,
+    dtime: dtime.fromisoformat,
+    datetime: datetime.fromisoformat,
+}
+
+
+def fixture_path(directory, table, for_reading=False):
+    """The file for `table` in `directory`; when reading, an uncompressed .csv is also accepted."""
+    path = os.path.join(directory, f'{table.name}.csv.gz')
+    if for_reading and not os.path.exists(path) and os.path.exists(path[:-len('.gz')]):
+        return path[:-len('.gz')]
+    return path
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', newline='', encoding='utf-8', compresslevel=6)
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def _read_header(path, table):
+    with _open(path, 'r') as f:
+        header = next(csv.reader(f), None)
+    if not header:
+        raise ValueError(f"{path} is empty; expected a header row")
+    unknown = [name for name in header if name not in table.c]
+    if unknown:
+        raise ValueError(f"{path} has columns that {table.name} does not: {', '.join(unknown)}")
+    return header
+
+
+def _converter(column):
+    """Parse a CSV field into the column's Python type; empty is NULL when the column allows it."""
+    try:
+        parse = _PARSERS.get(column.type.python_type, str)
+    except NotImplementedError:
+        parse = str
+    nullable = column.nullable
+
+    def convert(value):
+        if value == '':
+            return None if nullable else ('' if parse is str else None)
+        return parse(value)
+    return convert
+
+
+def _secondary_indexes(connection, tables):
+    """Non-unique single-table indexes on `tables`, as (name, table, columns)."""
+    inspector = inspect(connection)
+    found = []
+    for table in tables:
+        for index in inspector.get_indexes(table.name):
+            columns = index['column_names']
+            # Expression indexes have no plain column names; they are left in place
+            if index['unique'] or not columns or None in columns:
+                continue
+            found.append((index['name'], table.name, columns))
+    return found
+
+
+def _app_defaults(table, header):
+    """
+    Values for the columns missing from `header` that only the app fills in
+    (a Python-side default, like updated_at). executemany applies them; COPY
+    only applies server defaults.
+    """
+    values = {}
+    for column in table.c:
+        default = column.default
+        if column.name in header or column.server_default is not None or default is None:
+            continue
+        if default.is_callable:
+            values[column.name] = default.arg(None)
+        elif default.is_scalar:
+            values[column.name] = default.arg
+    return values
+
+
+def _copy_in(connection, table, path, header):
+    columns = ', '.join(header)
+    # FORCE_NOT_NULL keeps empty fields in NOT NULL text columns as '' rather than NULL
+    not_null = [name for name in header if not table.c[name].nullable]
+    options = "FORMAT csv, HEADER true" + (f", FORCE_NOT_NULL ({', '.join(not_null)})" if not_null else '')
+    # Columns the file lacks get the app's default as a constant for the copy (updated_at: the
+    # load time); the ALTERs are part of the load's transaction, which already locks the table
+    defaults = _app_defaults(table, header)
+    for name, value in defaults.items():
+        literal = "'" + str(value).replace("'", "''") + "'"
+        connection.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {name} SET DEFAULT {literal}"))
+    cursor = connection.connection.cursor()
+    try:
+        with _open(path, 'r') as f:
+            cursor.copy_expert(f"COPY {table.name} ({columns}) FROM STDIN WITH ({options})", f)
+        count = cursor.rowcount
+    finally:
+        cursor.close()
+    for name in defaults:
+        connection.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {name} DROP DEFAULT"))
+    return count
+
+
+def _insert_batches(connection, table, path, header):
+    converters = [_converter(table.c[name]) for name in header]
+    statement = table.insert()
+    count = 0
+    with _open(path, 'r') as f:
+        reader = csv.reader(f)
+        next(reader)
+        batch = []
+        for record in reader:
+            batch.append({name: convert(value) for name, convert, value in zip(header, converters, record)})
+            if len(batch) >= LOAD_BATCH_SIZE:
+                connection.execute(statement, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            connection.execute(statement, batch)
+            count += len(batch)
+    return count
+
+
+def _use_copy(connection):
+    # copy_expert is psycopg2's; other drivers take the executemany path
+    return connection.dialect.name == 'postgresql' and connection.dialect.driver == 'psycopg2'
+
+
+def load(directory, log=print):
+    """
+    Replace users, projects, timesheets and entries with the fixture set in
+    `directory`. An empty database gets the latest schema; an existing one
+    must be migrated to it.
+    Returns {table name: rows loaded}.
+    """
+    paths = {table.name: fixture_path(directory, table, for_reading=True) for table in FIXTURE_TABLES}
+    missing = [path for path in paths.values() if not os.path.exists(path)]
+    if missing:
+        raise ValueError(f"Missing fixture files: {', '.join(missing)}")
+    headers = {table.name: _read_header(paths[table.name], table) for table in FIXTURE_TABLES}
+    if any('id' not in headers[table.name] for table in FIXTURE_TABLES[:-1]):
+        raise ValueError("users, projects and timesheets files must include the id column; other files refer to it")
+
+    engine = db.engine
+    if not inspect(engine).has_table(User.__tablename__):
+        # An empty database: build the latest schema, as reset_db.py does
+        db.create_all()
+        migrations.stamp(engine)
+    elif migrations.current_version(engine) != migrations.head_version():
+        raise RuntimeError("The database schema is not up to date; run `python migrate.py upgrade` first.")
+
+    started = time.perf_counter()
+    counts = {}
+    with engine.begin() as connection:
+        postgres = connection.dialect.name == 'postgresql'
+        # Dropped first, so the SQLite triggers do not index rows one at a time
+        entry_search.drop_search_index(connection)
+        names = ', '.join(t.name for t in FIXTURE_TABLES + DERIVED_TABLES + EMPTIED_TABLES)
+        if postgres:
+            connection.execute(text(f"TRUNCATE {names} RESTART IDENTITY CASCADE"))
+        else:
+            for table in reversed(FIXTURE_TABLES + DERIVED_TABLES + EMPTIED_TABLES):
+                connection.execute(table.delete())
+
+        indexes = _secondary_indexes(connection, FIXTURE_TABLES + DERIVED_TABLES)
+        for name, _, _ in indexes:
+            connection.execute(text(f"DROP INDEX {name}"))
+
+        archived_hours = fixture_path(directory, ARCHIVED_HOURS, for_reading=True)
+        if os.path.exists(archived_hours):
+            paths[ARCHIVED_HOURS.name] = archived_hours
+            headers[ARCHIVED_HOURS.name] = _read_header(archived_hours, ARCHIVED_HOURS)
+
+        copy = _use_copy(connection)
+        for table in FIXTURE_TABLES + ((ARCHIVED_HOURS,) if ARCHIVED_HOURS.name in paths else ()):
+            step = time.perf_counter()
+            path, header = paths[table.name], headers[table.name]
+            if copy:
+                counts[table.name] = _copy_in(connection, table, path, header)
+            else:
+                counts[table.name] = _insert_batches(connection, table, path, header)
+            log(f"{table.name}: {counts[table.name]} rows in {time.perf_counter() - step:.1f}s")
+        # Entries of months before the initial partitions went to the default partition
+        partitions.ensure_partitions(connection)
+        # The project ids may now name other projects; workers reload their project index
+        record_catalog_rewrite(connection)
+
+        step = time.perf_counter()
+        if 'total_hours' not in headers['timesheets']:
+            connection.execute(rollup_update())
+        rebuild_project_hours(connection)
+        log(f"rollups rebuilt in {time.perf_counter() - step:.1f}s")
+
+        step = time.perf_counter()
+        for name, table_name, columns in indexes:
+            connection.execute(text(f"CREATE INDEX {name} ON {table_name} ({', '.join(columns)})"))
+        entry_search.create_search_index(connection)
+        log(f"{len(indexes)} indexes and the search index rebuilt in {time.perf_counter() - step:.1f}s")
+
+        if postgres:
+            # Ids come from the files, so move the sequences past them
+            for table in FIXTURE_TABLES:
+                connection.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                    f"(SELECT MAX(id) FROM {table.name}))"
+                ))
+
+    # Fresh statistics, so the planner does not cost the new tables as empty
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level='AUTOCOMMIT').execute(
+            text(f"ANALYZE {', '.join(t.name for t in FIXTURE_TABLES + DERIVED_TABLES)}")
+            if engine.dialect.name == 'postgresql' else text("ANALYZE")
+        )
+    log(f"Loaded in {time.perf_counter() - started:.1f}s")
+    return counts
+
+
+def _dump_selects():
+    """(table, SELECT of its fixture rows) for each file of a fixture set."""
+    selects = [(table, db.select(table).order_by(table.c.id)) for table in FIXTURE_TABLES]
+    archived = db.select(Timesheet.id).where(Timesheet.archived_at.is_not(None))
+    selects.append((ARCHIVED_HOURS, db.select(ARCHIVED_HOURS)
+                    .where(ARCHIVED_HOURS.c.timesheet_id.in_(archived))
+                    .order_by(ARCHIVED_HOURS.c.timesheet_id, ARCHIVED_HOURS.c.project_id)))
+    return selects
+
+
+def _copy_out(connection, statement, path):
+    query = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    cursor = connection.connection.cursor()
+    try:
+        with _open(path, 'w') as f:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)", f)
+        return cursor.rowcount
+    finally:
+        cursor.close()
+
+
+def _write_rows(connection, statement, path):
+    count = 0
+    result = connection.execution_options(yield_per=LOAD_BATCH_SIZE).execute(statement)
+    with _open(path, 'w') as f:
+        writer = csv.writer(f)
+        writer.writerow(list(result.keys()))
+        for rows in result.partitions():
+            writer.writerows(('' if v is None else v for v in row) for row in rows)
+            count += len(rows)
+    return count
+
+
+def dump(directory, log=print):
+    """
+    Write users, projects, timesheets, entries and the project hours of archived weeks
+    to `directory` as a fixture set. Returns {table name: rows}.
+    """
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    with db.engine.connect() as connection:
+        if connection.dialect.name == 'postgresql':
+            # One snapshot for all the tables, so the files agree with each other
+            connection.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY"))
+        copy = _use_copy(connection)
+        for table, statement in _dump_selects():
+            step = time.perf_counter()
+            path = fixture_path(directory, table)
+            counts[table.name] = (_copy_out(connection, statement, path) if copy
+                                  else _write_rows(connection, statement, path))
+            log(f"{table.name}: {counts[table.name]} rows in {time.perf_counter() - step:.1f}s")
+    return counts
@@ -0,0 +1,45 @@
+"""
+gunicorn settings, read automatically by `gunicorn wsgi:app`.
+
+GUNICORN_PRELOAD=1 imports the app once in the master before forking. Each
+worker then disposes the inherited connection pool (see db_pool.py) so no
+two processes ever share a database socket. At startup the pool settings
+are checked against DB_MAX_CONNECTIONS.
+
+With PROMETHEUS_MULTIPROC_DIR set, each worker writes its metrics to files in
+that directory (see metrics.py). Leftovers from a previous run are removed
+at startup, and a worker's live gauges are dropped when it exits.
+"""
+import glob
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '').lower() in ('1', 'true', 'yes')
+
+if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+    # A preloaded app creates its metric files before on_starting runs
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+
+def on_starting(server):
+    from config import Config
+    from db_pool import check_connection_budget
+    check_connection_budget(server.cfg.workers, vars(Config), server.log.warning)
+
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        for path in glob.glob(os.path.join(directory, '*.db')):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from db_pool import dispose_after_fork
+        dispose_after_fork(server.app.wsgi())
@@ -0,0 +1,48 @@
+"""
+Bulk-create users from a CSV or JSON file (see user_import.py for the format).
+
+    python import_users.py users.csv [--dry-run] [--report report.csv]
+"""
+import argparse
+import csv
+import os
+import sys
+from collections import Counter
+from app import create_app
+from user_import import REPORT_HEADER, import_rows, read_rows
+
+app = create_app()
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-create users from a CSV or JSON file.")
+    parser.add_argument('path')
+    parser.add_argument('--dry-run', action='store_true', help="validate only; create nothing")
+    parser.add_argument('--report', help="write the per-row report to this CSV file (default: print errors)")
+    parser.add_argument('--workers', type=int, help="password hashing processes (default: IMPORT_HASH_WORKERS)")
+    args = parser.parse_args()
+
+    fmt = os.path.splitext(args.path)[1].lower().lstrip('.')
+    with open(args.path, 'rb') as f:
+        try:
+            rows = read_rows(f.read(), fmt)
+        except ValueError as e:
+            sys.exit(f"Could not read {args.path}: {e}")
+
+    results = Counter()
+    report = open(args.report, 'w', newline='') if args.report else None
+    writer = csv.writer(report) if report else None
+    if writer:
+        writer.writerow(REPORT_HEADER)
+    with app.app_context():
+        for row in import_rows(rows, dry_run=args.dry_run, workers=args.workers):
+            results[row[2]] += 1
+            if writer:
+                writer.writerow(row)
+            elif row[2] != 'created' and row[2] != 'valid':
+                print(f"row {row[0]} ({row[1]}): {row[2]}: {row[3]}")
+    if report:
+        report.close()
+    print(', '.join(f"{count} {result}" for result, count in sorted(results.items())) or "No rows.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""
+Opt-in per-request instrumentation (INSTRUMENTATION_ENABLED).
+
+For every request this records the endpoint, wall time, number of SQL
+statements and time spent in them, using Flask request hooks and the
+engine's cursor events. Requests slower than SLOW_REQUEST_MS are written as
+one JSON line to the `timesheet.slow_requests` logger. Totals per endpoint
+and per normalised statement are kept in this worker for the admin
+performance page.
+
+The request is finalised in teardown_request, which for streamed responses
+(the CSV exports) runs after the last row has been sent, so their queries
+and time are counted too.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from flask import current_app, g, request, has_request_context
+from sqlalchemy import event
+from extensions import db
+
+slow_log = logging.getLogger('timesheet.slow_requests')
+
+# Expanded IN lists and literal-free whitespace differences should not make
+# one statement look like many
+_IN_LIST = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+_SPACE = re.compile(r'\s+')
+
+OTHER_STATEMENTS = '<other statements>'
+
+
+def normalize_sql(statement):
+    return _IN_LIST.sub('(...)', _SPACE.sub(' ', statement).strip())
+
+
+class RequestStats:
+    __slots__ = ('started', 'sql_count', 'sql_ms', 'statements', 'status')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.statements = []
+        self.status = None
+
+
+class _Totals:
+    __slots__ = ('count', 'total_ms', 'max_ms', 'sql_count', 'sql_ms', 'errors')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.errors = 0
+
+    def add(self, ms, sql_count=0, sql_ms=0.0, error=False):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.sql_count += sql_count
+        self.sql_ms += sql_ms
+        self.errors += error
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 1),
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 1),
+            'sql_count': self.sql_count,
+            'avg_sql': round(self.sql_count / self.count, 1) if self.count else 0.0,
+            'sql_ms': round(self.sql_ms, 1),
+            'errors': self.errors,
+        }
+
+
+class Aggregator:
+    """Per-worker running totals by endpoint and by statement."""
+
+    def __init__(self, max_statements=500):
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.endpoints = {}
+            self.statements = {}
+            self.since = time.time()
+
+    def record_request(self, endpoint, ms, stats, error):
+        with self._lock:
+            self.endpoints.setdefault(endpoint, _Totals()).add(ms, stats.sql_count, stats.sql_ms, error)
+            for sql, sql_ms in stats.statements:
+                key = sql if sql in self.statements or len(self.statements) < self.max_statements else OTHER_STATEMENTS
+                self.statements.setdefault(key, _Totals()).add(sql_ms)
+
+    def top_endpoints(self, n=20):
+        with self._lock:
+            rows = [dict(t.as_dict(), endpoint=name) for name, t in self.endpoints.items()]
+        return sorted(rows, key=lambda r: r['total_ms'], reverse=True)[:n]
+
+    def top_statements(self, n=20):
+        with self._lock:
+            rows = [dict(t.as_dict(), statement=sql) for sql, t in self.statements.items()]
+        return sorted(rows, key=lambda r: r['total_ms'], reverse=True)[:n]
+
+
+aggregator = Aggregator()
+
+
+def _current_stats():
+    return getattr(g, '_request_stats', None) if has_request_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['_query_started'].pop()
+    stats = _current_stats()
+    if stats is not None:
+        ms = (time.perf_counter() - started) * 1000
+        stats.sql_count += 1
+        stats.sql_ms += ms
+        stats.statements.append((normalize_sql(statement), ms))
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    started = context.connection.info.get('_query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def _start_request():
+    g._request_stats = RequestStats()
+
+
+def _record_status(response):
+    stats = _current_stats()
+    if stats is not None:
+        stats.status = response.status_code
+    return response
+
+
+def _finish_request(exc):
+    stats = g.pop('_request_stats', None)
+    if stats is None:
+        return
+    ms = (time.perf_counter() - stats.started) * 1000
+    endpoint = request.endpoint or '<unmatched>'
+    status = stats.status if stats.status is not None else 500
+    aggregator.record_request(endpoint, ms, stats, error=exc is not None or status >= 500)
+
+    if ms >= current_app.config['SLOW_REQUEST_MS']:
+        slowest = sorted(stats.statements, key=lambda s: s[1], reverse=True)[:3]
+        slow_log.warning(json.dumps({
+            'event': 'slow_request',
+            'endpoint': endpoint,
+            'method': request.method,
+            'path': request.path,
+            'status': status,
+            'duration_ms': round(ms, 1),
+            'sql_count': stats.sql_count,
+            'sql_ms': round(stats.sql_ms, 1),
+            'slowest_sql': [{'sql': sql[:300], 'ms': round(sql_ms, 1)} for sql, sql_ms in slowest],
+        }))
+
+
+def init_app(app):
+    """Install the request hooks and engine listeners when INSTRUMENTATION_ENABLED is set."""
+    if not app.config.get('INSTRUMENTATION_ENABLED'):
+        return
+    aggregator.max_statements = app.config.get('INSTRUMENTATION_MAX_STATEMENTS', aggregator.max_statements)
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(engine, 'handle_error', _handle_error)
+
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
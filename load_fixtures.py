@@ -0,0 +1,27 @@
+import argparse
+import sys
+from app import create_app
+from fixtures import dump, load
+
+app = create_app()
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load or dump users, projects, timesheets and entries as a fixture set (a directory of CSV files).")
+    parser.add_argument('command', choices=['load', 'dump'])
+    parser.add_argument('directory')
+    args = parser.parse_args()
+
+    with app.app_context():
+        try:
+            if args.command == 'load':
+                # Replaces every user, project, timesheet and entry in the database
+                counts = load(args.directory)
+            else:
+                counts = dump(args.directory)
+        except (ValueError, RuntimeError) as e:
+            sys.exit(str(e))
+        print(', '.join(f"{count} {table}" for table, count in counts.items()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Prometheus metrics at /metrics (METRICS_ENABLED, needs `prometheus_client`).
+
+Per request: a counter by endpoint/method/status, a latency histogram and
+an error counter by endpoint. The DB pool reports how long connections stay
+checked out, how many are in use and how many it may open; the in-process
+caches report hits and misses; pending and overdue submissions are read at
+scrape time.
+
+Under gunicorn, set PROMETHEUS_MULTIPROC_DIR to an empty directory so every
+worker writes its samples to memory-mapped files there and a scrape of any
+worker returns the totals of all of them (gunicorn.conf.py cleans up after
+exited workers). Recording a sample is a lock-free write to that file.
+"""
+import hmac
+import os
+import time
+from flask import Blueprint, Response, abort, current_app, g, request, got_request_exception
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from extensions import db
+from cache import cache_stats
+from db_pool import pool_status
+
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, multiprocess
+    from prometheus_client.core import GaugeMetricFamily
+except ImportError:
+    prometheus_client = None
+
+metrics_bp = Blueprint('metrics', __name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CACHE_SYNC_SECONDS = 10
+
+if prometheus_client is not None:
+    REQUESTS = Counter('timesheet_http_requests_total', 'HTTP requests handled.',
+                       ['endpoint', 'method', 'status'])
+    LATENCY = Histogram('timesheet_http_request_duration_seconds', 'Time to produce the full response.',
+                        ['endpoint'], buckets=LATENCY_BUCKETS)
+    ERRORS = Counter('timesheet_http_request_errors_total', 'Requests that ended in a 5xx or an exception.',
+                     ['endpoint'])
+    POOL_CHECKOUT = Histogram('timesheet_db_connection_checkout_seconds',
+                              'How long a pooled connection stayed checked out.', buckets=LATENCY_BUCKETS)
+    POOL_IN_USE = Gauge('timesheet_db_connections_in_use', 'Pooled connections currently checked out.',
+                        multiprocess_mode='livesum')
+    POOL_CAPACITY = Gauge('timesheet_db_pool_capacity', 'Connections the pool may open (pool size + max overflow).',
+                          multiprocess_mode='livesum')
+    POOL_TIMEOUTS = Counter('timesheet_db_pool_timeouts_total', 'Requests that timed out waiting for a connection.')
+    CACHE_HITS = Gauge('timesheet_cache_hits', 'In-process cache hits since worker start.',
+                       ['cache'], multiprocess_mode='livesum')
+    CACHE_MISSES = Gauge('timesheet_cache_misses', 'In-process cache misses since worker start.',
+                         ['cache'], multiprocess_mode='livesum')
+
+    class DomainCollector:
+        """Gauges read from the database when scraped (served from the admin stats cache)."""
+
+        def describe(self):
+            return []
+
+        def collect(self):
+            from admin_stats import dashboard_stats
+            stats = dashboard_stats()
+            pending = GaugeMetricFamily('timesheet_submissions_pending', 'Timesheets waiting for approval.')
+            pending.add_metric([], stats['timesheets_by_status']['submitted'])
+            yield pending
+            overdue = GaugeMetricFamily('timesheet_submissions_overdue',
+                                        'Submissions pending for more than PENDING_OVERDUE_DAYS.')
+            overdue.add_metric([], stats['overdue_submissions'])
+            yield overdue
+            by_status = GaugeMetricFamily('timesheet_timesheets', 'Timesheets by status.', labels=['status'])
+            for status, count in stats['timesheets_by_status'].items():
+                by_status.add_metric([status], count)
+            yield by_status
+
+    DOMAIN_REGISTRY = CollectorRegistry()
+    DOMAIN_REGISTRY.register(DomainCollector())
+
+_last_cache_sync = 0.0
+_pool_capacity = 0
+
+
+def _sync_gauges(force=False):
+    # Cache counters live in plain attributes; copy them (and the pool capacity) into the gauges now and then.
+    # Set from the worker, not init_app: a value set in a preloaded master is lost at fork.
+    global _last_cache_sync
+    now = time.monotonic()
+    if not force and now - _last_cache_sync < CACHE_SYNC_SECONDS:
+        return
+    _last_cache_sync = now
+    POOL_CAPACITY.set(_pool_capacity)
+    for name, stats in cache_stats().items():
+        CACHE_HITS.labels(name).set(stats['hits'])
+        CACHE_MISSES.labels(name).set(stats['misses'])
+
+
+def _start_request():
+    g._metrics_started = time.perf_counter()
+
+
+def _record_status(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def _finish_request(exc):
+    started = g.pop('_metrics_started', None)
+    if started is None or request.endpoint == 'metrics.serve_metrics':
+        return
+    endpoint = request.endpoint or 'unmatched'
+    status = g.pop('_metrics_status', 500)
+    REQUESTS.labels(endpoint, request.method, str(status)).inc()
+    LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+    if exc is not None or status >= 500:
+        ERRORS.labels(endpoint).inc()
+    _sync_gauges()
+
+
+def _on_exception(sender, exception, **extra):
+    if isinstance(exception, PoolTimeoutError):
+        POOL_TIMEOUTS.inc()
+
+
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.record_info['_checked_out_at'] = time.perf_counter()
+    POOL_IN_USE.inc()
+
+
+def _on_checkin(dbapi_connection, connection_record):
+    started = connection_record.record_info.pop('_checked_out_at', None)
+    if started is not None:
+        POOL_CHECKOUT.observe(time.perf_counter() - started)
+        POOL_IN_USE.dec()
+
+
+@metrics_bp.route('/metrics')
+def serve_metrics():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+
+    _sync_gauges(force=True)
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    body = prometheus_client.generate_latest(registry) + prometheus_client.generate_latest(DOMAIN_REGISTRY)
+    return Response(body, content_type=prometheus_client.CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    """Register /metrics and the collection hooks when METRICS_ENABLED is set."""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    if prometheus_client is None:
+        app.logger.warning("METRICS_ENABLED is set but prometheus_client is not installed; /metrics is disabled.")
+        return
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'checkout', _on_checkout):
+        event.listen(engine, 'checkout', _on_checkout)
+        event.listen(engine, 'checkin', _on_checkin)
+    global _pool_capacity
+    _pool_capacity = pool_status(engine).get('capacity', 0)
+
+    app.before_request(_start_request)
+    app.after_request(_record_status)
+    app.teardown_request(_finish_request)
+    got_request_exception.connect(_on_exception, app)
+    app.register_blueprint(metrics_bp)
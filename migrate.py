@@ -0,0 +1,28 @@
+import argparse
+from app import create_app
+from extensions import db
+import migrations
+
+app = create_app()
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply versioned schema migrations.")
+    parser.add_argument('command', choices=['status', 'upgrade', 'stamp'], nargs='?', default='upgrade')
+    parser.add_argument('--to', type=int, default=None, help="target version (default: latest)")
+    args = parser.parse_args()
+
+    with app.app_context():
+        engine = db.engine
+        if args.command == 'status':
+            print(f"Current version: {migrations.current_version(engine)} (latest: {migrations.head_version()})")
+            for m in migrations.pending(engine):
+                print(f"  pending {m.version}: {m.description}")
+        elif args.command == 'upgrade':
+            applied = migrations.upgrade(engine, target=args.to)
+            print(f"Applied {len(applied)} migration(s); now at version {migrations.current_version(engine)}.")
+        elif args.command == 'stamp':
+            migrations.stamp(engine, version=args.to)
+            print(f"Database stamped at version {migrations.current_version(engine)}.")
+
+if __name__ == '__main__':
+    main()
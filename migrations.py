@@ -0,0 +1,322 @@
+"""
+Versioned schema migrations.
+
+Each migration is a function registered with @migration(version, description)
+that receives a SQLAlchemy Connection. The applied version is recorded in the
+`schema_version` table, so `upgrade()` only runs what a database is missing
+and can be applied to a live database without dropping anything.
+
+Migrations declared with transactional=False run on an AUTOCOMMIT connection;
+they are used for Postgres `CREATE INDEX CONCURRENTLY`, which cannot run inside
+a transaction but does not block writes while the index builds. They must be
+idempotent, because a failure part-way leaves earlier statements applied.
+"""
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import text, inspect
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+Migration = namedtuple('Migration', 'version description transactional func')
+MIGRATIONS = []
+
+
+def migration(version, description, transactional=True):
+    """Register a migration function. Versions must be unique and increasing."""
+    def decorator(func):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append(Migration(version, description, transactional, func))
+        return func
+    return decorator
+
+
+def head_version():
+    return MIGRATIONS[-1].version if MIGRATIONS else 0
+
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+        "version INTEGER PRIMARY KEY, "
+        "description VARCHAR(200) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def _record(connection, m):
+    connection.execute(
+        text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)"),
+        {'v': m.version, 'd': m.description, 't': datetime.utcnow()}
+    )
+
+
+def current_version(engine):
+    """Return the highest applied migration version, or 0 for an unversioned database."""
+    with engine.begin() as connection:
+        _ensure_version_table(connection)
+        return connection.execute(text(f"SELECT COALESCE(MAX(version), 0) FROM {SCHEMA_VERSION_TABLE}")).scalar()
+
+
+def pending(engine):
+    version = current_version(engine)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def upgrade(engine, target=None, log=print):
+    """Apply pending migrations up to `target` (default: all). Returns the applied versions."""
+    applied = []
+    for m in pending(engine):
+        if target is not None and m.version > target:
+            break
+        log(f"Applying migration {m.version}: {m.description}")
+        if m.transactional:
+            with engine.begin() as connection:
+                m.func(connection)
+                _record(connection, m)
+        else:
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                m.func(connection)
+                _record(connection, m)
+        applied.append(m.version)
+    return applied
+
+
+def stamp(engine, version=None):
+    """
+    Mark migrations up to `version` (default: head) as applied without running
+    them. Used after `db.create_all()`, which already builds the current schema.
+    """
+    version = head_version() if version is None else version
+    with engine.begin() as connection:
+        _ensure_version_table(connection)
+        done = {row[0] for row in connection.execute(text(f"SELECT version FROM {SCHEMA_VERSION_TABLE}"))}
+        for m in MIGRATIONS:
+            if m.version <= version and m.version not in done:
+                _record(connection, m)
+
+
+# --- helpers -----------------------------------------------------------------
+
+def has_column(connection, table, column):
+    return column in {c['name'] for c in inspect(connection).get_columns(table)}
+
+
+def add_column(connection, table, column, ddl):
+    if not has_column(connection, table, column):
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def create_index(connection, name, table, columns, unique=False):
+    """
+    Create an index if it does not already exist. On Postgres the index is
+    built CONCURRENTLY (the migration must be transactional=False), and an
+    invalid leftover from an interrupted build is dropped and rebuilt.
+    """
+    unique_sql = 'UNIQUE ' if unique else ''
+    cols = ', '.join(columns)
+    if connection.dialect.name == 'postgresql':
+        invalid = connection.execute(text(
+            "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE c.relname = :name AND NOT i.indisvalid"
+        ), {'name': name}).first()
+        if invalid:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        connection.execute(text(f"CREATE {unique_sql}INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({cols})"))
+    else:
+        connection.execute(text(f"CREATE {unique_sql}INDEX IF NOT EXISTS {name} ON {table} ({cols})"))
+
+
+def drop_index(connection, name):
+    if connection.dialect.name == 'postgresql':
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    else:
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+
+# --- migrations --------------------------------------------------------------
+
+@migration(1, "Add weekly rollup columns to timesheets")
+def add_timesheet_rollups(connection):
+    from timesheet_queries import rollup_update
+    add_column(connection, 'timesheets', 'total_hours', "DOUBLE PRECISION NOT NULL DEFAULT 0")
+    add_column(connection, 'timesheets', 'entry_count', "INTEGER NOT NULL DEFAULT 0")
+    add_column(connection, 'timesheets', 'first_clock_in', "TIME")
+    add_column(connection, 'timesheets', 'last_clock_out', "TIME")
+    # archived_at does not exist yet (migration 6), and nothing is archived
+    connection.execute(rollup_update(skip_archived=False))
+
+
+@migration(2, "Add indexes for timesheet and entry lookups", transactional=False)
+def add_lookup_indexes(connection):
+    duplicates = connection.execute(text(
+        "SELECT user_id, week_start, COUNT(*) FROM timesheets "
+        "GROUP BY user_id, week_start HAVING COUNT(*) > 1"
+    )).fetchall()
+    if duplicates:
+        listing = ', '.join(f"user {u} week {w} ({n} rows)" for u, w, n in duplicates[:20])
+        raise RuntimeError(
+            "Cannot add unique (user_id, week_start): duplicate timesheets exist. "
+            f"Merge or delete them first: {listing}"
+        )
+
+    create_index(connection, 'uq_timesheets_user_week', 'timesheets', ['user_id', 'week_start'], unique=True)
+    if connection.dialect.name == 'postgresql':
+        exists = connection.execute(text(
+            "SELECT 1 FROM pg_constraint WHERE conname = 'uq_timesheets_user_week'"
+        )).first()
+        if not exists:
+            connection.execute(text(
+                "ALTER TABLE timesheets ADD CONSTRAINT uq_timesheets_user_week "
+                "UNIQUE USING INDEX uq_timesheets_user_week"
+            ))
+    create_index(connection, 'ix_timesheets_status_week_start', 'timesheets', ['status', 'week_start'])
+    create_index(connection, 'ix_timesheets_week_start', 'timesheets', ['week_start'])
+    create_index(connection, 'ix_timesheet_entries_timesheet_date', 'timesheet_entries', ['timesheet_id', 'date'])
+    create_index(connection, 'ix_users_manager_id', 'users', ['manager_id'])
+
+
+@migration(3, "Add keyset pagination indexes", transactional=False)
+def add_pagination_indexes(connection):
+    # (week_start, id) serves both the week_start range filters and the keyset order
+    create_index(connection, 'ix_timesheets_week_start_id', 'timesheets', ['week_start', 'id'])
+    drop_index(connection, 'ix_timesheets_week_start')
+    create_index(connection, 'ix_users_role_username', 'users', ['role', 'username'])
+
+
+@migration(4, "Add row version to timesheets")
+def add_timesheet_version(connection):
+    add_column(connection, 'timesheets', 'version', "INTEGER NOT NULL DEFAULT 1")
+
+
+@migration(5, "Add project hours reporting rollups")
+def add_project_hours_rollups(connection):
+    from models import ProjectWeekHours, ProjectWeekTotal
+    from reporting import rebuild_project_hours
+    ProjectWeekHours.__table__.create(connection, checkfirst=True)
+    ProjectWeekTotal.__table__.create(connection, checkfirst=True)
+    # The rollups group entries by project_id, which migration 9 adds and then fills them
+    if has_column(connection, 'timesheet_entries', 'project_id'):
+        rebuild_project_hours(connection, skip_archived=False)  # archived_at is added by migration 6
+
+
+@migration(6, "Add archived_at to timesheets")
+def add_timesheet_archived_at(connection):
+    add_column(connection, 'timesheets', 'archived_at', "TIMESTAMP")
+
+
+@migration(7, "Partition timesheet_entries by month (Postgres)")
+def partition_timesheet_entries(connection):
+    # Rewrites the table under an exclusive lock; a no-op on other databases
+    from partitions import partition_entries
+    partition_entries(connection)
+
+
+@migration(8, "Add full-text search index on timesheet entries")
+def add_entry_search_index(connection):
+    # A partitioned table cannot be indexed CONCURRENTLY, so on Postgres this
+    # blocks entry writes (not reads) while the GIN indexes build
+    from entry_search import create_search_index
+    # The index covers project names from the catalog; migration 9 builds it on older databases
+    if has_column(connection, 'timesheet_entries', 'project_id'):
+        create_search_index(connection)
+
+
+@migration(9, "Move entry project names into a projects catalog")
+def add_project_catalog(connection):
+    """
+    Replace timesheet_entries.project (and the project column of the report
+    rollups) with project_id referencing a new projects table. Names that
+    differ only in case or spacing become one project, named after their
+    most used spelling. Rewrites every entry row under a lock.
+    """
+    from collections import Counter, defaultdict
+    from models import Project, ProjectWeekHours, ProjectWeekTotal
+    from project_catalog import normalize_name, project_key
+    from reporting import rebuild_project_hours
+    import entry_search
+
+    Project.__table__.create(connection, checkfirst=True)
+    legacy_rollups = has_column(connection, 'project_week_hours', 'project')
+
+    uses = Counter(dict(connection.execute(text(
+        "SELECT project, COUNT(*) FROM timesheet_entries GROUP BY project"
+    )).all()))
+    if legacy_rollups:
+        # Archived weeks have no entries left; their rollup rows still name projects
+        uses.update(dict(connection.execute(text(
+            "SELECT project, SUM(entry_count) FROM project_week_hours GROUP BY project"
+        )).all()))
+    spellings = defaultdict(list)
+    for spelling, count in uses.items():
+        spellings[project_key(spelling)].append((-count, spelling))
+
+    connection.execute(text("CREATE TABLE project_spellings (spelling VARCHAR(150) PRIMARY KEY, project_id INTEGER NOT NULL)"))
+    for key, variants in sorted(spellings.items()):
+        name = normalize_name(min(variants)[1])
+        project_id = connection.execute(
+            Project.__table__.insert().values(name=name, key=key).returning(Project.__table__.c.id)
+        ).scalar()
+        connection.execute(text("INSERT INTO project_spellings (spelling, project_id) VALUES (:s, :p)"),
+                           [{'s': spelling, 'p': project_id} for _, spelling in variants])
+
+    entry_search.drop_search_index(connection)  # its SQLite triggers refer to the old column
+    connection.execute(text("ALTER TABLE timesheet_entries ADD COLUMN project_id INTEGER REFERENCES projects (id)"))
+    connection.execute(text(
+        "UPDATE timesheet_entries SET project_id = s.project_id "
+        "FROM project_spellings s WHERE s.spelling = timesheet_entries.project"
+    ))
+    if connection.dialect.name == 'postgresql':
+        # SQLite cannot add NOT NULL to an existing column; the model enforces it there
+        connection.execute(text("ALTER TABLE timesheet_entries ALTER COLUMN project_id SET NOT NULL"))
+    connection.execute(text("ALTER TABLE timesheet_entries DROP COLUMN project"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_timesheet_entries_project_date ON timesheet_entries (project_id, date)"
+    ))
+
+    # The rollups are keyed by project_id now; keep the rows of archived weeks and rebuild the rest
+    if legacy_rollups:
+        connection.execute(text(
+            "CREATE TABLE archived_project_hours AS "
+            "SELECT h.timesheet_id, s.project_id, h.user_id, h.week_start, h.status, "
+            "SUM(h.hours) AS hours, SUM(h.entry_count) AS entry_count "
+            "FROM project_week_hours h "
+            "JOIN project_spellings s ON s.spelling = h.project "
+            "JOIN timesheets t ON t.id = h.timesheet_id "
+            "WHERE t.archived_at IS NOT NULL "
+            "GROUP BY h.timesheet_id, s.project_id, h.user_id, h.week_start, h.status"
+        ))
+    for table in (ProjectWeekTotal.__table__, ProjectWeekHours.__table__):
+        table.drop(connection, checkfirst=True)
+        table.create(connection)
+    if legacy_rollups:
+        connection.execute(text(
+            "INSERT INTO project_week_hours (timesheet_id, project_id, user_id, week_start, status, hours, entry_count) "
+            "SELECT timesheet_id, project_id, user_id, week_start, status, hours, entry_count FROM archived_project_hours"
+        ))
+        connection.execute(text("DROP TABLE archived_project_hours"))
+    rebuild_project_hours(connection)
+
+    connection.execute(text("DROP TABLE project_spellings"))
+    entry_search.create_search_index(connection)
+
+
+@migration(10, "Add change tracking for the incremental export", transactional=False)
+def add_change_tracking(connection):
+    from models import EntryTombstone
+    # Existing rows get the time of the migration. A constant default fills them without rewriting
+    # the tables (Postgres 11+, SQLite); in SQLite's format, so the values compare as text correctly
+    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S.%f')
+    for table in ('timesheets', 'timesheet_entries'):
+        add_column(connection, table, 'updated_at', f"TIMESTAMP NOT NULL DEFAULT '{now}'")
+        if connection.dialect.name == 'postgresql':
+            # The app sets the value; SQLite cannot drop a column default, so it keeps it
+            connection.execute(text(f"ALTER TABLE {table} ALTER COLUMN updated_at DROP DEFAULT"))
+    EntryTombstone.__table__.create(connection, checkfirst=True)
+    create_index(connection, 'ix_timesheets_updated_at', 'timesheets', ['updated_at'])
+
+
+@migration(11, "Add the project catalog change marker")
+def add_project_catalog_changes(connection):
+    from models import ProjectCatalogChange
+    ProjectCatalogChange.__table__.create(connection, checkfirst=True)
@@ -1,10 +1,18 @@
 from extensions import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+from sqlalchemy import func, event
+from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import flag_modified
 
 class User(db.Model, UserMixin):
     __tablename__ = "users"
+    __table_args__ = (
+        db.Index('ix_users_manager_id', 'manager_id'),
+        db.Index('ix_users_role_username', 'role', 'username'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -33,6 +41,12 @@ class User(db.Model, UserMixin):
 
 class Timesheet(db.Model):
     __tablename__ = "timesheets"
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'week_start', name='uq_timesheets_user_week'),
+        db.Index('ix_timesheets_status_week_start', 'status', 'week_start'),
+        db.Index('ix_timesheets_week_start_id', 'week_start', 'id'),
+        db.Index('ix_timesheets_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -42,22 +56,158 @@ class Timesheet(db.Model):
     approved_at = db.Column(db.DateTime, nullable=True)
     manager_comments = db.Column(db.Text, nullable=True)
 
+    # Rollups of timesheet_entries, kept in sync by refresh_totals() on every save
+    total_hours = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    entry_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    first_clock_in = db.Column(db.Time, nullable=True)
+    last_clock_out = db.Column(db.Time, nullable=True)
+
+    # Row version, incremented by every UPDATE of the timesheet (see _bump_version);
+    # entry saves bump it through refresh_totals(). Served as the API ETag.
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    # Set when the week's entries were moved to the columnar archive (see entry_archive.py);
+    # the rollup columns above keep their values
+    archived_at = db.Column(db.DateTime, nullable=True)
+
+    # Last change made through the app, set with the version; entry saves update it through
+    # refresh_totals(). Archiving and rollup repairs leave it alone (see change_feed.py).
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
     entries = db.relationship('TimesheetEntry', backref='timesheet', lazy=True, cascade='all, delete-orphan')
 
-    def total_hours(self):
-        return sum(entry.hours for entry in self.entries)
+    def refresh_totals(self):
+        """
+        Recompute the rollup columns from timesheet_entries.
+        Flushes pending entry changes first so the values are committed
+        in the same transaction as the entries themselves.
+        """
+        db.session.flush()
+        count, total, first_in, last_out = db.session.query(
+            func.count(TimesheetEntry.id),
+            func.coalesce(func.sum(TimesheetEntry.hours), 0.0),
+            func.min(TimesheetEntry.clock_in),
+            func.max(TimesheetEntry.clock_out),
+        ).filter(
+            TimesheetEntry.timesheet_id == self.id,
+            # Entries lie within their week; the date range lets Postgres skip the other partitions
+            TimesheetEntry.date >= self.week_start,
+            TimesheetEntry.date < self.week_start + timedelta(days=7),
+        ).one()
+        self.entry_count = count
+        self.total_hours = float(total)
+        self.first_clock_in = first_in
+        self.last_clock_out = last_out
+        # Entry edits that leave the totals unchanged must still bump the version
+        flag_modified(self, 'total_hours')
+
+class Project(db.Model):
+    """
+    The project catalog. Entries refer to a project by id; `key` is the name
+    with case and spacing normalised (see project_catalog.py), so "ACME  web"
+    and "Acme Web" are the same project. The app only adds projects; a
+    fixture load replaces them all and records a ProjectCatalogChange.
+    """
+    __tablename__ = "projects"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(150), nullable=False)
+    key = db.Column(db.String(150), unique=True, nullable=False)
+
+    def __repr__(self):
+        return f"<Project {self.name}>"
+
+class ProjectCatalogChange(db.Model):
+    """
+    One row per rewrite of the projects table that may renumber projects
+    (a fixture load). The highest id is the catalog generation the
+    per-worker project indexes compare against (see project_catalog.py).
+    """
+    __tablename__ = "project_catalog_changes"
+
+    id = db.Column(db.Integer, primary_key=True)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 class TimesheetEntry(db.Model):
+    """
+    On Postgres the table is partitioned by month of `date` (see partitions.py),
+    so its primary key is (id, date). Ids still come from one sequence, and the
+    ORM keeps treating `id` alone as the key.
+    """
     __tablename__ = "timesheet_entries"
+    __table_args__ = (
+        db.Index('ix_timesheet_entries_timesheet_date', 'timesheet_id', 'date'),
+        db.Index('ix_timesheet_entries_project_date', 'project_id', 'date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     timesheet_id = db.Column(db.Integer, db.ForeignKey('timesheets.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     clock_in = db.Column(db.Time, nullable=True)
     clock_out = db.Column(db.Time, nullable=True)
-    project = db.Column(db.String(150), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
     description = db.Column(db.Text, nullable=True)
     hours = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    project_ref = db.relationship('Project', lazy='joined', innerjoin=True)
+    # The project name, read-only; archived entries (entry_archive.ArchivedEntry) carry it the same way
+    project = association_proxy('project_ref', 'name')
 
     def __repr__(self):
         return f"<Entry {self.project} on {self.date} - {self.hours}h>"
+
+class EntryTombstone(db.Model):
+    """
+    A deleted timesheet entry, so the incremental export can report the
+    deletion. Kept for CHANGE_RETENTION_DAYS (see change_feed.py).
+    """
+    __tablename__ = "timesheet_entry_tombstones"
+    __table_args__ = (
+        db.Index('ix_timesheet_entry_tombstones_deleted_at', 'deleted_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, nullable=False)
+    timesheet_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False)
+
+class ProjectWeekHours(db.Model):
+    """
+    Hours per project for each timesheet, the grain of the project reports.
+    Derived from timesheet_entries and kept current by reporting.py.
+    """
+    __tablename__ = "project_week_hours"
+    __table_args__ = (
+        db.Index('ix_project_week_hours_user_week', 'user_id', 'week_start'),
+        db.Index('ix_project_week_hours_week_status', 'week_start', 'status'),
+    )
+
+    timesheet_id = db.Column(db.Integer, db.ForeignKey('timesheets.id', ondelete='CASCADE'), primary_key=True)
+    project_id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    week_start = db.Column(db.Date, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    hours = db.Column(db.Float, nullable=False)
+    entry_count = db.Column(db.Integer, nullable=False)
+
+class ProjectWeekTotal(db.Model):
+    """Organisation-wide hours per project, week and status; the sum of project_week_hours."""
+    __tablename__ = "project_week_totals"
+
+    week_start = db.Column(db.Date, primary_key=True)
+    project_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    hours = db.Column(db.Float, nullable=False)
+    timesheet_count = db.Column(db.Integer, nullable=False)
+
+
+@event.listens_for(Timesheet, 'before_update')
+def _bump_version(mapper, connection, target):
+    # Dirty objects whose attributes were only reassigned their current values are flushed
+    # too; they keep their version, so an unchanged save does not invalidate ETags
+    if not object_session(target).is_modified(target, include_collections=False):
+        return
+    # Incremented in SQL so concurrent writers cannot both store the same version
+    target.version = Timesheet.version + 1
+    target.updated_at = datetime.utcnow()
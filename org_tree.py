@@ -0,0 +1,44 @@
+from flask import current_app
+from cache import TTLCache, clear_on_commit
+from extensions import db
+from models import User, Timesheet
+
+# (manager id, transitive) -> frozenset of report user ids; cleared whenever users change
+reports_cache = TTLCache('manager_reports', ttl=300, maxsize=2048)
+clear_on_commit(reports_cache, User)
+
+
+def reports_query(manager_id, transitive=False):
+    """
+    SELECT of the user ids reporting to `manager_id`: direct reports only, or
+    the whole subtree through a recursive CTE over users.manager_id. UNION
+    (not UNION ALL) stops the recursion if reporting lines ever form a cycle.
+    """
+    direct = db.select(User.id).where(User.manager_id == manager_id)
+    if not transitive:
+        return direct
+    tree = direct.cte('reports', recursive=True)
+    tree = tree.union(db.select(User.id).where(User.manager_id == tree.c.id))
+    return db.select(tree.c.id)
+
+
+def report_ids(manager_id, transitive=None):
+    """
+    Ids of the users whose timesheets `manager_id` reviews, from the per-worker
+    org-tree cache. `transitive` defaults to MANAGER_INCLUDE_INDIRECT_REPORTS.
+    """
+    if transitive is None:
+        transitive = current_app.config.get('MANAGER_INCLUDE_INDIRECT_REPORTS', False)
+    return reports_cache.get_or_load(
+        (manager_id, transitive),
+        lambda: frozenset(db.session.execute(reports_query(manager_id, transitive)).scalars())
+    )
+
+
+def scope_to_reports(query, manager_id):
+    """Restrict a Timesheet query to the reports of `manager_id`."""
+    return query.filter(Timesheet.user_id.in_(report_ids(manager_id)))
+
+
+def manages(manager_id, timesheet):
+    return timesheet.user_id in report_ids(manager_id)
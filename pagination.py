@@ -0,0 +1,131 @@
+import base64
+import binascii
+import datetime
+import json
+from flask import current_app, request, url_for
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    """Encode key values (ints, strings, dates) as an opaque URL-safe token."""
+    raw = json.dumps([v.isoformat() if isinstance(v, datetime.date) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """
+    Decode a token produced by encode_cursor() back into values typed for
+    `columns`. Returns None for a missing or malformed token.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if not isinstance(values, list) or len(values) != len(columns):
+            return None
+        typed = []
+        for col, value in zip(columns, values):
+            if col.type.python_type is datetime.date:
+                value = datetime.date.fromisoformat(value)
+            typed.append(value)
+        return typed
+    except (binascii.Error, ValueError, TypeError, NotImplementedError):
+        return None
+
+
+def _page_url(**params):
+    """The current URL with its paging arguments replaced by `params`."""
+    args = request.args.to_dict()
+    for name in ('after', 'before', 'page'):
+        args.pop(name, None)
+    args.update(params)
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query, with cursors for its neighbours."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def next_url(self):
+        return _page_url(after=self.next_cursor) if self.has_next else None
+
+    def prev_url(self):
+        return _page_url(before=self.prev_cursor) if self.has_prev else None
+
+
+class OffsetPage:
+    """
+    One numbered page of results that have no unique sort key to page on,
+    such as ranked search hits. Renders with the same pager as KeysetPage.
+    """
+
+    def __init__(self, items, number, has_next):
+        self.items = items
+        self.number = number
+        self.has_next = has_next
+
+    @property
+    def has_prev(self):
+        return self.number > 1
+
+    def next_url(self):
+        return _page_url(page=self.number + 1) if self.has_next else None
+
+    def prev_url(self):
+        return _page_url(page=self.number - 1) if self.has_prev else None
+
+
+def keyset_paginate(query, columns, descending=False, after=None, before=None, per_page=None):
+    """
+    Return a KeysetPage of `query` ordered by `columns` (all ascending or all
+    descending). The last column must make the ordering unique, e.g. the
+    primary key.
+
+    `after` / `before` are cursors from a previous page. Instead of an OFFSET,
+    the page starts with a row-value comparison against the cursor key, so an
+    index on `columns` serves every page in the same time however deep it is.
+    """
+    per_page = per_page or current_app.config.get('POSTS_PER_PAGE', 10)
+    key = tuple_(*columns)
+    after_values = decode_cursor(after, columns)
+    before_values = decode_cursor(before, columns) if after_values is None else None
+
+    def ordered(reverse):
+        return [c.asc() if descending == reverse else c.desc() for c in columns]
+
+    if before_values is not None:
+        cond = key > tuple_(*before_values) if descending else key < tuple_(*before_values)
+        rows = query.filter(cond).order_by(None).order_by(*ordered(reverse=True)).limit(per_page + 1).all()
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        has_next = True
+    else:
+        if after_values is not None:
+            cond = key < tuple_(*after_values) if descending else key > tuple_(*after_values)
+            query = query.filter(cond)
+        rows = query.order_by(None).order_by(*ordered(reverse=False)).limit(per_page + 1).all()
+        items = rows[:per_page]
+        has_next = len(rows) > per_page
+        has_prev = after_values is not None
+
+    def cursor_for(item):
+        return encode_cursor([getattr(item, c.key) for c in columns])
+
+    return KeysetPage(
+        items,
+        next_cursor=cursor_for(items[-1]) if items and has_next else None,
+        prev_cursor=cursor_for(items[0]) if items and has_prev else None,
+    )
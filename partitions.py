@@ -0,0 +1,182 @@
+"""
+Monthly range partitions of timesheet_entries on Postgres.
+
+The table is partitioned by `date`, one partition per calendar month
+(timesheet_entries_pYYYYMM) plus timesheet_entries_default for dates outside
+them. Queries that carry a date range on entries (see entry_week_bounds in
+timesheet_queries.py) only read the partitions for those months, and an
+archived month's partition can be dropped once it is empty.
+
+partition_entries() converts an existing plain table (migration 7) and also
+runs right after db.create_all() creates the table, so every Postgres
+database ends up partitioned. ensure_partitions() creates upcoming months
+and moves rows that landed in the default partition into their own month;
+it runs from `python archive_entries.py partitions` and after bulk loads.
+Other databases keep a single table and every function here is a no-op.
+"""
+from datetime import date
+from sqlalchemy import event, text
+from models import TimesheetEntry
+
+TABLE = TimesheetEntry.__tablename__
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+# Months of history given their own partitions when a table is converted; older rows
+# start in the default partition and are split out by ensure_partitions()
+INITIAL_MONTHS_BACK = 36
+# Rows older than this stay in the default partition rather than get a partition each
+MAX_MONTHS_BACK = 240
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned(connection):
+    if connection.dialect.name != 'postgresql':
+        return False
+    kind = connection.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"
+    ), {'table': TABLE}).scalar()
+    return kind == 'p'
+
+
+def _exists(connection, name):
+    return connection.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': name}).scalar()
+
+
+def _create_partition(connection, month):
+    name = partition_name(month)
+    bounds = f"FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    in_month = {'start': month, 'end': add_months(month, 1)}
+    stray = connection.execute(text(
+        f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end LIMIT 1"
+    ), in_month).first()
+    if not stray:
+        connection.execute(text(f"CREATE TABLE {name} PARTITION OF {TABLE} FOR VALUES {bounds}"))
+        return
+    # Postgres refuses a new partition while the default one holds rows for its range,
+    # so build it standalone, move the rows over and attach it
+    connection.execute(text(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), in_month)
+    connection.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES {bounds}"))
+
+
+def ensure_partitions(connection, months_ahead=3, first=None, today=None):
+    """
+    Create the monthly partitions from `first` (default: the oldest month with
+    rows in the default partition) through `months_ahead` months after the
+    current one. Returns the names of the partitions created.
+    """
+    if not is_partitioned(connection):
+        return []
+    today = today or date.today()
+    oldest = add_months(month_start(today), -MAX_MONTHS_BACK)
+    if first is None:
+        first = connection.execute(text(
+            f"SELECT MIN(date) FROM {DEFAULT_PARTITION} WHERE date >= :oldest"
+        ), {'oldest': oldest}).scalar()
+    last = add_months(month_start(today), months_ahead)
+    month = month_start(max(first, oldest)) if first else last
+
+    created = []
+    while month <= last:
+        if not _exists(connection, partition_name(month)):
+            _create_partition(connection, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def partition_entries(connection, months_ahead=3):
+    """
+    Turn a plain timesheet_entries table into a monthly partitioned one,
+    keeping its rows, indexes, id sequence and foreign keys. Returns False if
+    there was nothing to do (not Postgres, or already partitioned).
+    """
+    if connection.dialect.name != 'postgresql' or is_partitioned(connection):
+        return False
+    old = f'{TABLE}_unpartitioned'
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': TABLE}).scalar()
+    # Secondary indexes are recreated on the new table once the rows are in
+    indexes = connection.execute(text(
+        "SELECT i.indexname, i.indexdef FROM pg_indexes i "
+        "WHERE i.tablename = :table AND NOT EXISTS "
+        "(SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)"
+    ), {'table': TABLE}).all()
+    for name, _ in indexes:
+        connection.execute(text(f"DROP INDEX {name}"))
+    # Whatever foreign keys the table has now (project_id only exists from migration 9 on)
+    foreign_keys = connection.execute(text(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = to_regclass(:table) AND contype = 'f' ORDER BY conname"
+    ), {'table': TABLE}).all()
+
+    connection.execute(text(f"ALTER TABLE {TABLE} RENAME TO {old}"))
+    connection.execute(text(f"ALTER TABLE {old} RENAME CONSTRAINT {TABLE}_pkey TO {old}_pkey"))
+    connection.execute(text(
+        f"CREATE TABLE {TABLE} ("
+        f"LIKE {old} INCLUDING DEFAULTS, "
+        f"CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, date)"
+        + ''.join(f", CONSTRAINT {name} {definition}" for name, definition in foreign_keys)
+        + ") PARTITION BY RANGE (date)"
+    ))
+    connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"))
+
+    today = date.today()
+    first = connection.execute(text(f"SELECT MIN(date) FROM {old}")).scalar()
+    recent = add_months(month_start(today), -INITIAL_MONTHS_BACK)
+    ensure_partitions(connection, months_ahead, first=max(first, recent) if first else recent, today=today)
+
+    connection.execute(text(f"INSERT INTO {TABLE} SELECT * FROM {old}"))
+    for _, definition in indexes:
+        connection.execute(text(definition))
+    if sequence:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {TABLE}.id"))
+    connection.execute(text(f"DROP TABLE {old}"))
+    # Rows older than INITIAL_MONTHS_BACK went to the default partition; give them their months
+    ensure_partitions(connection, months_ahead, today=today)
+    return True
+
+
+def partition_sizes(connection):
+    """(partition name, rows) for each partition, oldest first; rows are the planner's estimate."""
+    if not is_partitioned(connection):
+        return []
+    return connection.execute(text(
+        "SELECT c.relname, GREATEST(c.reltuples, 0)::bigint FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table) ORDER BY c.relname"
+    ), {'table': TABLE}).all()
+
+
+def drop_empty_partitions(connection, before):
+    """Drop the empty monthly partitions that end on or before `before`. Returns their names."""
+    dropped = []
+    for name, _ in partition_sizes(connection):
+        if name == DEFAULT_PARTITION:
+            continue
+        month = date(int(name[-6:-2]), int(name[-2:]), 1)
+        if add_months(month, 1) > before:
+            continue
+        if connection.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is None:
+            connection.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    return dropped
+
+
+@event.listens_for(TimesheetEntry.__table__, 'after_create')
+def _partition_new_table(target, connection, **kw):
+    partition_entries(connection)
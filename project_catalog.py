@@ -0,0 +1,248 @@
+"""
+The project catalog and its per-worker prefix index.
+
+Entries refer to projects by id. Names typed into the weekly editors are
+resolved with resolve(): spelling variants that differ only in case or
+spacing map to the same project, and a new name adds a project.
+
+ProjectIndex keeps every project name of the catalog in memory as a sorted
+array of (word suffix, project id), with one item per word of a name, so a
+prefix lookup is a binary search. It serves the autocomplete endpoint and
+the project side of entry search without querying the database: projects
+added in this worker are indexed when their transaction commits, and a
+background thread picks up other workers' additions every
+PROJECT_INDEX_REFRESH_SECONDS with an incremental query on id. A fixture
+load may renumber the projects; it records a ProjectCatalogChange, and a
+new one triggers a full reload.
+
+The index can lag behind the table, so resolve(), whose ids are written to
+entries, reads them from the projects table instead.
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from cache import CACHES
+from extensions import db
+from models import Project, ProjectCatalogChange
+
+# Dialects whose insert() supports on_conflict_do_nothing
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+WORD_RE = re.compile(r'\w+')
+MAX_SCAN = 500  # prefix matches looked at when ranking completions
+
+
+def normalize_name(name):
+    """A project name as stored: trimmed, with runs of whitespace collapsed."""
+    return ' '.join((name or '').split())
+
+
+def project_key(name):
+    return normalize_name(name).casefold()
+
+
+class ProjectIndex:
+    """In-memory word-prefix index of the project catalog; safe to share between threads."""
+
+    def __init__(self, refresh_seconds=60):
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._suffixes = []  # sorted (word suffix of key, project id)
+        self._names = {}     # id -> name
+        self._max_id = 0
+        self._generation = None  # highest ProjectCatalogChange id when last reloaded
+        self._loaded = False
+        self._refresher_pid = None
+        self._app = None
+
+    def configure(self, refresh_seconds=None):
+        if refresh_seconds is not None:
+            self.refresh_seconds = refresh_seconds
+
+    # --- loading ---------------------------------------------------------
+
+    @staticmethod
+    def _items(project_id, key):
+        return [(key[m.start():], project_id) for m in WORD_RE.finditer(key)]
+
+    def _add(self, rows):
+        """Index (id, name, key) rows; the caller holds the lock."""
+        rows = [r for r in rows if r[0] not in self._names]
+        if not rows:
+            return
+        names, new_items = dict(self._names), []
+        for project_id, name, key in rows:
+            new_items.extend(self._items(project_id, key))
+            names[project_id] = name
+            self._max_id = max(self._max_id, project_id)
+        # One sort of the merged list (Timsort merges the two sorted runs in linear time)
+        suffixes = self._suffixes + sorted(new_items)
+        suffixes.sort()
+        # Copied and swapped in, so readers never see a structure change under them
+        self._suffixes, self._names = suffixes, names
+
+    def add(self, rows):
+        """Index newly committed (id, name, key) rows; a no-op until the index is first loaded."""
+        with self._lock:
+            if self._loaded:
+                self._add(rows)
+
+    def _reload(self, rows, generation=None):
+        with self._lock:
+            self._suffixes, self._names, self._max_id = [], {}, 0
+            self._add(rows)
+            self._generation = generation
+            self._loaded = True
+
+    def refresh(self):
+        """Bring the index up to date with the projects table (one small query when nothing changed)."""
+        count, max_id, generation = db.session.query(
+            func.count(Project.id), func.max(Project.id),
+            db.select(func.max(ProjectCatalogChange.id)).scalar_subquery(),
+        ).one()
+        with self._lock:
+            same_catalog = self._loaded and generation == self._generation
+            unchanged = same_catalog and count == len(self._names) and (max_id or 0) == self._max_id
+            newer_only = same_catalog and (max_id or 0) >= self._max_id
+            since = self._max_id
+        if unchanged:
+            return
+        if newer_only:
+            rows = db.session.query(Project.id, Project.name, Project.key).filter(Project.id > since).all()
+            with self._lock:
+                self._add(rows)
+                if len(self._names) == count:
+                    return
+        # The catalog was rewritten (a fixture load) or lost projects: start over
+        self._reload(db.session.query(Project.id, Project.name, Project.key).all(), generation)
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self.refresh()
+        self._start_refresher()
+
+    def _start_refresher(self):
+        # One thread per worker process, started on first use so it runs after gunicorn forks
+        if self._refresher_pid == os.getpid() or self._app is None:
+            return
+        self._refresher_pid = os.getpid()
+        threading.Thread(target=self._refresh_loop, args=(self._app,), name='project-index', daemon=True).start()
+
+    def _refresh_loop(self, app):
+        while True:
+            time.sleep(self.refresh_seconds)
+            with app.app_context():
+                try:
+                    self.refresh()
+                except Exception:
+                    logging.exception("Project index refresh failed")
+                finally:
+                    db.session.remove()
+
+    def init_app(self, app):
+        self._app = app
+        self.configure(refresh_seconds=app.config['PROJECT_INDEX_REFRESH_SECONDS'])
+
+    # --- lookups ---------------------------------------------------------
+
+    def _scan(self, prefix):
+        suffixes = self._suffixes
+        i = bisect.bisect_left(suffixes, (prefix,))
+        while i < len(suffixes) and suffixes[i][0].startswith(prefix):
+            yield suffixes[i]
+            i += 1
+
+    def complete(self, text, limit=10):
+        """
+        Up to `limit` (id, name) pairs of projects with a word starting with
+        `text`, names that start with it first, then alphabetically.
+        """
+        self._ensure_loaded()
+        prefix = project_key(text)
+        if not prefix:
+            return []
+        found = {}
+        for n, (suffix, project_id) in enumerate(self._scan(prefix)):
+            if n >= MAX_SCAN:
+                break
+            found.setdefault(project_id, suffix)
+        names = self._names
+        ranked = sorted(found, key=lambda i: (not project_key(names[i]).startswith(prefix), project_key(names[i])))
+        return [(i, names[i]) for i in ranked[:limit]]
+
+    def word_matches(self, word):
+        """Ids of projects with a word starting with `word`."""
+        self._ensure_loaded()
+        prefix = project_key(word)
+        return {project_id for _, project_id in self._scan(prefix)} if prefix else set()
+
+    def containing(self, text):
+        """Ids of projects whose name contains `text`, ignoring case and spacing."""
+        self._ensure_loaded()
+        needle = project_key(text)
+        return {i for i, name in self._names.items() if needle in project_key(name)} if needle else set()
+
+    def name(self, project_id):
+        self._ensure_loaded()
+        return self._names.get(project_id)
+
+    def stats(self):
+        return {'projects': len(self._names), 'index_items': len(self._suffixes), 'max_id': self._max_id}
+
+
+project_index = ProjectIndex()
+CACHES['project_index'] = project_index  # listed by /admin/cache-stats
+
+
+def resolve(names):
+    """
+    {name: project id} for the given names, adding projects for names not
+    in the catalog yet. The ids are read from the projects table with one
+    lookup on its unique key, not from the index, which may be behind other
+    workers or a fixture load. The new projects are inserted in the current
+    transaction and indexed on commit.
+    """
+    keys = {}
+    for name in names:
+        if normalize_name(name):
+            keys.setdefault(project_key(name), normalize_name(name))
+    if not keys:
+        return {}
+    ids = dict(db.session.query(Project.key, Project.id).filter(Project.key.in_(keys)).all())
+    missing = [key for key in keys if key not in ids]
+    if missing:
+        rows = [{'key': key, 'name': keys[key]} for key in missing]
+        dialect = db.session.get_bind().dialect.name
+        if dialect in _UPSERT_INSERTS:
+            # Another request may add the same name concurrently; the unique key keeps one
+            db.session.execute(_UPSERT_INSERTS[dialect](Project).on_conflict_do_nothing(index_elements=['key']), rows)
+        else:
+            db.session.execute(db.insert(Project), rows)
+        added = db.session.query(Project.id, Project.name, Project.key).filter(Project.key.in_(missing)).all()
+        db.session.info.setdefault('new_projects', []).extend(added)
+        ids.update({key: project_id for project_id, _, key in added})
+    return {name: ids[project_key(name)] for name in names if normalize_name(name)}
+
+
+def record_catalog_rewrite(connection):
+    """Mark the projects table as rewritten, so every worker reloads its index; in the caller's transaction."""
+    connection.execute(db.insert(ProjectCatalogChange).values(changed_at=datetime.utcnow()))
+
+
+@event.listens_for(Session, 'after_commit')
+def _index_new_projects(session):
+    added = session.info.pop('new_projects', None)
+    if added:
+        project_index.add(added)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_new_projects(session):
+    session.info.pop('new_projects', None)
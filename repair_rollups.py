@@ -0,0 +1,16 @@
+from app import create_app
+from extensions import db
+from timesheet_queries import repair_timesheet_rollups
+from reporting import rebuild_project_hours
+
+app = create_app()
+
+def repair_rollups():
+    with app.app_context():
+        updated = repair_timesheet_rollups()
+        rebuild_project_hours(db.session)
+        db.session.commit()
+        print(f"Rollups recomputed for {updated} timesheets.")
+
+if __name__ == '__main__':
+    repair_rollups()
@@ -0,0 +1,341 @@
+"""
+Project hours reports: hours per project per week (or month), per person or
+per project, as a grid with row and column totals.
+
+Reports never read timesheet_entries. project_week_hours holds one row per
+timesheet and project; project_week_totals sums it per project, week and
+status for organisation-wide reports, so those read a few rows per week
+however many people there are. Both are kept current here through ORM
+events: saving a week's entries (refresh_totals) rebuilds that timesheet's
+rows, a status change updates them in place and deleting a timesheet
+removes them, and the totals receive the difference. Core statements that
+bypass the ORM call rebuild_project_hours() or sync_status() themselves.
+
+Hours are summed in SQL down to one value per row and week; folding weeks
+into months and laying the cells out as a grid uses NumPy when it is
+installed and plain Python otherwise.
+"""
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, func, inspect, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from extensions import db
+from models import User, Project, Timesheet, TimesheetEntry, ProjectWeekHours, ProjectWeekTotal
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Which timesheets a report counts
+REPORT_SCOPES = {
+    'approved': ('approved',),
+    'submitted': ('submitted', 'approved'),
+    'all': None,
+}
+REPORT_VIEWS = ('person', 'project')
+REPORT_PERIODS = ('week', 'month')
+DEFAULT_REPORT_WEEKS = 12
+# Longer ranges are clamped: the grid holds rows x periods cells
+MAX_REPORT_PERIODS = 104  # two years of weeks, or about eight of months
+MAX_REPORT_WEEKS_AHEAD = 52
+EARLIEST_REPORT_DATE = date(1900, 1, 1)  # keeps the period arithmetic within date's range
+
+# Dialects whose insert() supports on_conflict_do_update
+_UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+# A change to any of these means the timesheet's rollup rows must be rebuilt
+_REBUILD_ATTRS = ('total_hours', 'entry_count', 'user_id', 'week_start')
+
+
+# --- rollup maintenance ------------------------------------------------------
+
+# Target columns of the INSERT ... SELECTs, in the order the selects below produce them
+_HOURS_COLUMNS = ['timesheet_id', 'project_id', 'user_id', 'week_start', 'status', 'hours', 'entry_count']
+_TOTALS_COLUMNS = ['week_start', 'project_id', 'status', 'hours', 'timesheet_count']
+
+
+def _rollup_select(timesheet_ids=None):
+    stmt = (
+        db.select(
+            TimesheetEntry.timesheet_id, TimesheetEntry.project_id, Timesheet.user_id,
+            Timesheet.week_start, Timesheet.status,
+            func.sum(TimesheetEntry.hours), func.count(TimesheetEntry.id),
+        )
+        .join(Timesheet, Timesheet.id == TimesheetEntry.timesheet_id)
+        .group_by(TimesheetEntry.timesheet_id, TimesheetEntry.project_id, Timesheet.user_id,
+                  Timesheet.week_start, Timesheet.status)
+    )
+    if timesheet_ids is not None:
+        stmt = stmt.where(TimesheetEntry.timesheet_id.in_(timesheet_ids))
+    return stmt
+
+
+def _totals_select(timesheet_ids=None):
+    P = ProjectWeekHours
+    stmt = (
+        db.select(P.week_start, P.project_id, P.status, func.sum(P.hours), func.count())
+        .group_by(P.week_start, P.project_id, P.status)
+    )
+    if timesheet_ids is not None:
+        stmt = stmt.where(P.timesheet_id.in_(timesheet_ids))
+    return stmt
+
+
+def _contribution(connection, timesheet_ids):
+    """{(week_start, project_id, status): (hours, timesheets)} that `timesheet_ids` add to project_week_totals."""
+    return {(w, p, s): (hours, count) for w, p, s, hours, count in connection.execute(_totals_select(timesheet_ids))}
+
+
+def _apply_change(connection, before, after):
+    """
+    Move project_week_totals from one _contribution() of a set of timesheets
+    to another. The differences are added with INSERT ... ON CONFLICT DO
+    UPDATE, so concurrent saves of different timesheets in the same week
+    never overwrite each other's hours.
+    """
+    totals = ProjectWeekTotal.__table__
+    rows = []
+    for key in before.keys() | after.keys():
+        old_hours, old_count = before.get(key, (0.0, 0))
+        new_hours, new_count = after.get(key, (0.0, 0))
+        if new_hours != old_hours or new_count != old_count:
+            rows.append({'week_start': key[0], 'project_id': key[1], 'status': key[2],
+                         'hours': new_hours - old_hours, 'timesheet_count': new_count - old_count})
+    if not rows:
+        return
+
+    insert = _UPSERT_INSERTS[connection.dialect.name](totals)
+    connection.execute(insert.on_conflict_do_update(
+        index_elements=[totals.c.week_start, totals.c.project_id, totals.c.status],
+        set_={'hours': totals.c.hours + insert.excluded.hours,
+              'timesheet_count': totals.c.timesheet_count + insert.excluded.timesheet_count},
+    ), rows)
+    emptied = [key for key in before if key not in after]
+    if emptied:
+        connection.execute(db.delete(totals).where(
+            totals.c.timesheet_count <= 0,
+            tuple_(totals.c.week_start, totals.c.project_id, totals.c.status).in_(emptied),
+        ))
+
+
+def _connection(executor):
+    return executor if isinstance(executor, Connection) else executor.connection()
+
+
+def rebuild_project_hours(executor, timesheet_ids=None, skip_archived=True):
+    """
+    Recompute the rollup rows of the given timesheets (default: all, which
+    also rebuilds project_week_totals from scratch). Archived timesheets have
+    no entries left, so a full rebuild keeps their rows unless skip_archived
+    is False. `executor` is a Session or Connection; the caller commits.
+    """
+    connection = _connection(executor)
+    hours, totals = ProjectWeekHours.__table__, ProjectWeekTotal.__table__
+    if timesheet_ids is None:
+        stale = db.delete(hours)
+        if skip_archived:
+            stale = stale.where(hours.c.timesheet_id.not_in(
+                db.select(Timesheet.id).where(Timesheet.archived_at.is_not(None))
+            ))
+        connection.execute(stale)
+        connection.execute(hours.insert().from_select(_HOURS_COLUMNS, _rollup_select()))
+        connection.execute(db.delete(totals))
+        connection.execute(totals.insert().from_select(_TOTALS_COLUMNS, _totals_select()))
+        return
+
+    timesheet_ids = list(timesheet_ids)
+    before = _contribution(connection, timesheet_ids)
+    connection.execute(db.delete(hours).where(hours.c.timesheet_id.in_(timesheet_ids)))
+    connection.execute(hours.insert().from_select(_HOURS_COLUMNS, _rollup_select(timesheet_ids)))
+    _apply_change(connection, before, _contribution(connection, timesheet_ids))
+
+
+def sync_status(executor, timesheet_ids, status):
+    """Copy a status change made outside the ORM (e.g. a bulk UPDATE) into the rollups."""
+    if not timesheet_ids:
+        return
+    connection = _connection(executor)
+    hours = ProjectWeekHours.__table__
+    timesheet_ids = list(timesheet_ids)
+    before = _contribution(connection, timesheet_ids)
+    connection.execute(hours.update().where(hours.c.timesheet_id.in_(timesheet_ids)).values(status=status))
+    _apply_change(connection, before, _contribution(connection, timesheet_ids))
+
+
+@event.listens_for(Timesheet, 'after_update')
+def _timesheet_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in _REBUILD_ATTRS):
+        rebuild_project_hours(connection, [target.id])
+    elif state.attrs.status.history.has_changes():
+        sync_status(connection, [target.id], target.status)
+
+
+@event.listens_for(Timesheet, 'after_delete')
+def _timesheet_deleted(mapper, connection, target):
+    hours = ProjectWeekHours.__table__
+    before = _contribution(connection, [target.id])
+    connection.execute(db.delete(hours).where(hours.c.timesheet_id == target.id))
+    _apply_change(connection, before, {})
+
+
+# --- reports -----------------------------------------------------------------
+
+class ProjectReport:
+    """
+    A pivot of hours: `rows` are label tuples (employee and project, or just
+    project), `periods` the column dates (Mondays, or the 1st of each month)
+    and `cells[i][j]` the hours of row i in period j.
+    """
+
+    def __init__(self, row_headers, rows, periods, period, cells, row_totals, period_totals):
+        self.row_headers = row_headers
+        self.rows = rows
+        self.periods = periods
+        self.period = period
+        self.cells = cells
+        self.row_totals = row_totals
+        self.period_totals = period_totals
+        self.total = round(sum(row_totals), 2)
+
+    def period_label(self, value):
+        return value.strftime('%b %Y') if self.period == 'month' else value.strftime('%d %b %Y')
+
+    def csv_header(self):
+        return [*self.row_headers, *(self.period_label(p) for p in self.periods), 'Total']
+
+    def csv_rows(self):
+        for labels, cells, total in zip(self.rows, self.cells, self.row_totals):
+            yield [*labels, *cells, total]
+        yield ['Total', *([''] * (len(self.row_headers) - 1)), *self.period_totals, self.total]
+
+
+def _weeks(start, end):
+    monday = start - timedelta(days=start.weekday())
+    while monday <= end:
+        yield monday
+        monday += timedelta(weeks=1)
+
+
+def _grid(cells, n_rows, n_cols):
+    """Sum (row, column, hours) triples into a rounded n_rows x n_cols grid plus row/column totals."""
+    if np is not None:
+        grid = np.zeros((n_rows, n_cols))
+        if cells:
+            rows, cols, hours = zip(*cells)
+            np.add.at(grid, (np.fromiter(rows, np.intp, len(cells)), np.fromiter(cols, np.intp, len(cells))),
+                      np.fromiter(hours, float, len(cells)))
+        return grid.round(2).tolist(), grid.sum(axis=1).round(2).tolist(), grid.sum(axis=0).round(2).tolist()
+
+    grid = [[0.0] * n_cols for _ in range(n_rows)]
+    for r, c, hours in cells:
+        grid[r][c] += hours
+    return ([[round(v, 2) for v in row] for row in grid],
+            [round(sum(row), 2) for row in grid],
+            [round(sum(col), 2) for col in zip(*grid)] if grid else [0.0] * n_cols)
+
+
+def _cells_select(view, start, end, statuses, user_ids):
+    """SELECT of (row labels..., week_start, hours), ordered by the row labels, and the label headers."""
+    if view == 'person':
+        # The rollup already has one row per person, project and week
+        P = ProjectWeekHours
+        stmt = (
+            db.select(User.username, Project.name, P.week_start, P.hours)
+            .join(User, User.id == P.user_id)
+            .join(Project, Project.id == P.project_id)
+            .order_by(User.username, Project.name)
+        )
+        headers = ['Employee', 'Project']
+    else:
+        # Organisation-wide totals are pre-summed; a team's are summed from its people's rows
+        P = ProjectWeekTotal if user_ids is None else ProjectWeekHours
+        stmt = (
+            db.select(Project.name, P.week_start, func.sum(P.hours))
+            .join(Project, Project.id == P.project_id)
+            .group_by(Project.name, P.week_start)
+            .order_by(Project.name)
+        )
+        headers = ['Project']
+
+    stmt = stmt.where(P.week_start.between(start, end))
+    if statuses:
+        stmt = stmt.where(P.status.in_(statuses))
+    if user_ids is not None:
+        stmt = stmt.where(P.user_id.in_(list(user_ids)))
+    return stmt, headers
+
+
+def build_project_report(start, end, view='person', period='week', scope='approved', user_ids=None):
+    """
+    Hours per project per period between `start` and `end` (week_start dates,
+    inclusive) for `user_ids` (default: everyone), from the rollups.
+    """
+    start = start - timedelta(days=start.weekday())
+    stmt, row_headers = _cells_select(view, start, end, REPORT_SCOPES[scope], user_ids)
+
+    # Every week in the range maps to a column, so empty periods still show
+    periods, column_of = [], {}
+    for monday in _weeks(start, end):
+        label = monday.replace(day=1) if period == 'month' else monday
+        if not periods or periods[-1] != label:
+            periods.append(label)
+        column_of[monday] = len(periods) - 1
+
+    row_index, cells = {}, []
+    for *labels, week_start, hours in db.session.execute(stmt):
+        row = row_index.setdefault(tuple(labels), len(row_index))
+        # week_start is always a Monday for timesheets created through the app
+        cells.append((row, column_of[week_start - timedelta(days=week_start.weekday())], hours))
+
+    grid, row_totals, period_totals = _grid(cells, len(row_index), len(periods))
+    return ProjectReport(row_headers, list(row_index), periods, period, grid, row_totals, period_totals)
+
+
+def _earliest_start(end, period):
+    """The first start date whose report up to `end` has at most MAX_REPORT_PERIODS columns."""
+    if period == 'week':
+        return end - timedelta(days=end.weekday(), weeks=MAX_REPORT_PERIODS - 1)
+    month = end.year * 12 + end.month - 1 - (MAX_REPORT_PERIODS - 1)
+    first = date(month // 12, month % 12 + 1, 1)
+    # A start before the month's first Monday would add the previous month through its week
+    return first + timedelta(days=-first.weekday() % 7)
+
+
+def parse_report_params(args):
+    """
+    Report filters from the query string, falling back to the last
+    DEFAULT_REPORT_WEEKS weeks. A range longer than MAX_REPORT_PERIODS
+    periods, or ending more than MAX_REPORT_WEEKS_AHEAD weeks ahead, is
+    clamped. params['clamped'] is then the warning to show, else None; the
+    views flash it, the CSV exports send it as the X-Report-Clamped header
+    (the file name carries the dates covered).
+    """
+    today = date.today()
+    this_monday = today - timedelta(days=today.weekday())
+    try:
+        end = datetime.strptime(args.get('end_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        end = this_monday
+    try:
+        start = datetime.strptime(args.get('start_date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start = end - timedelta(weeks=DEFAULT_REPORT_WEEKS - 1)
+    if start > end:
+        start, end = end, start
+
+    view = args.get('view') if args.get('view') in REPORT_VIEWS else 'person'
+    period = args.get('period') if args.get('period') in REPORT_PERIODS else 'week'
+    scope = args.get('scope') if args.get('scope') in REPORT_SCOPES else 'approved'
+
+    latest = this_monday + timedelta(weeks=MAX_REPORT_WEEKS_AHEAD)
+    bounded_end = min(max(end, EARLIEST_REPORT_DATE), latest)
+    earliest = max(_earliest_start(bounded_end, period), EARLIEST_REPORT_DATE)
+    clamped = None
+    if end != bounded_end or start < earliest:
+        end = bounded_end
+        start = min(max(start, earliest), end)
+        clamped = (f"Reports cover at most {MAX_REPORT_PERIODS} {period}s, ending no more than "
+                   f"{MAX_REPORT_WEEKS_AHEAD} weeks ahead; showing {start:%Y-%m-%d} to {end:%Y-%m-%d}.")
+    return {'start': start, 'end': end, 'view': view, 'period': period, 'scope': scope, 'clamped': clamped}
@@ -1,6 +1,7 @@
 from app import create_app
 from extensions import db
 from sqlalchemy import text  # ✅ required import
+import migrations
 
 app = create_app()
 
@@ -14,4 +15,5 @@ with app.app_context():
     print("✅ All tables dropped with CASCADE.")
 
     db.create_all()
+    migrations.stamp(db.engine)
     print("✅ Tables recreated successfully.")
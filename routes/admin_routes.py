@@ -1,17 +1,38 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, send_file
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, current_app, send_file, abort
 from flask_login import login_required, current_user
-from models import User, Timesheet, TimesheetEntry
+from models import User, Timesheet
 from extensions import db
+from timesheet_queries import admin_export_query, admin_export_rows, ADMIN_EXPORT_HEADER
+from utils import csv_response
+from pagination import keyset_paginate
+from weekly_timesheet import save_week_entries, WeekGrid
+from entry_archive import week_entries
+from user_cache import invalidate_user
+from cache import cache_stats
+from admin_stats import dashboard_stats
+from reporting import build_project_report, parse_report_params
+import change_feed
+import db_pool
+import entry_archive
+import entry_search
+import export_jobs
+import instrumentation
+import user_import
 from datetime import datetime, timedelta
+from itertools import chain
 from calendar import monthrange
+from collections import Counter
 from functools import wraps
-import io
-import csv
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
+import csv
 import logging
+import os
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
 
+JOB_DOWNLOAD_NAMES = {"admin_timesheets": "timesheets_export.csv", "user_import": "user_import_report.csv"}
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -22,16 +43,71 @@ def admin_required(f):
     return decorated_function
 
 
+def parse_timesheet_filters(args):
+    """
+    Read the status/start_date/end_date filters shared by the timesheet list
+    and its exports. Dates default to the current month and are capped at
+    its last day. Raises ValueError for a malformed date.
+    Returns (status, start_date, end_date, max_allowed_date).
+    """
+    status_filter = args.get("status")
+    start_date_str = args.get("start_date")
+    end_date_str = args.get("end_date")
+
+    today = datetime.today().date()
+    max_allowed_date = today.replace(day=monthrange(today.year, today.month)[1])
+    start_date = today.replace(day=1)
+    end_date = max_allowed_date
+
+    if start_date_str:
+        start_date = min(datetime.strptime(start_date_str, "%Y-%m-%d").date(), max_allowed_date)
+    if end_date_str:
+        end_date = min(datetime.strptime(end_date_str, "%Y-%m-%d").date(), max_allowed_date)
+    return status_filter, start_date, end_date, max_allowed_date
+
+
 @admin_bp.route("/dashboard")
 @login_required
 @admin_required
 def dashboard():
+    stats = dashboard_stats()
     return render_template("admin/admin_dashboard.html",
-                           user_count=User.query.count(),
-                           employee_count=User.query.filter_by(role='employee').count(),
-                           manager_count=User.query.filter_by(role='manager').count(),
-                           admin_count=User.query.filter_by(role='admin').count(),
-                           timesheet_count=Timesheet.query.count())
+                           stats=stats,
+                           user_count=stats['user_count'],
+                           employee_count=stats['users_by_role']['employee'],
+                           manager_count=stats['users_by_role']['manager'],
+                           admin_count=stats['users_by_role']['admin'],
+                           timesheet_count=stats['timesheet_count'],
+                           overdue_days=current_app.config['PENDING_OVERDUE_DAYS'])
+
+
+@admin_bp.route("/cache-stats")
+@login_required
+@admin_required
+def view_cache_stats():
+    """Hit/miss counters of this worker's in-process caches."""
+    return jsonify(cache_stats())
+
+
+@admin_bp.route("/performance", methods=["GET", "POST"])
+@login_required
+@admin_required
+def view_performance():
+    """Top endpoints and SQL statements by total time in this worker."""
+    if request.method == "POST":
+        instrumentation.aggregator.reset()
+        flash("Performance counters reset for this worker.", "success")
+        return redirect(url_for("admin.view_performance"))
+
+    return render_template(
+        "admin/admin_performance.html",
+        enabled=current_app.config["INSTRUMENTATION_ENABLED"],
+        slow_ms=current_app.config["SLOW_REQUEST_MS"],
+        since=datetime.utcfromtimestamp(instrumentation.aggregator.since),
+        endpoints=instrumentation.aggregator.top_endpoints(),
+        statements=instrumentation.aggregator.top_statements(),
+        pool=db_pool.pool_status(db.engine),
+    )
 
 
 @admin_bp.route("/users")
@@ -42,8 +118,9 @@ def view_users():
     query = User.query
     if role_filter:
         query = query.filter_by(role=role_filter)
-    users = query.order_by(User.role, User.username).all()
-    return render_template("admin/admin_users.html", users=users, role_filter=role_filter)
+    page = keyset_paginate(query, [User.role, User.username],
+                           after=request.args.get('after'), before=request.args.get('before'))
+    return render_template("admin/admin_users.html", users=page.items, page=page, role_filter=role_filter)
 
 
 @admin_bp.route("/user/create", methods=["GET", "POST"])
@@ -95,6 +172,7 @@ def edit_user(user_id):
 
         try:
             db.session.commit()
+            invalidate_user(user_id)
             flash("User updated successfully.", "success")
             return redirect(url_for("admin.view_users"))
         except SQLAlchemyError as e:
@@ -115,6 +193,7 @@ def delete_user(user_id):
     try:
         db.session.delete(user)
         db.session.commit()
+        invalidate_user(user_id)
         flash("User deleted.", "warning")
     except SQLAlchemyError as e:
         db.session.rollback()
@@ -127,46 +206,21 @@ def delete_user(user_id):
 @login_required
 @admin_required
 def view_timesheets():
-    status_filter = request.args.get("status")
-    start_date_str = request.args.get("start_date")
-    end_date_str = request.args.get("end_date")
-
-    today = datetime.today().date()
-    max_allowed_date = today.replace(day=monthrange(today.year, today.month)[1])
-    default_start = today.replace(day=1)
-    default_end = max_allowed_date
-
     try:
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-            if start_date > max_allowed_date:
-                start_date = max_allowed_date
-        else:
-            start_date = default_start
-
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-            if end_date > max_allowed_date:
-                end_date = max_allowed_date
-        else:
-            end_date = default_end
+        status_filter, start_date, end_date, max_allowed_date = parse_timesheet_filters(request.args)
     except ValueError:
         flash("Invalid date format. Use YYYY-MM-DD.", "warning")
-        start_date = default_start
-        end_date = default_end
-
-    query = Timesheet.query.order_by(Timesheet.week_start.desc())
+        status_filter, start_date, end_date, max_allowed_date = parse_timesheet_filters({"status": request.args.get("status")})
 
-    if status_filter:
-        query = query.filter_by(status=status_filter)
+    query = admin_export_query(status_filter, start_date, end_date).options(joinedload(Timesheet.user))
 
-    query = query.filter(Timesheet.week_start >= start_date, Timesheet.week_start <= end_date)
-
-    timesheets = query.all()
+    page = keyset_paginate(query, [Timesheet.week_start, Timesheet.id], descending=True,
+                           after=request.args.get('after'), before=request.args.get('before'))
 
     return render_template(
         "admin/admin_timesheets.html",
-        timesheets=timesheets,
+        timesheets=page.items,
+        page=page,
         status_filter=status_filter,
         start_date=start_date.strftime("%Y-%m-%d"),
         end_date=end_date.strftime("%Y-%m-%d"),
@@ -179,7 +233,7 @@ def view_timesheets():
 @admin_required
 def view_timesheet_detail(timesheet_id):
     timesheet = Timesheet.query.get_or_404(timesheet_id)
-    return render_template("admin/admin_timesheet_detail.html", timesheet=timesheet)
+    return render_template("admin/admin_timesheet_detail.html", timesheet=timesheet, entries=week_entries(timesheet))
 
 
 @admin_bp.route('/timesheet/edit/<int:ts_id>', methods=['GET', 'POST'])
@@ -187,6 +241,9 @@ def view_timesheet_detail(timesheet_id):
 @admin_required
 def edit_timesheet(ts_id):
     timesheet = Timesheet.query.get_or_404(ts_id)
+    if timesheet.archived_at:
+        flash('This week is archived and can no longer be edited.', 'warning')
+        return redirect(url_for('admin.view_timesheet_detail', timesheet_id=timesheet.id))
     week_dates = [timesheet.week_start + timedelta(days=i) for i in range(5)]
 
     def parse_time(tstr):
@@ -198,9 +255,7 @@ def edit_timesheet(ts_id):
             return datetime.strptime(tstr, '%H:%M:%S').time()
 
     if request.method == 'POST':
-        # Clear existing entries for the timesheet
-        TimesheetEntry.query.filter_by(timesheet_id=timesheet.id).delete()
-
+        rows = []
         for i, day_date in enumerate(week_dates):
             clock_in_str = request.form.get(f'clock_in_{i}')
             clock_out_str = request.form.get(f'clock_out_{i}')
@@ -215,27 +270,30 @@ def edit_timesheet(ts_id):
             for proj, desc, hrs in zip(projects, descriptions, hours_list):
                 if not proj.strip() or not hrs.strip():
                     continue
-                entry = TimesheetEntry(
-                    timesheet_id=timesheet.id,
-                    date=day_date,
-                    clock_in=clock_in,
-                    clock_out=clock_out,
-                    project=proj.strip(),
-                    description=desc.strip(),
-                    hours=float(hrs)
-                )
-                db.session.add(entry)
+                rows.append({
+                    'date': day_date,
+                    'clock_in': clock_in,
+                    'clock_out': clock_out,
+                    'project': proj.strip(),
+                    'description': desc.strip(),
+                    'hours': float(hrs)
+                })
+
+        # Write only the rows that differ from what is stored
+        if any(save_week_entries(timesheet.id, rows, timesheet.week_start).values()):
+            timesheet.refresh_totals()
 
         new_status = request.form.get('status')
-        timesheet.status = new_status
-        if new_status == 'submitted':
-            timesheet.submitted_at = datetime.utcnow()
-            timesheet.approved_at = None
-        elif new_status == 'approved':
-            timesheet.approved_at = datetime.utcnow()
-        else:
-            timesheet.submitted_at = None
-            timesheet.approved_at = None
+        if timesheet.status != new_status:
+            timesheet.status = new_status
+            if new_status == 'submitted':
+                timesheet.submitted_at = datetime.utcnow()
+                timesheet.approved_at = None
+            elif new_status == 'approved':
+                timesheet.approved_at = datetime.utcnow()
+            else:
+                timesheet.submitted_at = None
+                timesheet.approved_at = None
 
         try:
             db.session.commit()
@@ -247,80 +305,192 @@ def edit_timesheet(ts_id):
 
         return redirect(url_for('admin.view_timesheets'))
 
-    # GET: fetch entries grouped by day for form display
-    entries_by_date = []
-    for day_date in week_dates:
-        day_entries = TimesheetEntry.query.filter_by(timesheet_id=timesheet.id, date=day_date).all()
-        entries_by_date.append({'date': day_date, 'entries': day_entries})
-
-    return render_template('admin/admin_timesheet_form.html', timesheet=timesheet, entries=entries_by_date)
+    # GET: entries grouped by day for form display
+    grid = WeekGrid(timesheet, num_days=len(week_dates))
+    return render_template('admin/admin_timesheet_form.html', timesheet=timesheet, entries=grid.days)
 
 
 @admin_bp.route("/timesheets/export")
 @login_required
 @admin_required
 def export_timesheets():
-    status_filter = request.args.get("status")
-    start_date_str = request.args.get("start_date")
-    end_date_str = request.args.get("end_date")
+    try:
+        status_filter, start_date, end_date, _ = parse_timesheet_filters(request.args)
+    except ValueError:
+        flash("Invalid date format. Use YYYY-MM-DD.", "warning")
+        return redirect(url_for("admin.view_timesheets"))
 
-    today = datetime.today().date()
-    max_allowed_date = today.replace(day=monthrange(today.year, today.month)[1])
-    default_start = today.replace(day=1)
-    default_end = max_allowed_date
+    query = admin_export_query(status_filter, start_date, end_date)
+    rows = admin_export_rows(query, start_date, end_date)
+    if request.args.get("include_archived"):
+        rows = chain(rows, entry_archive.export_rows(status_filter, start_date, end_date))
+    return csv_response(ADMIN_EXPORT_HEADER, rows, 'timesheets_export.csv')
 
+
+@admin_bp.route("/timesheets/export/changes")
+@login_required
+@admin_required
+def export_timesheet_changes():
+    """
+    Entries created, changed or deleted since `cursor` as CSV, or every entry
+    without one. The cursor for the next call is in the X-Next-Cursor header.
+    """
+    try:
+        rows, next_cursor = change_feed.change_rows(request.args.get("cursor") or None)
+    except ValueError as e:
+        abort(400, description=str(e))
+    response = csv_response(change_feed.CHANGE_EXPORT_HEADER, rows, 'timesheet_changes.csv')
+    response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+@admin_bp.route("/reports/projects")
+@login_required
+@admin_required
+def project_report():
+    params = parse_report_params(request.args)
+    clamped = params.pop("clamped")
+    if clamped:
+        flash(clamped, "warning")
+    return render_template("admin/admin_project_report.html", report=build_project_report(**params), params=params)
+
+
+@admin_bp.route("/reports/projects/export")
+@login_required
+@admin_required
+def export_project_report():
+    params = parse_report_params(request.args)
+    clamped = params.pop("clamped")
+    report = build_project_report(**params)
+    response = csv_response(report.csv_header(), report.csv_rows(),
+                            f"project_hours_{params['start']:%Y-%m-%d}_{params['end']:%Y-%m-%d}.csv")
+    if clamped:
+        response.headers["X-Report-Clamped"] = clamped
+    return response
+
+
+@admin_bp.route("/entries/search")
+@login_required
+@admin_required
+def search_entries():
+    q = request.args.get("q", "").strip()
+    username = request.args.get("username", "").strip()
+    status_filter = request.args.get("status") or None
+    results = None
     try:
-        if start_date_str:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
-            if start_date > max_allowed_date:
-                start_date = max_allowed_date
-        else:
-            start_date = default_start
-
-        if end_date_str:
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d").date()
-            if end_date > max_allowed_date:
-                end_date = max_allowed_date
-        else:
-            end_date = default_end
+        start_date = datetime.strptime(request.args["start_date"], "%Y-%m-%d").date() if request.args.get("start_date") else None
+        end_date = datetime.strptime(request.args["end_date"], "%Y-%m-%d").date() if request.args.get("end_date") else None
     except ValueError:
         flash("Invalid date format. Use YYYY-MM-DD.", "warning")
-        return redirect(url_for("admin.view_timesheets"))
+        start_date = end_date = None
+
+    if q:
+        user_ids = None
+        if username:
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                flash(f"No user named {username}.", "warning")
+            user_ids = [user.id] if user else []
+        results = entry_search.search(q, user_ids=user_ids, status=status_filter, start_date=start_date,
+                                      end_date=end_date, page=max(request.args.get("page", 1, type=int), 1))
 
-    query = Timesheet.query.order_by(Timesheet.week_start.desc())
-
-    if status_filter:
-        query = query.filter_by(status=status_filter)
-
-    query = query.filter(Timesheet.week_start >= start_date, Timesheet.week_start <= end_date)
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-
-    writer.writerow([
-        "Timesheet ID", "User", "Week Start", "Status", "Submitted At", "Approved At",
-        "Entry Date", "Clock In", "Clock Out", "Project", "Description", "Hours"
-    ])
-
-    timesheets = query.all()
-    for ts in timesheets:
-        for entry in ts.entries:
-            writer.writerow([
-                ts.id, ts.user.username, ts.week_start, ts.status,
-                ts.submitted_at, ts.approved_at,
-                entry.date, entry.clock_in, entry.clock_out,
-                entry.project, entry.description, entry.hours
-            ])
-
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode()),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name='timesheets_export.csv'
+    return render_template(
+        "admin/admin_entry_search.html",
+        results=results,
+        q=q,
+        username=username,
+        status_filter=status_filter,
+        start_date=start_date.strftime("%Y-%m-%d") if start_date else "",
+        end_date=end_date.strftime("%Y-%m-%d") if end_date else "",
     )
 
 
+@admin_bp.route("/timesheets/export/jobs", methods=["POST"])
+@login_required
+@admin_required
+def start_export_job():
+    try:
+        status_filter, start_date, end_date, _ = parse_timesheet_filters(request.form)
+    except ValueError:
+        flash("Invalid date format. Use YYYY-MM-DD.", "warning")
+        return redirect(url_for("admin.view_timesheets"))
+
+    filters = {
+        "status": status_filter or None,
+        "start_date": start_date.isoformat(),
+        "end_date": end_date.isoformat(),
+        "include_archived": bool(request.form.get("include_archived")),
+    }
+    job = export_jobs.enqueue("admin_timesheets", filters, requested_by=current_user.id)
+    return redirect(url_for("admin.view_export_job", job_id=job["id"]))
+
+
+@admin_bp.route("/timesheets/export/jobs/<job_id>")
+@login_required
+@admin_required
+def view_export_job(job_id):
+    job = export_jobs.get_job(job_id)
+    if not job:
+        abort(404)
+    if request.args.get("format") == "json":
+        return jsonify(dict(job, progress=export_jobs.progress(job)))
+    if job["kind"] == "user_import":
+        return render_template("admin/admin_user_import_job.html", job=job, progress=export_jobs.progress(job),
+                               summary=_import_summary(job))
+    return render_template("admin/admin_export_job.html", job=job, progress=export_jobs.progress(job))
+
+
+@admin_bp.route("/timesheets/export/jobs/<job_id>/download")
+@login_required
+@admin_required
+def download_export_job(job_id):
+    job = export_jobs.get_job(job_id)
+    if not job or job["status"] != "done":
+        abort(404)
+    return send_file(export_jobs.artifact_path(job_id), mimetype="text/csv",
+                     as_attachment=True, download_name=JOB_DOWNLOAD_NAMES[job["kind"]])
+
+
+@admin_bp.route("/users/import", methods=["GET", "POST"])
+@login_required
+@admin_required
+def import_users():
+    """Upload a CSV/JSON file of users; the import runs as a background job."""
+    if request.method == "POST":
+        upload = request.files.get("file")
+        fmt = os.path.splitext(upload.filename)[1].lower().lstrip(".") if upload and upload.filename else ""
+        if fmt not in ("csv", "json"):
+            flash("Choose a .csv or .json file.", "warning")
+            return redirect(url_for("admin.import_users"))
+        data = upload.read(current_app.config["IMPORT_MAX_BYTES"] + 1)
+        if len(data) > current_app.config["IMPORT_MAX_BYTES"]:
+            flash("The file is too large to import.", "warning")
+            return redirect(url_for("admin.import_users"))
+        try:
+            user_import.read_rows(data, fmt)
+        except ValueError as e:
+            flash(f"Could not read the file: {e}", "danger")
+            return redirect(url_for("admin.import_users"))
+
+        filters = {
+            "upload": export_jobs.save_upload(data, fmt),
+            "format": fmt,
+            "dry_run": bool(request.form.get("dry_run")),
+        }
+        job = export_jobs.enqueue("user_import", filters, requested_by=current_user.id)
+        return redirect(url_for("admin.view_export_job", job_id=job["id"]))
+
+    return render_template("admin/admin_user_import.html", fields=user_import.FIELDS, roles=user_import.ROLES)
+
+
+def _import_summary(job):
+    """Count of report rows per result ('created', 'error', ...) once an import has finished."""
+    if job["status"] != "done":
+        return None
+    with open(export_jobs.artifact_path(job["id"]), newline="") as f:
+        return Counter(row["Result"] for row in csv.DictReader(f))
+
+
 @admin_bp.route('/timesheet/delete/<int:timesheet_id>', methods=['POST'])
 @login_required
 @admin_required
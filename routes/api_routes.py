@@ -0,0 +1,402 @@
+from flask import Blueprint, Response, request, jsonify, abort, url_for
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+from extensions import db
+from models import User, Timesheet
+from pagination import keyset_paginate
+from weekly_timesheet import save_week_entries
+from entry_archive import week_entries
+from project_catalog import project_index
+from org_tree import scope_to_reports, report_ids
+from utils import roles_required
+from datetime import datetime, date, time, timedelta
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+import entry_search
+import hashlib
+import logging
+
+api_bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+MAX_PER_PAGE = 100
+
+
+@api_bp.errorhandler(HTTPException)
+def json_error(e):
+    return jsonify(error=e.name, message=e.description), e.code
+
+
+# --- helpers -----------------------------------------------------------------
+
+def _timesheet_etag(ts_id, version):
+    return f'ts-{ts_id}-v{version}'
+
+
+def _conditional(etag, build):
+    """
+    Answer a GET with 304 when If-None-Match already holds `etag`; otherwise
+    call `build()` for the JSON body. The ETag is computed from row versions
+    before anything else is loaded, so an unchanged poll costs one small query.
+    """
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # Bodies depend on who is asking; clients must revalidate before reuse
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
+
+def _check_if_match(ts):
+    """Reject a write with 412 when If-Match names an older version of `ts`."""
+    if request.if_match and not request.if_match.contains(_timesheet_etag(ts.id, ts.version)):
+        abort(412, description='Timesheet has changed since it was read; reload and retry.')
+
+
+def _can_view(user_id):
+    if current_user.role == 'admin':
+        return True
+    if current_user.role == 'manager':
+        return user_id in report_ids(current_user.id)
+    return user_id == current_user.id
+
+
+def _get_timesheet(ts_id):
+    timesheet = db.session.get(Timesheet, ts_id)
+    if timesheet is None:
+        abort(404, description='Timesheet not found.')
+    if not _can_view(timesheet.user_id):
+        abort(403)
+    return timesheet
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+def _timesheet_json(ts, username):
+    return {
+        'id': ts.id,
+        'user_id': ts.user_id,
+        'username': username,
+        'week_start': _iso(ts.week_start),
+        'status': ts.status,
+        'submitted_at': _iso(ts.submitted_at),
+        'approved_at': _iso(ts.approved_at),
+        'manager_comments': ts.manager_comments,
+        'total_hours': ts.total_hours,
+        'entry_count': ts.entry_count,
+        'version': ts.version,
+        'updated_at': _iso(ts.updated_at),
+        'url': url_for('api.get_timesheet', ts_id=ts.id),
+    }
+
+
+def _timesheet_detail(ts):
+    entries = week_entries(ts)
+    data = _timesheet_json(ts, ts.user.username)
+    data['entries'] = [{
+        'id': e.id,
+        'date': _iso(e.date),
+        'clock_in': e.clock_in.strftime('%H:%M') if e.clock_in else None,
+        'clock_out': e.clock_out.strftime('%H:%M') if e.clock_out else None,
+        'project': e.project,
+        'description': e.description,
+        'hours': e.hours,
+    } for e in entries]
+    return data
+
+
+def _detail_response(ts, status=200):
+    response = jsonify(_timesheet_detail(ts))
+    response.status_code = status
+    response.set_etag(_timesheet_etag(ts.id, ts.version))
+    return response
+
+
+def _parse_date(value, field):
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        abort(400, description=f'{field} must be a date in YYYY-MM-DD format.')
+
+
+def _parse_time(value, field):
+    if not value:
+        return None
+    try:
+        return time.fromisoformat(value)
+    except (TypeError, ValueError):
+        abort(400, description=f'{field} must be a time in HH:MM format.')
+
+
+def _parse_entries(timesheet, payload):
+    """Validate the `entries` list of a save-week body into save_week_entries() rows."""
+    if not isinstance(payload, dict) or not isinstance(payload.get('entries'), list):
+        abort(400, description='Body must be a JSON object with an "entries" list.')
+
+    week_end = timesheet.week_start + timedelta(days=6)
+    rows = []
+    for i, entry in enumerate(payload['entries']):
+        if not isinstance(entry, dict):
+            abort(400, description=f'entries[{i}] must be an object.')
+        day = _parse_date(entry.get('date'), f'entries[{i}].date')
+        if not timesheet.week_start <= day <= week_end:
+            abort(400, description=f'entries[{i}].date is outside the timesheet week.')
+        project = (entry.get('project') or '').strip()
+        if not project:
+            abort(400, description=f'entries[{i}].project is required.')
+        try:
+            hours = float(entry.get('hours'))
+        except (TypeError, ValueError):
+            abort(400, description=f'entries[{i}].hours must be a number.')
+        if hours < 0:
+            abort(400, description=f'entries[{i}].hours cannot be negative.')
+        rows.append({
+            'date': day,
+            'clock_in': _parse_time(entry.get('clock_in'), f'entries[{i}].clock_in'),
+            'clock_out': _parse_time(entry.get('clock_out'), f'entries[{i}].clock_out'),
+            'project': project,
+            'description': (entry.get('description') or '').strip(),
+            'hours': hours,
+        })
+    return rows
+
+
+def _commit(action, ts_id):
+    try:
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"DB error on API {action} of timesheet {ts_id}: {e}")
+        abort(500, description='Database error; please retry.')
+
+
+# --- endpoints ---------------------------------------------------------------
+
+@api_bp.route('/timesheets')
+@roles_required('employee', 'manager', 'admin')
+def list_timesheets():
+    """
+    Timesheets visible to the caller, newest week first, filtered by
+    status, start_date, end_date and (for managers and admins) user_id.
+    Paged with the `after` / `before` cursors returned in the body.
+    """
+    query = Timesheet.query
+    if current_user.role == 'employee':
+        query = query.filter(Timesheet.user_id == current_user.id)
+    elif current_user.role == 'manager':
+        query = scope_to_reports(query, current_user.id)
+
+    if request.args.get('user_id') and current_user.role != 'employee':
+        query = query.filter(Timesheet.user_id == request.args.get('user_id', type=int))
+    if request.args.get('status'):
+        query = query.filter(Timesheet.status == request.args['status'])
+    if request.args.get('start_date'):
+        query = query.filter(Timesheet.week_start >= _parse_date(request.args['start_date'], 'start_date'))
+    if request.args.get('end_date'):
+        query = query.filter(Timesheet.week_start <= _parse_date(request.args['end_date'], 'end_date'))
+
+    per_page = min(request.args.get('per_page', default=20, type=int) or 20, MAX_PER_PAGE)
+
+    # Page over (week_start, id, version) only; the ETag is a digest of these
+    # keys, and full rows are loaded only when the client's copy is stale.
+    page = keyset_paginate(query.with_entities(Timesheet.week_start, Timesheet.id, Timesheet.version),
+                           [Timesheet.week_start, Timesheet.id], descending=True,
+                           after=request.args.get('after'), before=request.args.get('before'),
+                           per_page=per_page)
+    digest = hashlib.sha256(repr((
+        [(k.id, k.version) for k in page.items], page.next_cursor, page.prev_cursor
+    )).encode()).hexdigest()[:32]
+
+    def build():
+        ids = [k.id for k in page.items]
+        rows = (
+            db.session.query(Timesheet, User.username)
+            .join(User, User.id == Timesheet.user_id)
+            .filter(Timesheet.id.in_(ids))
+            .all()
+        )
+        by_id = {ts.id: _timesheet_json(ts, username) for ts, username in rows}
+        return {
+            'items': [by_id[i] for i in ids if i in by_id],
+            'next_cursor': page.next_cursor,
+            'prev_cursor': page.prev_cursor,
+        }
+
+    return _conditional(f'list-{digest}', build)
+
+
+@api_bp.route('/timesheets', methods=['POST'])
+@roles_required('employee')
+def create_timesheet():
+    payload = request.get_json(silent=True) or {}
+    week_start = _parse_date(payload.get('week_start'), 'week_start')
+    week_start -= timedelta(days=week_start.weekday())
+
+    existing = Timesheet.query.filter_by(user_id=current_user.id, week_start=week_start).first()
+    if existing:
+        return _detail_response(existing)
+
+    timesheet = Timesheet(user_id=current_user.id, week_start=week_start, status='draft')
+    db.session.add(timesheet)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Created concurrently; uq_timesheets_user_week kept one row
+        db.session.rollback()
+        existing = Timesheet.query.filter_by(user_id=current_user.id, week_start=week_start).first_or_404()
+        return _detail_response(existing)
+    return _detail_response(timesheet, status=201)
+
+
+@api_bp.route('/timesheets/<int:ts_id>')
+@roles_required('employee', 'manager', 'admin')
+def get_timesheet(ts_id):
+    key = db.session.query(Timesheet.user_id, Timesheet.version).filter(Timesheet.id == ts_id).first()
+    if key is None:
+        abort(404, description='Timesheet not found.')
+    if not _can_view(key.user_id):
+        abort(403)
+    return _conditional(_timesheet_etag(ts_id, key.version),
+                        lambda: _timesheet_detail(db.session.get(Timesheet, ts_id)))
+
+
+@api_bp.route('/timesheets/<int:ts_id>/entries', methods=['PUT'])
+@roles_required('employee', 'admin')
+def save_week(ts_id):
+    """
+    Replace the week's entries with the posted list. Employees may edit their
+    own unapproved timesheets, which returns them to draft; admins may edit
+    any unarchived timesheet without changing its status.
+    """
+    timesheet = _get_timesheet(ts_id)
+    if current_user.role == 'employee':
+        if timesheet.user_id != current_user.id:
+            abort(403)
+        if timesheet.status == 'approved':
+            abort(409, description='Approved timesheets cannot be edited.')
+    if timesheet.archived_at:
+        abort(409, description='Archived timesheets cannot be edited.')
+    _check_if_match(timesheet)
+
+    rows = _parse_entries(timesheet, request.get_json(silent=True))
+    if any(save_week_entries(timesheet.id, rows, timesheet.week_start).values()):
+        timesheet.refresh_totals()
+    if current_user.role == 'employee' and timesheet.status != 'draft':
+        timesheet.status = 'draft'
+        timesheet.submitted_at = None
+    _commit('save', ts_id)
+    return _detail_response(timesheet)
+
+
+@api_bp.route('/timesheets/<int:ts_id>/submit', methods=['POST'])
+@roles_required('employee')
+def submit_timesheet(ts_id):
+    timesheet = _get_timesheet(ts_id)
+    if timesheet.user_id != current_user.id:
+        abort(403)
+    _check_if_match(timesheet)
+    if timesheet.status not in ('draft', 'rejected'):
+        abort(409, description=f'Cannot submit a timesheet that is {timesheet.status}.')
+    if timesheet.week_start > datetime.utcnow().date():
+        abort(409, description='Cannot submit timesheet for a future week.')
+    if not timesheet.total_hours:
+        abort(409, description='Cannot submit empty timesheets.')
+
+    timesheet.status = 'submitted'
+    timesheet.submitted_at = datetime.utcnow()
+    _commit('submit', ts_id)
+    return _detail_response(timesheet)
+
+
+def _review(ts_id, action):
+    timesheet = _get_timesheet(ts_id)
+    _check_if_match(timesheet)
+    if timesheet.status != 'submitted':
+        abort(409, description=f'Cannot {action} a timesheet that is {timesheet.status}.')
+
+    payload = request.get_json(silent=True) or {}
+    comment = (payload.get('manager_comments') or '').strip()
+    if action == 'reject' and not comment:
+        abort(400, description='manager_comments is required to reject a timesheet.')
+
+    timesheet.manager_comments = comment
+    if action == 'approve':
+        timesheet.status = 'approved'
+        timesheet.approved_at = datetime.utcnow()
+    else:
+        timesheet.status = 'rejected'
+    _commit(action, ts_id)
+    return _detail_response(timesheet)
+
+
+@api_bp.route('/timesheets/<int:ts_id>/approve', methods=['POST'])
+@roles_required('manager')
+def approve_timesheet(ts_id):
+    return _review(ts_id, 'approve')
+
+
+@api_bp.route('/timesheets/<int:ts_id>/reject', methods=['POST'])
+@roles_required('manager')
+def reject_timesheet(ts_id):
+    return _review(ts_id, 'reject')
+
+
+@api_bp.route('/entries/search')
+@roles_required('employee', 'manager', 'admin')
+def search_entries():
+    """
+    Entries visible to the caller whose project or description match `q`,
+    best match first, filtered by user_id, status, start_date and end_date
+    (entry dates). Paged with `page`; archived weeks are not searched.
+    """
+    q = (request.args.get('q') or '').strip()
+    if not entry_search.search_terms(q):
+        abort(400, description='q must contain at least one word.')
+
+    user_ids = None
+    if current_user.role == 'employee':
+        user_ids = {current_user.id}
+    elif current_user.role == 'manager':
+        user_ids = report_ids(current_user.id)
+    if request.args.get('user_id') and current_user.role != 'employee':
+        user_id = request.args.get('user_id', type=int)
+        user_ids = {user_id} if user_ids is None or user_id in user_ids else set()
+
+    start_date = _parse_date(request.args['start_date'], 'start_date') if request.args.get('start_date') else None
+    end_date = _parse_date(request.args['end_date'], 'end_date') if request.args.get('end_date') else None
+    page = max(request.args.get('page', default=1, type=int) or 1, 1)
+    per_page = min(request.args.get('per_page', default=20, type=int) or 20, MAX_PER_PAGE)
+
+    results = entry_search.search(q, user_ids=user_ids, status=request.args.get('status') or None,
+                                  start_date=start_date, end_date=end_date, page=page, per_page=per_page)
+    return jsonify({
+        'items': [{
+            'id': hit.id,
+            'date': _iso(hit.date),
+            'project': hit.project,
+            'description': hit.description,
+            'hours': hit.hours,
+            'timesheet_id': hit.timesheet_id,
+            'week_start': _iso(hit.week_start),
+            'status': hit.status,
+            'user_id': hit.user_id,
+            'username': hit.username,
+            'score': hit.score,
+            'timesheet_url': url_for('api.get_timesheet', ts_id=hit.timesheet_id),
+        } for hit in results.items],
+        'page': page,
+        'next_page': page + 1 if results.has_next else None,
+    })
+
+
+@api_bp.route('/projects')
+@roles_required('employee', 'manager', 'admin')
+def list_projects():
+    """Projects with a word starting with `q`, for autocomplete; served from the in-memory index."""
+    q = (request.args.get('q') or '').strip()
+    limit = min(request.args.get('limit', default=10, type=int) or 10, MAX_PER_PAGE)
+    return jsonify({'items': [{'id': project_id, 'name': name}
+                              for project_id, name in project_index.complete(q, limit=limit)]})
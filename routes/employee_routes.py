@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, Response
 from flask_login import login_required, current_user
 from extensions import db
-from models import Timesheet, TimesheetEntry
+from models import Timesheet
+from pagination import keyset_paginate
+from weekly_timesheet import save_week_entries, WeekGrid
 from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
 
 employee_bp = Blueprint('employee', __name__, url_prefix='/employee')
 
@@ -52,13 +55,15 @@ def timesheet_view():
     except ValueError:
         end = None
 
-    timesheets = query.order_by(Timesheet.week_start.desc()).all()
+    page = keyset_paginate(query, [Timesheet.week_start, Timesheet.id], descending=True,
+                           after=request.args.get('after'), before=request.args.get('before'))
 
     max_date = datetime.utcnow().date().strftime('%Y-%m-%d')
 
     return render_template(
         'employee/timesheet_list.html',
-        timesheets=timesheets,
+        timesheets=page.items,
+        page=page,
         status_filter=status_filter,
         start_date=start_date,
         end_date=end_date,
@@ -87,7 +92,13 @@ def new_timesheet():
 
         new_ts = Timesheet(user_id=current_user.id, week_start=week_start, status='draft')
         db.session.add(new_ts)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Created concurrently (e.g. double submit); uq_timesheets_user_week kept one row
+            db.session.rollback()
+            existing = Timesheet.query.filter_by(user_id=current_user.id, week_start=week_start).first_or_404()
+            return redirect(url_for('employee.edit_timesheet', ts_id=existing.id))
         return redirect(url_for('employee.edit_timesheet', ts_id=new_ts.id))
 
     default_monday = get_monday(datetime.utcnow().date())
@@ -117,9 +128,7 @@ def edit_timesheet(ts_id):
                 flash("Cannot submit timesheet for a future week.", "warning")
                 return redirect(url_for('employee.edit_timesheet', ts_id=timesheet.id))
 
-        # Remove existing entries to replace
-        TimesheetEntry.query.filter_by(timesheet_id=timesheet.id).delete()
-
+        rows = []
         total_hours = 0.0  # track total hours
 
         for i, day_date in enumerate(week_dates):
@@ -143,46 +152,35 @@ def edit_timesheet(ts_id):
 
                 total_hours += hrs_float
 
-                entry = TimesheetEntry(
-                    timesheet_id=timesheet.id,
-                    date=day_date,
-                    clock_in=clock_in,
-                    clock_out=clock_out,
-                    project=proj.strip(),
-                    description=desc.strip(),
-                    hours=hrs_float
-                )
-                db.session.add(entry)
+                rows.append({
+                    'date': day_date,
+                    'clock_in': clock_in,
+                    'clock_out': clock_out,
+                    'project': proj.strip(),
+                    'description': desc.strip(),
+                    'hours': hrs_float
+                })
 
         # Prevent submit if total hours is zero
         if action == 'submit' and total_hours == 0:
             flash("Cannot submit empty timesheets.", "warning")
-            db.session.rollback()  # Undo added entries
             return redirect(url_for('employee.edit_timesheet', ts_id=timesheet.id))
 
-        timesheet.status = 'submitted' if action == 'submit' else 'draft'
-        timesheet.submitted_at = datetime.utcnow() if action == 'submit' else None
+        # Write only the rows that differ from what is stored
+        if any(save_week_entries(timesheet.id, rows, timesheet.week_start).values()):
+            timesheet.refresh_totals()
+        new_status = 'submitted' if action == 'submit' else 'draft'
+        if timesheet.status != new_status:
+            timesheet.status = new_status
+            timesheet.submitted_at = datetime.utcnow() if action == 'submit' else None
         db.session.commit()
 
         flash(f'Timesheet {"submitted for approval" if action == "submit" else "saved as draft"}.', 'success')
         return redirect(url_for('employee.timesheet_view'))
 
     # GET: show entries by date
-    entries_by_date = []
-    for day_date in week_dates:
-        day_entries = TimesheetEntry.query.filter_by(timesheet_id=timesheet.id, date=day_date).all()
-        entries_by_date.append({'date': day_date, 'entries': day_entries})
-
-    return render_template('employee/edit_weekly_timesheet.html', timesheet=timesheet, entries=entries_by_date)
-
-
-    # GET: show entries by date
-    entries_by_date = []
-    for day_date in week_dates:
-        day_entries = TimesheetEntry.query.filter_by(timesheet_id=timesheet.id, date=day_date).all()
-        entries_by_date.append({'date': day_date, 'entries': day_entries})
-
-    return render_template('employee/edit_weekly_timesheet.html', timesheet=timesheet, entries=entries_by_date)
+    grid = WeekGrid(timesheet, num_days=len(week_dates))
+    return render_template('employee/edit_weekly_timesheet.html', timesheet=timesheet, entries=grid.days)
 
 @employee_bp.route('/timesheets/delete/<int:ts_id>', methods=['POST'])
 @login_required
@@ -209,16 +207,8 @@ def view_timesheet(ts_id):
         flash('Unauthorized access.', 'danger')
         return redirect(url_for('employee.timesheet_view'))
 
-    week_dates = [timesheet.week_start + timedelta(days=i) for i in range(7)]
-    entries_by_date = []
-    total_hours = 0
-    for day_date in week_dates:
-        day_entries = TimesheetEntry.query.filter_by(timesheet_id=timesheet.id, date=day_date).all()
-        entries_by_date.append({'date': day_date, 'entries': day_entries})
-        for e in day_entries:
-            total_hours += e.hours if e.hours else 0
-
-    return render_template('employee/view_timesheet.html', timesheet=timesheet, entries=entries_by_date, total_hours=total_hours)
+    grid = WeekGrid(timesheet, num_days=7)
+    return render_template('employee/view_timesheet.html', timesheet=timesheet, entries=grid.days, total_hours=grid.total_hours)
 
 @employee_bp.route('/timesheets/export')
 @login_required
@@ -254,13 +244,12 @@ def export_timesheets():
     cw = csv.writer(si)
     cw.writerow(['ID', 'Week Start', 'Status', 'Submitted At', 'Total Hours', 'Manager Comments'])
     for ts in timesheets:
-        total_hours = sum(e.hours for e in ts.entries)
         cw.writerow([
             ts.id,
             ts.week_start.strftime('%Y-%m-%d'),
             ts.status,
             ts.submitted_at.strftime('%Y-%m-%d %H:%M') if ts.submitted_at else '',
-            total_hours,
+            ts.total_hours,
             ts.manager_comments or ''
         ])
 
@@ -1,14 +1,15 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, Response
-from flask_login import login_required
+from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask_login import login_required, current_user
 from extensions import db
-from models import Timesheet
+from models import User, Project, Timesheet, TimesheetEntry
+from timesheet_queries import timesheet_summaries, entry_export_rows
+from weekly_timesheet import WeekGrid
+from org_tree import scope_to_reports, manages, report_ids
+from reporting import build_project_report, parse_report_params, sync_status
 from datetime import datetime, timedelta
-from utils import role_required
-from collections import defaultdict
+from utils import role_required, csv_response
 from sqlalchemy.exc import SQLAlchemyError
 import logging
-import csv
-from io import StringIO
 
 manager_bp = Blueprint('manager', __name__, template_folder='templates/manager')
 
@@ -22,36 +23,16 @@ def get_month_start_end(today=None):
         end = start.replace(month=start.month + 1, day=1) - timedelta(days=1)
     return start, end
 
-def get_clockin_clockout_summary(timesheet):
-    day_times = defaultdict(lambda: {'clock_in': None, 'clock_out': None})
-
-    for e in timesheet.entries:
-        d = e.date.strftime('%Y-%m-%d')
-        ci = e.clock_in.strftime('%H:%M') if e.clock_in else None
-        co = e.clock_out.strftime('%H:%M') if e.clock_out else None
-
-        if ci:
-            if (day_times[d]['clock_in'] is None) or (ci < day_times[d]['clock_in']):
-                day_times[d]['clock_in'] = ci
-        if co:
-            if (day_times[d]['clock_out'] is None) or (co > day_times[d]['clock_out']):
-                day_times[d]['clock_out'] = co
-
-    parts = []
-    for day, times in sorted(day_times.items()):
-        ci = times['clock_in'] or '-'
-        co = times['clock_out'] or '-'
-        parts.append(f"{day}: {ci} - {co}")
-
-    return "; ".join(parts)
-
 @manager_bp.route('/dashboard')
 @login_required
 @role_required('manager')
 def manager_dashboard():
     try:
         # Pending timesheets (status = submitted)
-        pending_timesheets = Timesheet.query.filter_by(status='submitted').order_by(Timesheet.week_start.desc()).all()
+        # Only timesheets of this manager's reports
+        pending_query = scope_to_reports(Timesheet.query.filter_by(status='submitted'), current_user.id)
+        pending_query = pending_query.order_by(Timesheet.week_start.desc())
+        pending_timesheets = timesheet_summaries(pending_query)
         pending_count = len(pending_timesheets)
     except SQLAlchemyError as e:
         logging.error(f"DB error fetching pending timesheets: {e}")
@@ -73,6 +54,7 @@ def manager_dashboard():
             end_date = month_end.strftime('%Y-%m-%d')
 
     history_query = Timesheet.query.filter(Timesheet.status.in_(['approved', 'rejected']))
+    history_query = scope_to_reports(history_query, current_user.id)
 
     if status_filter in ['approved', 'rejected']:
         history_query = history_query.filter(Timesheet.status == status_filter)
@@ -89,11 +71,9 @@ def manager_dashboard():
     except ValueError:
         end = None
 
-    history_timesheets = history_query.order_by(Timesheet.week_start.desc()).all()
-
-    # Add clock-in/out summaries to each history timesheet
-    for ts in history_timesheets:
-        ts.clockin_clockout_summary = get_clockin_clockout_summary(ts)
+    # Usernames, totals and clock-in/out summaries come from a fixed number of queries
+    history_timesheets = timesheet_summaries(history_query.order_by(Timesheet.week_start.desc()),
+                                             first_week=start, last_week=end)
 
     max_date = datetime.utcnow().date().strftime('%Y-%m-%d')
 
@@ -112,55 +92,15 @@ def manager_dashboard():
 @role_required('manager')
 def view_timesheet(timesheet_id):
     timesheet = Timesheet.query.get_or_404(timesheet_id)
+    if not manages(current_user.id, timesheet):
+        flash('This timesheet belongs to someone outside your team.', 'warning')
+        return redirect(url_for('manager.manager_dashboard'))
     if timesheet.status not in ['submitted', 'approved']:
         flash('Timesheet is not in a viewable state.', 'warning')
         return redirect(url_for('manager.manager_dashboard'))
 
-    grouped_entries = defaultdict(list)
-    daily_totals = defaultdict(float)
-    daily_clock_times = {}  # store single clock_in/out per day
-    grand_total = 0.0
-
-    for e in timesheet.entries:
-        date_key = e.date.strftime('%Y-%m-%d')
-        hours = float(e.hours) if e.hours else 0.0
-
-        # Collect project entries
-        grouped_entries[date_key].append({
-            'project': e.project or "",
-            'description': e.description or "",
-            'hours': hours,
-        })
-
-        daily_totals[date_key] += hours
-        grand_total += hours
-
-        # Find earliest clock_in and latest clock_out for the day
-        ci = e.clock_in
-        co = e.clock_out
-        if date_key not in daily_clock_times:
-            daily_clock_times[date_key] = {'clock_in': ci, 'clock_out': co}
-        else:
-            # Update earliest clock_in
-            if ci and (daily_clock_times[date_key]['clock_in'] is None or ci < daily_clock_times[date_key]['clock_in']):
-                daily_clock_times[date_key]['clock_in'] = ci
-            # Update latest clock_out
-            if co and (daily_clock_times[date_key]['clock_out'] is None or co > daily_clock_times[date_key]['clock_out']):
-                daily_clock_times[date_key]['clock_out'] = co
-
-    sorted_dates = sorted(grouped_entries.keys())
-
-    return render_template(
-        'manager/view_timesheet.html',
-        timesheet=timesheet,
-        grouped_entries=grouped_entries,
-        daily_totals=daily_totals,
-        daily_clock_times=daily_clock_times,
-        grand_total=grand_total,
-        sorted_dates=sorted_dates
-    )
-
-
+    grid = WeekGrid(timesheet, num_days=7)
+    return render_template('manager/view_timesheet.html', timesheet=timesheet, grid=grid)
 
 
 @manager_bp.route('/timesheets/approve/<int:timesheet_id>', methods=['POST'])
@@ -174,6 +114,10 @@ def approve_timesheet(timesheet_id):
         flash("Error fetching timesheet. Please try again later.", "danger")
         return redirect(url_for('manager.manager_dashboard'))
 
+    if not manages(current_user.id, timesheet):
+        flash('This timesheet belongs to someone outside your team.', 'warning')
+        return redirect(url_for('manager.manager_dashboard'))
+
     if timesheet.status != 'submitted':
         flash('Cannot approve timesheet that is not submitted.', 'warning')
         return redirect(url_for('manager.manager_dashboard'))
@@ -204,6 +148,10 @@ def reject_timesheet(timesheet_id):
         flash("Error fetching timesheet. Please try again later.", "danger")
         return redirect(url_for('manager.manager_dashboard'))
 
+    if not manages(current_user.id, timesheet):
+        flash('This timesheet belongs to someone outside your team.', 'warning')
+        return redirect(url_for('manager.manager_dashboard'))
+
     if timesheet.status != 'submitted':
         flash('Cannot reject timesheet that is not submitted.', 'warning')
         return redirect(url_for('manager.manager_dashboard'))
@@ -222,6 +170,65 @@ def reject_timesheet(timesheet_id):
     return redirect(url_for('manager.manager_dashboard'))
 
 
+@manager_bp.route('/timesheets/bulk', methods=['POST'])
+@login_required
+@role_required('manager')
+def bulk_review_timesheets():
+    action = request.form.get('action')
+    comment = request.form.get('manager_comments', '').strip()
+    try:
+        ids = {int(i) for i in request.form.getlist('timesheet_ids')}
+    except ValueError:
+        ids = set()
+
+    if action not in ('approve', 'reject'):
+        flash('Unknown bulk action.', 'warning')
+        return redirect(url_for('manager.manager_dashboard'))
+    if not ids:
+        flash('Select at least one timesheet.', 'warning')
+        return redirect(url_for('manager.manager_dashboard'))
+    if action == 'reject' and not comment:
+        flash('A comment is required to reject timesheets.', 'warning')
+        return redirect(url_for('manager.manager_dashboard'))
+
+    values = {'status': 'approved' if action == 'approve' else 'rejected',
+              'manager_comments': comment,
+              'version': Timesheet.version + 1,
+              'updated_at': datetime.utcnow()}
+    if action == 'approve':
+        values['approved_at'] = datetime.utcnow()
+
+    # One UPDATE for the whole selection. The status and team conditions are
+    # re-checked by the database, so rows approved, rejected or recalled by
+    # someone else since the page was rendered are left alone and reported.
+    stmt = (
+        db.update(Timesheet)
+        .where(Timesheet.id.in_(ids),
+               Timesheet.status == 'submitted',
+               Timesheet.user_id.in_(report_ids(current_user.id)))
+        .values(**values)
+        .returning(Timesheet.id)
+    )
+    try:
+        updated = set(db.session.execute(stmt, execution_options={'synchronize_session': False}).scalars())
+        sync_status(db.session, updated, values['status'])
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"DB error in bulk {action} of timesheets {sorted(ids)}: {e}")
+        flash("Error updating timesheets. Please try again later.", "danger")
+        return redirect(url_for('manager.manager_dashboard'))
+
+    done = 'approved' if action == 'approve' else 'rejected'
+    if updated:
+        flash(f'{len(updated)} timesheet(s) {done}.', 'success')
+    skipped = sorted(ids - updated)
+    if skipped:
+        flash(f'Skipped {len(skipped)} timesheet(s) that are no longer pending your review: '
+              + ', '.join(f'#{i}' for i in skipped), 'warning')
+    return redirect(url_for('manager.manager_dashboard'))
+
+
 @manager_bp.route('/timesheets/export-history')
 @login_required
 @role_required('manager')
@@ -231,10 +238,12 @@ def export_manager_history():
     end_date = request.args.get('end_date', default='')
 
     history_query = Timesheet.query.filter(Timesheet.status.in_(['approved', 'rejected']))
+    history_query = scope_to_reports(history_query, current_user.id)
 
     if status_filter in ['approved', 'rejected']:
         history_query = history_query.filter(Timesheet.status == status_filter)
 
+    start = end = None
     try:
         if start_date:
             start = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -245,35 +254,58 @@ def export_manager_history():
     except ValueError:
         pass
 
-    timesheets = history_query.order_by(Timesheet.week_start.desc()).all()
-
-    si = StringIO()
-    cw = csv.writer(si)
-    cw.writerow([
+    header = [
         'ID', 'Employee', 'Week Start', 'Status', 'Submitted At', 'Entry Date',
         'Project', 'Description', 'Hours', 'Clock In', 'Clock Out', 'Manager Comments'
-    ])
-
-    for ts in timesheets:
-        for e in ts.entries:
-            cw.writerow([
-                ts.id,
-                ts.user.username if ts.user else 'Unknown',
-                ts.week_start.strftime('%Y-%m-%d'),
-                ts.status,
-                ts.submitted_at.strftime('%Y-%m-%d %H:%M') if ts.submitted_at else '',
-                e.date.strftime('%Y-%m-%d'),
-                e.project or '',
-                e.description or '',
-                e.hours or 0,
-                e.clock_in.strftime('%H:%M') if e.clock_in else '',
-                e.clock_out.strftime('%H:%M') if e.clock_out else '',
-                ts.manager_comments or ''
-            ])
-
-    output = si.getvalue()
-    return Response(
-        output,
-        mimetype='text/csv',
-        headers={'Content-Disposition': 'attachment;filename=manager_timesheets_history.csv'}
+    ]
+    rows = entry_export_rows(
+        history_query,
+        Timesheet.id, User.username, Timesheet.week_start, Timesheet.status, Timesheet.submitted_at,
+        TimesheetEntry.date, Project.name, TimesheetEntry.description, TimesheetEntry.hours,
+        TimesheetEntry.clock_in, TimesheetEntry.clock_out, Timesheet.manager_comments,
+        first_week=start, last_week=end
     )
+    return csv_response(header, (
+        [
+            ts_id,
+            username or 'Unknown',
+            week_start.strftime('%Y-%m-%d'),
+            status,
+            submitted_at.strftime('%Y-%m-%d %H:%M') if submitted_at else '',
+            entry_date.strftime('%Y-%m-%d'),
+            project or '',
+            description or '',
+            hours or 0,
+            clock_in.strftime('%H:%M') if clock_in else '',
+            clock_out.strftime('%H:%M') if clock_out else '',
+            comments or ''
+        ]
+        for (ts_id, username, week_start, status, submitted_at, entry_date,
+             project, description, hours, clock_in, clock_out, comments) in rows
+    ), 'manager_timesheets_history.csv')
+
+
+@manager_bp.route('/reports/projects')
+@login_required
+@role_required('manager')
+def project_report():
+    params = parse_report_params(request.args)
+    clamped = params.pop('clamped')
+    if clamped:
+        flash(clamped, 'warning')
+    report = build_project_report(user_ids=report_ids(current_user.id), **params)
+    return render_template('manager/project_report.html', report=report, params=params)
+
+
+@manager_bp.route('/reports/projects/export')
+@login_required
+@role_required('manager')
+def export_project_report():
+    params = parse_report_params(request.args)
+    clamped = params.pop('clamped')
+    report = build_project_report(user_ids=report_ids(current_user.id), **params)
+    response = csv_response(report.csv_header(), report.csv_rows(),
+                            f"project_hours_{params['start']:%Y-%m-%d}_{params['end']:%Y-%m-%d}.csv")
+    if clamped:
+        response.headers['X-Report-Clamped'] = clamped
+    return response
@@ -0,0 +1,43 @@
+// Suggests catalog project names in the weekly editors' project inputs.
+// Include with data-url pointing at GET /api/v1/projects.
+(() => {
+  const url = document.currentScript.dataset.url;
+  const DELAY_MS = 200;
+  let timer = null;
+  let lastQuery = null;
+
+  const options = document.createElement('datalist');
+  options.id = 'project-options';
+  document.body.appendChild(options);
+
+  const isProjectInput = el => el.matches && el.matches('input[name^="project_"]');
+
+  function fill(items) {
+    options.replaceChildren(...items.map(item => {
+      const option = document.createElement('option');
+      option.value = item.name;
+      return option;
+    }));
+  }
+
+  function suggest(query) {
+    if (query === lastQuery) return;
+    lastQuery = query;
+    if (!query) { fill([]); return; }
+    fetch(`${url}?q=${encodeURIComponent(query)}`, { credentials: 'same-origin' })
+      .then(response => response.ok ? response.json() : { items: [] })
+      .then(data => { if (query === lastQuery) fill(data.items); })
+      .catch(() => {});
+  }
+
+  // Delegated, so rows added with "Add Project" are covered too
+  document.addEventListener('focusin', event => {
+    if (isProjectInput(event.target)) event.target.setAttribute('list', options.id);
+  });
+  document.addEventListener('input', event => {
+    if (!isProjectInput(event.target)) return;
+    clearTimeout(timer);
+    const query = event.target.value.trim();
+    timer = setTimeout(() => suggest(query), DELAY_MS);
+  });
+})();
@@ -0,0 +1,119 @@
+"""
+Fixtures shared by the tests: an app on a fresh in-memory SQLite database
+per test, a test client, and helpers that add users and timesheets.
+
+    python -m pytest -q
+"""
+import csv
+import os
+from datetime import date, datetime, time, timedelta
+import pytest
+from flask.testing import FlaskClient
+from sqlalchemy import event
+from app import create_app
+from extensions import db
+from models import User, Project, Timesheet, TimesheetEntry
+from cache import CACHES
+from project_catalog import project_key, project_index
+import migrations
+
+PASSWORD = 'secret'
+WEEK = date(2024, 1, 1)  # a Monday
+
+
+class QueryCounter:
+    """Counts (and keeps) the statements sent to `engine` while it is in use as a context manager."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, *args):
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+class Client(FlaskClient):
+    """
+    Runs each request in an app context of its own, as a server does.
+    Otherwise requests share the test's context, and with it `g` and the
+    user Flask-Login loaded on the first request.
+    """
+
+    def open(self, *args, **kwargs):
+        with self.application.app_context():
+            return super().open(*args, **kwargs)
+
+
+@pytest.fixture
+def app():
+    app = create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TESTING': True})
+    app.test_client_class = Client
+    with app.app_context():
+        db.create_all()
+        migrations.stamp(db.engine)
+        # The caches are per process, so entries of the previous test's database must go
+        for cache in CACHES.values():
+            if cache is not project_index:
+                cache.clear()
+        project_index.refresh()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_user(username, role='employee', manager=None):
+    user = User(username=username, email=f'{username}@example.com', role=role,
+                manager_id=manager.id if manager else None)
+    user.set_password(PASSWORD)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def make_project(name='Apollo'):
+    project = Project(name=name, key=project_key(name))
+    db.session.add(project)
+    db.session.commit()
+    return project
+
+
+def make_timesheet(user, week_start=WEEK, status='draft', days=2, project=None):
+    """A timesheet of `user` with one 8-hour entry on each of its first `days` days."""
+    project = project or Project.query.first() or make_project()
+    timesheet = Timesheet(user_id=user.id, week_start=week_start, status=status,
+                          submitted_at=datetime.utcnow() if status != 'draft' else None)
+    db.session.add(timesheet)
+    db.session.flush()
+    for day in range(days):
+        db.session.add(TimesheetEntry(
+            timesheet_id=timesheet.id, date=week_start + timedelta(days=day),
+            clock_in=time(9), clock_out=time(17), project_id=project.id, hours=8.0,
+        ))
+    timesheet.refresh_totals()
+    db.session.commit()
+    return timesheet
+
+
+def login(client, user):
+    return client.post('/', data={'username': user.username, 'password': PASSWORD})
+
+
+def write_fixture_set(directory, **tables):
+    """Write `table name=[header, *rows]` as the plain .csv files of a fixture set (fixtures.py)."""
+    for name, rows in tables.items():
+        with open(os.path.join(directory, f'{name}.csv'), 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
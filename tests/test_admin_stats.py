@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta
+from admin_stats import dashboard_stats
+from extensions import db
+from utils import get_week_start_end
+from conftest import QueryCounter, make_user, make_timesheet
+
+
+def stats_counting():
+    with QueryCounter(db.engine) as counter:
+        stats = dashboard_stats()
+    return stats, counter.count
+
+
+def test_stats_come_from_one_statement_and_are_cached(app):
+    manager = make_user('boss', role='manager')
+    employee = make_user('emp', manager=manager)
+    this_week, _ = get_week_start_end()
+    make_timesheet(employee, this_week)
+    late = make_timesheet(employee, this_week - timedelta(weeks=2), status='submitted')
+    late.submitted_at = datetime.utcnow() - timedelta(days=app.config['PENDING_OVERDUE_DAYS'] + 1)
+    make_timesheet(employee, this_week - timedelta(weeks=1), status='submitted')
+    db.session.commit()
+
+    stats, statements = stats_counting()
+    assert statements == 1
+    assert stats['users_by_role'] == {'employee': 1, 'manager': 1, 'admin': 0}
+    assert stats['timesheets_by_status'] == {'draft': 1, 'submitted': 2, 'approved': 0, 'rejected': 0}
+    assert stats['this_week_by_status']['draft'] == 1
+    assert stats['overdue_submissions'] == 1
+    assert (stats['user_count'], stats['timesheet_count']) == (2, 3)
+
+    assert stats_counting() == (stats, 0)
+
+    # A commit that writes timesheets clears the cache
+    late.status = 'approved'
+    db.session.commit()
+    stats, statements = stats_counting()
+    assert statements == 1
+    assert stats['timesheets_by_status']['approved'] == 1
+    assert stats['overdue_submissions'] == 0
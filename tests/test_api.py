@@ -0,0 +1,62 @@
+from extensions import db
+from conftest import QueryCounter, make_user, make_timesheet, login
+
+
+def entries_of(detail):
+    return [{key: e[key] for key in ('date', 'clock_in', 'clock_out', 'project', 'description', 'hours')}
+            for e in detail['entries']]
+
+
+def test_get_answers_304_from_the_version_alone(app, client):
+    employee = make_user('emp')
+    timesheet = make_timesheet(employee)
+    login(client, employee)
+    url = f'/api/v1/timesheets/{timesheet.id}'
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.get_json()['total_hours'] == 16.0
+    etag = response.headers['ETag']
+
+    client.get(url, headers={'If-None-Match': etag})  # user loaded into the cache
+    with QueryCounter(db.engine) as counter:
+        response = client.get(url, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert counter.count == 1
+
+
+def test_unchanged_save_keeps_the_etag(app, client):
+    employee = make_user('emp')
+    timesheet = make_timesheet(employee)
+    login(client, employee)
+    url = f'/api/v1/timesheets/{timesheet.id}'
+    before = client.get(url)
+
+    response = client.put(f'{url}/entries', json={'entries': entries_of(before.get_json())},
+                          headers={'If-Match': before.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == before.headers['ETag']
+    assert response.get_json()['version'] == before.get_json()['version']
+    assert client.get(url, headers={'If-None-Match': before.headers['ETag']}).status_code == 304
+
+
+def test_write_with_a_stale_etag_is_refused(app, client):
+    employee = make_user('emp')
+    timesheet = make_timesheet(employee)
+    login(client, employee)
+    url = f'/api/v1/timesheets/{timesheet.id}'
+    before = client.get(url)
+    entries = entries_of(before.get_json())
+    entries[0]['hours'] = 7.5
+
+    response = client.put(f'{url}/entries', json={'entries': entries}, headers={'If-Match': before.headers['ETag']})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != before.headers['ETag']
+    assert response.get_json()['version'] == before.get_json()['version'] + 1
+    assert response.get_json()['total_hours'] == 15.5
+
+    # A second writer still holding the old ETag
+    entries[1]['hours'] = 1.0
+    response = client.put(f'{url}/entries', json={'entries': entries}, headers={'If-Match': before.headers['ETag']})
+    assert response.status_code == 412
+    assert client.get(url).get_json()['total_hours'] == 15.5
@@ -0,0 +1,57 @@
+from datetime import timedelta
+from extensions import db
+from models import Timesheet, ProjectWeekTotal
+from conftest import WEEK, make_user, make_timesheet, login
+
+
+def bulk(client, action, timesheets, comment=''):
+    return client.post('/manager/timesheets/bulk', follow_redirects=True, data={
+        'action': action, 'manager_comments': comment,
+        'timesheet_ids': [str(ts.id) for ts in timesheets],
+    })
+
+
+def reload(*timesheets):
+    db.session.expire_all()
+    return [db.session.get(Timesheet, ts.id) for ts in timesheets]
+
+
+def test_bulk_approve_updates_pending_reports_and_reports_the_rest(app, client):
+    manager = make_user('boss', role='manager')
+    other = make_user('other', role='manager')
+    employee = make_user('emp', manager=manager)
+    outsider = make_user('out', manager=other)
+    pending = [make_timesheet(employee, WEEK + timedelta(weeks=w), status='submitted') for w in range(2)]
+    draft = make_timesheet(employee, WEEK + timedelta(weeks=2))
+    foreign = make_timesheet(outsider, status='submitted')
+    versions = [ts.version for ts in pending]
+    login(client, manager)
+
+    page = bulk(client, 'approve', pending + [draft, foreign]).get_data(as_text=True)
+
+    assert '2 timesheet(s) approved.' in page
+    assert f'Skipped 2 timesheet(s) that are no longer pending your review: #{draft.id}, #{foreign.id}' in page
+    *pending, draft, foreign = reload(*pending, draft, foreign)
+    assert [ts.status for ts in pending] == ['approved', 'approved']
+    assert all(ts.approved_at for ts in pending)
+    assert [ts.version for ts in pending] == [v + 1 for v in versions]
+    # Stored as entered: no comment means none
+    assert [ts.manager_comments for ts in pending] == ['', '']
+    assert (draft.status, foreign.status) == ('draft', 'submitted')
+    # The report rollups follow the status change
+    assert {row.status for row in ProjectWeekTotal.query.filter_by(week_start=WEEK)} == {'approved', 'submitted'}
+
+
+def test_bulk_reject_requires_a_comment(app, client):
+    manager = make_user('boss', role='manager')
+    employee = make_user('emp', manager=manager)
+    timesheet = make_timesheet(employee, status='submitted')
+    login(client, manager)
+
+    page = bulk(client, 'reject', [timesheet]).get_data(as_text=True)
+    assert 'A comment is required to reject timesheets.' in page
+    assert reload(timesheet)[0].status == 'submitted'
+
+    bulk(client, 'reject', [timesheet], comment='  Missing Friday  ')
+    timesheet, = reload(timesheet)
+    assert (timesheet.status, timesheet.manager_comments) == ('rejected', 'Missing Friday')
@@ -0,0 +1,76 @@
+import csv
+import io
+from datetime import datetime, timedelta
+import pytest
+import change_feed
+from extensions import db
+from models import EntryTombstone
+from conftest import QueryCounter, make_user, make_timesheet, login
+
+
+@pytest.fixture
+def clients(app):
+    app.config['CHANGE_CURSOR_LAG_SECONDS'] = 0
+    admin, employee, user = app.test_client(), app.test_client(), make_user('emp')
+    login(admin, make_user('admin', role='admin'))
+    login(employee, user)
+    return admin, employee, user
+
+
+def export(admin, cursor=None):
+    response = admin.get('/admin/timesheets/export/changes', query_string={'cursor': cursor} if cursor else {})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    return [(row['Change'], int(row['Entry ID'])) for row in rows], response.headers['X-Next-Cursor']
+
+
+def save(employee, timesheet, hours):
+    entries = [{'date': f'2024-01-0{day + 1}', 'clock_in': '09:00', 'clock_out': '17:00',
+                'project': 'Apollo', 'description': '', 'hours': h} for day, h in enumerate(hours)]
+    assert employee.put(f'/api/v1/timesheets/{timesheet.id}/entries', json={'entries': entries}).status_code == 200
+
+
+def test_changes_since_the_cursor(app, clients):
+    admin, employee, user = clients
+    timesheet = make_timesheet(user, days=2)
+    other = make_timesheet(user, week_start=timesheet.week_start + timedelta(weeks=1))
+    first, second = sorted(e.id for e in timesheet.entries)
+
+    rows, cursor = export(admin)
+    assert sorted(rows) == sorted(('upsert', e.id) for e in timesheet.entries + other.entries)
+    assert export(admin, cursor)[0] == []
+
+    save(employee, timesheet, [8.0, 8.0])  # the same values: not a change
+    rows, cursor = export(admin, cursor)
+    assert rows == []
+
+    save(employee, timesheet, [6.0])
+    rows, cursor = export(admin, cursor)
+    # The deletion first, then every entry of the changed week
+    assert rows == [('delete', second), ('upsert', first)]
+    assert export(admin, cursor)[0] == []
+
+
+def test_export_only_reads(app, clients):
+    admin = clients[0]
+    old = datetime.utcnow() - timedelta(days=app.config['CHANGE_RETENTION_DAYS'] + 1)
+    db.session.add(EntryTombstone(entry_id=1, timesheet_id=1, deleted_at=old))
+    db.session.commit()
+    _, cursor = export(admin)
+
+    with QueryCounter(db.engine) as counter:
+        export(admin, cursor)
+    assert not [s for s in counter.statements if s.split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE')]
+    assert EntryTombstone.query.count() == 1
+
+    # Tombstones past the retention period are removed by `archive_entries.py run`
+    assert change_feed.purge_tombstones() == 1
+    db.session.commit()
+    assert EntryTombstone.query.count() == 0
+
+
+def test_malformed_and_expired_cursors_are_refused(app, clients):
+    admin = clients[0]
+    assert admin.get('/admin/timesheets/export/changes?cursor=not-a-cursor').status_code == 400
+    expired = change_feed.encode_cursor(datetime.utcnow() - timedelta(days=app.config['CHANGE_RETENTION_DAYS'] + 1))
+    assert admin.get('/admin/timesheets/export/changes', query_string={'cursor': expired}).status_code == 400
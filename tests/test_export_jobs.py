@@ -0,0 +1,108 @@
+import csv
+import glob
+import io
+import json
+import os
+import time
+import pytest
+import export_jobs
+from extensions import db
+from models import User
+from conftest import make_user, make_timesheet, login
+
+
+class InlineExecutor:
+    """Runs each job to completion as it is enqueued."""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+@pytest.fixture
+def jobs(app, tmp_path, monkeypatch):
+    app.config['EXPORT_DIR'] = str(tmp_path)
+    monkeypatch.setattr(export_jobs, '_executor', InlineExecutor())
+
+
+class QueueingExecutor:
+    """Keeps every job queued, as behind long jobs on busy workers."""
+
+    def submit(self, fn, *args):
+        pass
+
+
+def report(job):
+    with open(export_jobs.artifact_path(job['id']), newline='') as f:
+        return list(csv.DictReader(f))
+
+
+def test_export_with_the_same_filters_reuses_the_finished_file(app, jobs):
+    make_timesheet(make_user('emp'))
+    filters = {'status': '', 'start_date': '2024-01-01', 'end_date': '2024-01-31'}
+
+    first = export_jobs.enqueue('admin_timesheets', filters)
+    assert first['status'] == 'done'
+    assert len(report(first)) == 2
+    assert export_jobs.enqueue('admin_timesheets', filters)['id'] == first['id']
+    assert export_jobs.enqueue('admin_timesheets', dict(filters, status='approved'))['id'] != first['id']
+
+
+def test_import_of_the_same_file_runs_again(app, client, jobs):
+    login(client, make_user('admin', role='admin'))
+
+    def upload():
+        data = b'username,email,password,role,manager\nnew,new@example.com,pw123456,employee,\n'
+        response = client.post('/admin/users/import', data={'file': (io.BytesIO(data), 'users.csv')})
+        job_id = response.headers['Location'].rsplit('/', 1)[-1]
+        return export_jobs.get_job(job_id)
+
+    first = upload()
+    assert [row['Result'] for row in report(first)] == ['created']
+    User.query.filter_by(username='new').delete()
+    db.session.commit()
+
+    second = upload()
+    assert second['id'] != first['id']
+    assert [row['Result'] for row in report(second)] == ['created']
+    assert User.query.filter_by(username='new').count() == 1
+
+
+def age(job, seconds):
+    path = export_jobs._meta_path(export_jobs.export_dir(), job['id'])
+    with open(path) as f:
+        meta = json.load(f)
+    meta.update(job, updated_at=time.time() - seconds)
+    with open(path, 'w') as f:
+        json.dump(meta, f)
+
+
+def test_a_long_queued_job_is_not_failed_or_duplicated(app, jobs, monkeypatch):
+    monkeypatch.setattr(export_jobs, '_executor', QueueingExecutor())
+    filters = {'status': 'approved'}
+    job = export_jobs.enqueue('admin_timesheets', filters)
+    age(job, export_jobs.STALE_AFTER_SECONDS + 1)
+
+    assert export_jobs.get_job(job['id'])['status'] == 'queued'
+    assert export_jobs.enqueue('admin_timesheets', filters)['id'] == job['id']
+
+    # Queued in a worker process that has since been replaced (same pid): that one is dead
+    age(dict(job, worker_id='an earlier process'), 0)
+    assert export_jobs.get_job(job['id'])['status'] == 'failed'
+    assert export_jobs.enqueue('admin_timesheets', filters)['id'] != job['id']
+
+
+def test_a_running_job_writes_a_heartbeat_while_blocked(app, jobs, monkeypatch):
+    monkeypatch.setattr(export_jobs, 'HEARTBEAT_SECONDS', 0.05)
+    seen = []
+
+    def slow_export(filters):
+        [path] = glob.glob(os.path.join(export_jobs.export_dir(), '*.json'))
+        started = time.time()
+        time.sleep(0.3)  # a slow count query
+        with open(path) as f:
+            seen.append(json.load(f)['updated_at'] - started)
+        return ['Row'], iter([]), 0
+
+    monkeypatch.setitem(export_jobs.EXPORT_KINDS, 'slow', slow_export)
+    assert export_jobs.enqueue('slow', {})['status'] == 'done'
+    assert seen[0] > 0
@@ -0,0 +1,60 @@
+import os
+from datetime import datetime
+import pytest
+import fixtures
+from app import create_app
+from extensions import db
+from models import Timesheet, TimesheetEntry
+from conftest import WEEK, write_fixture_set
+
+POSTGRES_URL = os.environ.get('TEST_POSTGRES_URL')
+
+
+def write_set_without_updated_at(directory):
+    write_fixture_set(
+        directory,
+        users=[['id', 'username', 'email', 'password_hash', 'role'], [1, 'emp', 'emp@example.com', 'x', 'employee']],
+        projects=[['id', 'name', 'key'], [1, 'Apollo', 'apollo']],
+        timesheets=[['id', 'user_id', 'week_start'], [1, 1, WEEK]],
+        timesheet_entries=[['timesheet_id', 'date', 'project_id', 'hours'], [1, WEEK, 1, 8.0], [1, WEEK, 1, 2.0]],
+    )
+
+
+def assert_loaded_with_defaults(started):
+    timesheet = db.session.get(Timesheet, 1)
+    assert (timesheet.status, timesheet.total_hours, timesheet.entry_count) == ('draft', 10.0, 2)
+    assert timesheet.updated_at >= started
+    assert all(entry.updated_at >= started for entry in TimesheetEntry.query)
+
+
+def test_columns_missing_from_the_files_get_their_defaults(app, tmp_path):
+    write_set_without_updated_at(tmp_path)
+    started = datetime.utcnow()
+    counts = fixtures.load(str(tmp_path), log=lambda message: None)
+    assert counts == {'users': 1, 'projects': 1, 'timesheets': 1, 'timesheet_entries': 2}
+    assert_loaded_with_defaults(started)
+
+
+def test_copy_fills_in_the_app_defaults():
+    # COPY applies server defaults only; these are set on the table for the copy
+    header = ['id', 'user_id', 'week_start']
+    assert set(fixtures._app_defaults(Timesheet.__table__, header)) == {'status', 'updated_at'}
+    assert fixtures._app_defaults(Timesheet.__table__, header)['status'] == 'draft'
+    header = [column.name for column in TimesheetEntry.__table__.c if column.name != 'updated_at']
+    assert set(fixtures._app_defaults(TimesheetEntry.__table__, header)) == {'updated_at'}
+
+
+@pytest.mark.skipif(not POSTGRES_URL, reason='TEST_POSTGRES_URL is not set')
+def test_copy_load_without_updated_at(tmp_path):
+    pytest.importorskip('psycopg2')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': POSTGRES_URL, 'TESTING': True})
+    with app.app_context():
+        db.drop_all()
+        try:
+            write_set_without_updated_at(tmp_path)
+            started = datetime.utcnow()
+            fixtures.load(str(tmp_path), log=lambda message: None)
+            assert_loaded_with_defaults(started)
+        finally:
+            db.session.remove()
+            db.drop_all()
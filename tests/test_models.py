@@ -0,0 +1,41 @@
+from datetime import timedelta
+from extensions import db
+from models import Timesheet, TimesheetEntry
+from conftest import make_user, make_timesheet
+
+
+def test_version_bumps_only_on_a_real_change(app):
+    timesheet = make_timesheet(make_user('emp'))
+    version, updated_at = timesheet.version, timesheet.updated_at
+
+    timesheet.status = timesheet.status
+    timesheet.manager_comments = timesheet.manager_comments
+    db.session.commit()
+    assert (timesheet.version, timesheet.updated_at) == (version, updated_at)
+
+    timesheet.manager_comments = 'Looks good'
+    db.session.commit()
+    assert timesheet.version == version + 1
+    assert timesheet.updated_at > updated_at
+
+
+def test_entry_change_bumps_the_version(app):
+    timesheet = make_timesheet(make_user('emp'))
+    version = timesheet.version
+
+    entry = TimesheetEntry.query.filter_by(timesheet_id=timesheet.id).first()
+    entry.description = 'Reviewed'
+    timesheet.refresh_totals()  # same totals, still a change of the week
+    db.session.commit()
+    assert timesheet.version == version + 1
+
+
+def test_concurrent_bumps_are_not_lost(app):
+    timesheet = make_timesheet(make_user('emp'))
+    version = timesheet.version
+    # Another writer bumps the row after this session read it
+    db.session.execute(db.update(Timesheet).where(Timesheet.id == timesheet.id)
+                       .values(version=Timesheet.version + 1))
+    timesheet.week_start += timedelta(weeks=1)
+    db.session.commit()
+    assert timesheet.version == version + 2
@@ -0,0 +1,79 @@
+"""
+Entry partitioning only happens on Postgres. These tests run when
+TEST_POSTGRES_URL points at a scratch database (every table in it is
+dropped), e.g. postgresql://localhost/timesheet_test, and are skipped otherwise.
+"""
+import os
+from datetime import date
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import IntegrityError
+from app import create_app
+from extensions import db
+from models import TimesheetEntry
+import partitions
+from conftest import make_user, make_project, make_timesheet
+
+POSTGRES_URL = os.environ.get('TEST_POSTGRES_URL')
+pytestmark = pytest.mark.skipif(not POSTGRES_URL, reason='TEST_POSTGRES_URL is not set')
+
+
+@pytest.fixture
+def pg_app():
+    pytest.importorskip('psycopg2')
+    app = create_app({'SQLALCHEMY_DATABASE_URI': POSTGRES_URL, 'TESTING': True})
+    with app.app_context():
+        db.drop_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def referenced_tables(connection):
+    return set(connection.execute(text(
+        "SELECT confrelid::regclass::text FROM pg_constraint "
+        "WHERE conrelid = to_regclass(:table) AND contype = 'f'"
+    ), {'table': partitions.TABLE}).scalars())
+
+
+def assert_foreign_keys_enforced(timesheet):
+    with pytest.raises(IntegrityError):
+        with db.session.begin_nested():
+            db.session.add(TimesheetEntry(timesheet_id=timesheet.id, date=timesheet.week_start,
+                                          project_id=-1, hours=1.0))
+    with pytest.raises(IntegrityError):
+        with db.session.begin_nested():
+            db.session.add(TimesheetEntry(timesheet_id=-1, date=timesheet.week_start,
+                                          project_id=timesheet.entries[0].project_id, hours=1.0))
+    db.session.rollback()
+
+
+def test_create_all_partitions_with_every_foreign_key(pg_app):
+    db.create_all()
+    connection = db.session.connection()
+    assert partitions.is_partitioned(connection)
+    assert referenced_tables(connection) == {'timesheets', 'projects'}
+    assert_foreign_keys_enforced(make_timesheet(make_user('emp')))
+
+
+def test_partitioning_an_existing_table_keeps_rows_and_foreign_keys(pg_app):
+    # The table as it was before migration 7: created without the partitioning hook
+    event.remove(TimesheetEntry.__table__, 'after_create', partitions._partition_new_table)
+    try:
+        db.create_all()
+    finally:
+        event.listen(TimesheetEntry.__table__, 'after_create', partitions._partition_new_table)
+    make_project()
+    timesheet = make_timesheet(make_user('emp'), week_start=date(2024, 1, 1), days=3)
+
+    connection = db.session.connection()
+    assert not partitions.is_partitioned(connection)
+    assert partitions.partition_entries(connection)
+    db.session.commit()
+
+    connection = db.session.connection()
+    assert partitions.is_partitioned(connection)
+    assert referenced_tables(connection) == {'timesheets', 'projects'}
+    assert TimesheetEntry.query.count() == 3
+    db.session.expire_all()
+    assert_foreign_keys_enforced(timesheet)
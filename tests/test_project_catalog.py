@@ -0,0 +1,70 @@
+import fixtures
+from extensions import db
+from models import Project
+from project_catalog import ProjectIndex, project_index, project_key, resolve
+from conftest import WEEK, make_user, make_project, login, write_fixture_set
+
+
+def test_incremental_adds_keep_the_index_sorted():
+    index = ProjectIndex()
+    index._reload([(i, f'Project {i:03d} Ops', project_key(f'Project {i:03d} Ops')) for i in range(1, 200, 2)])
+    index.add([(i, f'Alpha {i}', project_key(f'Alpha {i}')) for i in range(200, 0, -2)])
+    index.add([(1, 'Duplicate', project_key('Duplicate'))])  # already indexed: ignored
+
+    assert index._suffixes == sorted(index._suffixes)
+    assert index.stats() == {'projects': 200, 'index_items': 100 * 3 + 100 * 2, 'max_id': 200}
+    assert index.complete('alpha 10', limit=3) == [(10, 'Alpha 10'), (100, 'Alpha 100'), (102, 'Alpha 102')]
+    assert index.word_matches('ops') == set(range(1, 200, 2))
+    assert index.name(1) == 'Project 001 Ops'
+
+
+def test_new_projects_are_suggested_once_committed(app, client):
+    assert project_index.complete('pay') == []
+    ids = resolve(['Payments', 'Data Platform', '  payments  '])
+    assert ids['Payments'] == ids['  payments  ']
+    db.session.commit()
+
+    assert Project.query.count() == 2
+    assert project_index.complete('pay') == [(ids['Payments'], 'Payments')]
+    # Names that start with the text come before names with a later word starting with it
+    resolve(['Platform Ops'])
+    db.session.commit()
+    assert [name for _, name in project_index.complete('plat')] == ['Platform Ops', 'Data Platform']
+
+    login(client, make_user('emp'))
+    response = client.get('/api/v1/projects?q=dat')
+    assert response.get_json() == {'items': [{'id': ids['Data Platform'], 'name': 'Data Platform'}]}
+
+
+def test_resolve_reads_ids_from_the_table(app):
+    apollo, zeus = make_project('Apollo'), make_project('Zeus')
+    project_index.refresh()
+    assert project_index.complete('apollo') == [(apollo.id, 'Apollo')]
+    # Renumbered behind this worker's back; the index is stale, the ids written must not be
+    db.session.execute(db.update(Project).values(key=Project.key + '-'))
+    db.session.execute(db.update(Project).where(Project.id == apollo.id).values(name='Zeus', key='zeus'))
+    db.session.execute(db.update(Project).where(Project.id == zeus.id).values(name='Apollo', key='apollo'))
+    db.session.commit()
+
+    assert resolve(['Apollo', 'ZEUS']) == {'Apollo': zeus.id, 'ZEUS': apollo.id}
+
+
+def test_fixture_load_that_renumbers_projects_reloads_the_index(app, tmp_path):
+    make_project('Apollo'), make_project('Zeus')
+    project_index.refresh()
+    assert project_index.complete('apollo') == [(1, 'Apollo')]
+
+    # The same two projects with their ids swapped: count and highest id are unchanged
+    write_fixture_set(
+        tmp_path,
+        users=[['id', 'username', 'email', 'password_hash', 'role'], [1, 'emp', 'emp@example.com', 'x', 'employee']],
+        projects=[['id', 'name', 'key'], [1, 'Zeus', 'zeus'], [2, 'Apollo', 'apollo']],
+        timesheets=[['id', 'user_id', 'week_start', 'status'], [1, 1, WEEK, 'draft']],
+        timesheet_entries=[['timesheet_id', 'date', 'project_id', 'hours'], [1, WEEK, 2, 8.0]],
+    )
+    fixtures.load(str(tmp_path), log=lambda message: None)
+
+    project_index.refresh()
+    assert project_index.complete('apollo') == [(2, 'Apollo')]
+    assert project_index.complete('zeus') == [(1, 'Zeus')]
+    assert resolve(['Apollo']) == {'Apollo': 2}
@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+from reporting import parse_report_params, MAX_REPORT_PERIODS, MAX_REPORT_WEEKS_AHEAD, EARLIEST_REPORT_DATE
+from conftest import make_user, make_timesheet, login
+
+
+def test_range_within_limits_is_kept():
+    params = parse_report_params(dict(start_date='2024-01-01', end_date='2024-06-30', period='week'))
+    assert (params['start'], params['end']) == (date(2024, 1, 1), date(2024, 6, 30))
+    assert params['clamped'] is None
+
+
+def test_long_range_is_clamped_with_a_warning():
+    params = parse_report_params(dict(start_date='2000-01-03', end_date='2024-06-30', period='week'))
+    assert params['end'] == date(2024, 6, 30)
+    assert params['start'] == date(2024, 6, 24) - timedelta(weeks=MAX_REPORT_PERIODS - 1)
+    assert f'at most {MAX_REPORT_PERIODS} weeks' in params['clamped']
+
+    params = parse_report_params(dict(start_date='2000-01-03', end_date='2024-06-30', period='month'))
+    assert params['start'] == date(2015, 11, 2)  # first Monday of the month 103 months earlier
+
+
+def test_extreme_dates_are_clamped():
+    params = parse_report_params(dict(start_date='0001-01-01', end_date='9999-12-31'))
+    today = date.today()
+    assert params['end'] == today - timedelta(days=today.weekday()) + timedelta(weeks=MAX_REPORT_WEEKS_AHEAD)
+    assert params['start'] < params['end']
+    assert params['clamped']
+
+    params = parse_report_params(dict(start_date='0001-01-01', end_date='0001-02-01'))
+    assert params['start'] == params['end'] == EARLIEST_REPORT_DATE
+
+
+def test_report_page_with_an_unbounded_range(app, client):
+    manager = make_user('boss', role='manager')
+    employee = make_user('emp', manager=manager)
+    make_timesheet(employee, status='approved')
+    login(client, manager)
+
+    response = client.get('/manager/reports/projects?start_date=0001-01-01&end_date=9999-12-31&period=month')
+    assert response.status_code == 200
+    assert 'Reports cover at most' in response.get_data(as_text=True)
+
+    response = client.get('/manager/reports/projects?start_date=2024-01-01&end_date=2024-01-31')
+    assert response.status_code == 200
+    assert 'Apollo' in response.get_data(as_text=True)
+
+
+def test_clamped_export_leaves_no_warning_for_the_next_page(app, client):
+    login(client, make_user('admin', role='admin'))
+    unbounded = 'start_date=0001-01-01&end_date=9999-12-31'
+
+    response = client.get(f'/admin/reports/projects/export?{unbounded}')
+    assert response.status_code == 200
+    assert 'Reports cover at most' in response.headers['X-Report-Clamped']
+    assert 'Reports cover at most' not in client.get('/admin/reports/projects').get_data(as_text=True)
+
+    assert 'Reports cover at most' in client.get(f'/admin/reports/projects?{unbounded}').get_data(as_text=True)
@@ -0,0 +1,72 @@
+from datetime import timedelta
+from extensions import db
+from models import Timesheet
+from timesheet_queries import timesheet_summaries
+from conftest import QueryCounter, WEEK, make_user, make_timesheet, login
+
+N = 3
+
+
+def add_weeks(user, first, count, status='submitted'):
+    for week in range(first, first + count):
+        make_timesheet(user, WEEK + timedelta(weeks=week), status=status)
+
+
+def count_summary_statements():
+    query = Timesheet.query.order_by(Timesheet.week_start)
+    with QueryCounter(db.engine) as counter:
+        rows = timesheet_summaries(query)
+        for row in rows:
+            row['clock_summary'], row['timesheet'].week_start
+    return counter.count, rows
+
+
+def test_summaries_statement_count_is_flat(app):
+    employee = make_user('emp')
+    add_weeks(employee, 0, N)
+    db.session.expire_all()
+    few, rows = count_summary_statements()
+    assert len(rows) == N
+
+    add_weeks(employee, N, 9 * N)
+    db.session.expire_all()
+    many, rows = count_summary_statements()
+    assert len(rows) == 10 * N
+
+    assert few == many == 2
+
+
+def test_summaries_rows(app):
+    employee = make_user('emp')
+    make_timesheet(employee, days=2)
+    [row] = timesheet_summaries(Timesheet.query)
+    assert row['username'] == 'emp'
+    assert row['total_hours'] == 16.0
+    assert row['clock_summary'] == '2024-01-01: 09:00 - 17:00; 2024-01-02: 09:00 - 17:00'
+
+
+def dashboard_statements(client, pending, approved):
+    url = '/manager/dashboard?start_date=2024-01-01&end_date=2025-12-31'
+    client.get(url)  # warms the per-worker caches the commits cleared
+    with QueryCounter(db.engine) as counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    page = response.get_data(as_text=True)
+    assert f'Pending Timesheets for Approval: <strong>{pending}</strong>' in page
+    assert page.count('badge bg-success">Approved') == approved
+    return counter.count
+
+
+def test_manager_dashboard_statement_count_is_flat(app, client):
+    manager = make_user('boss', role='manager')
+    employee = make_user('emp', manager=manager)
+    add_weeks(employee, 0, N)
+    add_weeks(employee, N, N, status='approved')
+    login(client, manager)
+    few = dashboard_statements(client, N, N)
+
+    add_weeks(employee, 2 * N, 9 * N)
+    add_weeks(employee, 11 * N, 9 * N, status='approved')
+    many = dashboard_statements(client, 10 * N, 10 * N)
+
+    assert few == many
@@ -0,0 +1,63 @@
+from cache import TTLCache
+from extensions import db
+from user_cache import identity_cache
+from conftest import QueryCounter, make_user, login
+
+
+def user_selects(client, url):
+    with QueryCounter(db.engine) as counter:
+        assert client.get(url).status_code == 200
+    return [s for s in counter.statements if 'FROM users' in s]
+
+
+def test_requests_load_the_user_from_the_cache(app, client):
+    employee = make_user('emp')
+    login(client, employee)
+    identity_cache.clear()
+    hits, misses = identity_cache.hits, identity_cache.misses
+
+    assert len(user_selects(client, '/employee/timesheets')) == 1
+    assert len(user_selects(client, '/employee/timesheets')) == 0
+    assert len(user_selects(client, '/employee/timesheets')) == 0
+    assert identity_cache.misses - misses == 1
+    assert identity_cache.hits - hits == 2
+
+
+def test_editing_a_user_drops_the_cached_identity(app, client):
+    admin = make_user('admin', role='admin')
+    employee = make_user('emp')
+    employee_client = app.test_client()
+    login(employee_client, employee)
+    assert employee_client.get('/manager/dashboard').status_code == 403
+
+    login(client, admin)
+    client.post(f'/admin/user/{employee.id}/edit',
+                data={'username': 'emp', 'email': 'emp@example.com', 'role': 'manager'})
+
+    # The next request sees the new role instead of the cached one
+    assert employee_client.get('/manager/dashboard').status_code == 200
+    assert identity_cache.get(employee.id).role == 'manager'
+
+
+def test_cache_stats_report_hits_and_misses(app, client):
+    admin = make_user('admin', role='admin')
+    login(client, admin)
+    client.get('/admin/dashboard')
+    stats = client.get('/admin/cache-stats').get_json()['user_identity']
+    assert stats['hits'] == identity_cache.hits
+    assert stats['misses'] == identity_cache.misses
+    assert stats['hits'] > 0
+
+
+def test_ttl_cache_expiry_and_eviction():
+    cache = TTLCache('test_cache', ttl=60, maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)  # evicts 'b', the least recently used
+    assert cache.get('b') is None
+    cache.configure(ttl=0)
+    cache.set('d', 4)
+    assert cache.get('d') is None  # already expired
+    assert cache.stats() == {'size': 1, 'maxsize': 2, 'ttl': 0, 'hits': 1, 'misses': 2,
+                             'evictions': 2, 'hit_ratio': 0.3333}
@@ -0,0 +1,92 @@
+from datetime import time, timedelta
+from extensions import db
+from models import TimesheetEntry, EntryTombstone
+from weekly_timesheet import save_week_entries
+from conftest import QueryCounter, WEEK, make_user, make_timesheet, login
+
+
+def stored_rows(timesheet):
+    return [
+        {'date': e.date, 'clock_in': e.clock_in, 'clock_out': e.clock_out,
+         'project': 'Apollo', 'description': e.description or '', 'hours': e.hours}
+        for e in TimesheetEntry.query.filter_by(timesheet_id=timesheet.id).order_by(TimesheetEntry.date, TimesheetEntry.id)
+    ]
+
+
+def week_with_entries(per_day, user=None, week_start=WEEK):
+    timesheet = make_timesheet(user or make_user(f'emp{per_day}'), week_start, days=0)
+    rows = [{'date': week_start + timedelta(days=day), 'clock_in': time(9), 'clock_out': time(17),
+             'project': 'Apollo', 'description': f'Task {n}', 'hours': 1.0}
+            for day in range(5) for n in range(per_day)]
+    save_week_entries(timesheet.id, rows, timesheet.week_start)
+    db.session.commit()
+    return timesheet
+
+
+def save_counting(timesheet, rows):
+    with QueryCounter(db.engine) as counter:
+        result = save_week_entries(timesheet.id, rows, timesheet.week_start)
+    db.session.commit()
+    return result, counter.count
+
+
+def test_unchanged_save_only_reads(app):
+    timesheet = week_with_entries(3)
+    ids = {e.id for e in timesheet.entries}
+    result, statements = save_counting(timesheet, stored_rows(timesheet))
+    assert result == {'inserted': 0, 'updated': 0, 'deleted': 0}
+    assert statements == 2  # the stored entries and the project ids
+    db.session.expire_all()
+    assert {e.id for e in timesheet.entries} == ids
+
+
+def test_save_statements_do_not_grow_with_the_week(app):
+    counts = []
+    for per_day in (2, 20):
+        timesheet = week_with_entries(per_day)
+        rows = stored_rows(timesheet)
+        kept = {e.id for e in timesheet.entries}
+        # Change every second row, drop the last one of each day, add one on Saturday
+        for row in rows[::2]:
+            row['hours'] = 2.0
+        rows = [row for i, row in enumerate(rows) if i % per_day != per_day - 1]
+        rows.append(dict(rows[0], date=WEEK + timedelta(days=5)))
+
+        result, statements = save_counting(timesheet, rows)
+        assert result['inserted'] == 1 and result['deleted'] == 5 and result['updated'] > 0
+        counts.append(statements)
+
+        db.session.expire_all()
+        assert stored_rows(timesheet) == sorted(rows, key=lambda r: r['date'])
+        # Rows that were kept keep their ids; the dropped ones leave tombstones
+        remaining = {e.id for e in timesheet.entries}
+        assert len(remaining - kept) == 1
+        assert EntryTombstone.query.filter_by(timesheet_id=timesheet.id).count() == 5
+
+    assert counts == [6, 6]
+
+
+def page_statements(client, url):
+    client.get(url)  # warms the per-worker caches
+    with QueryCounter(db.engine) as counter:
+        response = client.get(url)
+    assert response.status_code == 200
+    return counter.count
+
+
+def test_weekly_pages_run_a_fixed_number_of_statements(app, client):
+    manager = make_user('boss', role='manager')
+    employee = make_user('emp', manager=manager)
+    small = week_with_entries(1, employee)
+    large = week_with_entries(10, employee, WEEK + timedelta(weeks=1))
+
+    login(client, employee)
+    for url in ('/employee/timesheets/edit/{}', '/employee/timesheets/view/{}'):
+        assert page_statements(client, url.format(small.id)) == page_statements(client, url.format(large.id))
+    client.get('/logout')
+
+    small.status = large.status = 'submitted'
+    db.session.commit()
+    login(client, manager)
+    url = '/manager/timesheets/view/{}'
+    assert page_statements(client, url.format(small.id)) == page_statements(client, url.format(large.id))
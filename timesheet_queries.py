@@ -0,0 +1,178 @@
+from collections import defaultdict
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import func
+from extensions import db
+from models import User, Project, Timesheet, TimesheetEntry
+
+
+def format_clock_summary(day_times):
+    """
+    Format per-day clock spans as "YYYY-MM-DD: HH:MM - HH:MM; ...".
+    day_times maps a date to a (clock_in, clock_out) tuple.
+    """
+    parts = []
+    for day, (ci, co) in sorted(day_times.items()):
+        ci = ci.strftime('%H:%M') if ci else '-'
+        co = co.strftime('%H:%M') if co else '-'
+        parts.append(f"{day.strftime('%Y-%m-%d')}: {ci} - {co}")
+    return "; ".join(parts)
+
+
+def entry_week_bounds(first_week=None, last_week=None):
+    """
+    Conditions on TimesheetEntry.date that match the entries of timesheets
+    whose week_start lies in [first_week, last_week]. Entries always fall
+    within their week, so these add nothing to a week_start filter, but they
+    let Postgres read only the entry partitions of those months.
+    """
+    conditions = []
+    if first_week:
+        conditions.append(TimesheetEntry.date >= first_week)
+    if last_week:
+        conditions.append(TimesheetEntry.date < last_week + timedelta(days=7))
+    return conditions
+
+
+def timesheet_summaries(query, first_week=None, last_week=None):
+    """
+    Build dashboard rows for every timesheet matched by `query`.
+
+    Runs exactly two statements regardless of how many timesheets match:
+    one for the timesheet and username (total hours come from the
+    Timesheet.total_hours rollup), and one for the earliest clock-in /
+    latest clock-out of each day.
+    Returns a list of dicts with keys: timesheet, username, total_hours,
+    clock_summary. The order of `query` is preserved. Pass the week_start
+    range `query` is filtered on as first_week/last_week so the clock spans
+    only read the matching entry partitions.
+    """
+    ids = query.order_by(None).with_entities(Timesheet.id).subquery()
+
+    rows = (
+        query.join(User, User.id == Timesheet.user_id)
+        .with_entities(Timesheet, User.username)
+        .all()
+    )
+
+    spans = (
+        db.session.query(
+            TimesheetEntry.timesheet_id,
+            TimesheetEntry.date,
+            func.min(TimesheetEntry.clock_in),
+            func.max(TimesheetEntry.clock_out),
+        )
+        .filter(TimesheetEntry.timesheet_id.in_(db.select(ids.c.id)), *entry_week_bounds(first_week, last_week))
+        .group_by(TimesheetEntry.timesheet_id, TimesheetEntry.date)
+        .all()
+    )
+
+    day_times = defaultdict(dict)
+    for ts_id, day, ci, co in spans:
+        day_times[ts_id][day] = (ci, co)
+
+    return [
+        {
+            'timesheet': ts,
+            'username': username,
+            'total_hours': ts.total_hours,
+            'clock_summary': format_clock_summary(day_times.get(ts.id, {})),
+        }
+        for ts, username in rows
+    ]
+
+
+def entry_export_rows(query, *columns, first_week=None, last_week=None):
+    """
+    Yield one tuple of `columns` per entry of every timesheet matched by
+    `query`, newest week first. first_week/last_week are the week_start
+    range of `query`, if any (see entry_week_bounds). Columns may include
+    Project.name, the entry's project.
+
+    Timesheets, users and entries are fetched in a single joined query
+    streamed from a server-side cursor in batches of EXPORT_BATCH_SIZE, so
+    memory stays bounded however wide the filter is.
+    """
+    batch_size = current_app.config.get('EXPORT_BATCH_SIZE', 1000)
+    rows = (
+        query.order_by(None)
+        .outerjoin(User, User.id == Timesheet.user_id)
+        .join(TimesheetEntry, TimesheetEntry.timesheet_id == Timesheet.id)
+        .join(Project, Project.id == TimesheetEntry.project_id)
+        .filter(*entry_week_bounds(first_week, last_week))
+        .with_entities(*columns)
+        .order_by(Timesheet.week_start.desc(), Timesheet.id, TimesheetEntry.date, TimesheetEntry.id)
+        .yield_per(batch_size)
+    )
+    for row in rows:
+        yield tuple(row)
+
+
+ADMIN_EXPORT_HEADER = [
+    "Timesheet ID", "User", "Week Start", "Status", "Submitted At", "Approved At",
+    "Entry Date", "Clock In", "Clock Out", "Project", "Description", "Hours"
+]
+
+
+def admin_export_query(status=None, start_date=None, end_date=None):
+    """Timesheets selected by the admin list/export filters."""
+    query = Timesheet.query
+    if status:
+        query = query.filter_by(status=status)
+    if start_date:
+        query = query.filter(Timesheet.week_start >= start_date)
+    if end_date:
+        query = query.filter(Timesheet.week_start <= end_date)
+    return query
+
+
+def admin_export_rows(query, start_date=None, end_date=None):
+    """
+    Rows of the admin CSV export (one per entry), matching ADMIN_EXPORT_HEADER.
+    start_date/end_date are the week_start filters `query` was built with.
+    """
+    return entry_export_rows(
+        query,
+        Timesheet.id, User.username, Timesheet.week_start, Timesheet.status,
+        Timesheet.submitted_at, Timesheet.approved_at,
+        TimesheetEntry.date, TimesheetEntry.clock_in, TimesheetEntry.clock_out,
+        Project.name, TimesheetEntry.description, TimesheetEntry.hours,
+        first_week=start_date, last_week=end_date
+    )
+
+
+def rollup_update(timesheet_ids=None, skip_archived=True):
+    """
+    Build a set-based UPDATE that recomputes the Timesheet rollup columns
+    (total_hours, entry_count, first_clock_in, last_clock_out) from
+    timesheet_entries, limited to `timesheet_ids` when given. Archived
+    timesheets have no entries left to count, so unless skip_archived is
+    False they keep the values they had when archived.
+    """
+    entries = TimesheetEntry.__table__
+    timesheets = Timesheet.__table__
+    per_timesheet = entries.c.timesheet_id == timesheets.c.id
+
+    def correlated(expr):
+        return db.select(expr).where(per_timesheet).scalar_subquery()
+
+    stmt = db.update(timesheets).values(
+        total_hours=correlated(func.coalesce(func.sum(entries.c.hours), 0.0)),
+        entry_count=correlated(func.count(entries.c.id)),
+        first_clock_in=correlated(func.min(entries.c.clock_in)),
+        last_clock_out=correlated(func.max(entries.c.clock_out)),
+    )
+    if skip_archived:
+        stmt = stmt.where(timesheets.c.archived_at.is_(None))
+    if timesheet_ids is not None:
+        stmt = stmt.where(timesheets.c.id.in_(list(timesheet_ids)))
+    return stmt
+
+
+def repair_timesheet_rollups(timesheet_ids=None):
+    """
+    Recompute rollup columns for all (or the given) timesheets.
+    Returns the number of timesheets updated; the caller commits.
+    """
+    stmt = rollup_update(timesheet_ids).values(version=Timesheet.__table__.c.version + 1)
+    return db.session.execute(stmt).rowcount
@@ -0,0 +1,52 @@
+from flask_login import UserMixin
+from cache import TTLCache
+from extensions import db
+from models import User
+
+# user id -> UserIdentity; configured from USER_CACHE_TTL / USER_CACHE_MAX_SIZE
+identity_cache = TTLCache('user_identity', ttl=60, maxsize=10000)
+
+
+class UserIdentity(UserMixin):
+    """
+    Detached snapshot of the User columns read on every request
+    (id, username, email, role, manager_id). It is what `current_user`
+    holds, so it must not be used to modify the user.
+    """
+
+    def __init__(self, id, username, email, role, manager_id):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.role = role
+        self.manager_id = manager_id
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email, user.role, user.manager_id)
+
+    def is_employee(self):
+        return self.role == 'employee'
+
+    def is_manager(self):
+        return self.role == 'manager'
+
+    def is_admin(self):
+        return self.role == 'admin'
+
+
+def load_user_identity(user_id):
+    """Return the cached identity for `user_id`, loading it on a miss. Unknown ids are not cached."""
+    identity = identity_cache.get(user_id)
+    if identity is None:
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = UserIdentity.from_user(user)
+        identity_cache.set(user_id, identity)
+    return identity
+
+
+def invalidate_user(user_id):
+    """Drop a user's cached identity in this worker; call after its row changes or is deleted."""
+    identity_cache.invalidate(user_id)
@@ -0,0 +1,246 @@
+"""
+Bulk user import from CSV or JSON.
+
+Each record has username, email, password, role and optionally manager
+(the manager's username, an existing manager or one created by the same
+file). Records are validated up front: existing usernames and emails are
+found with one set-based query per chunk instead of a lookup per user.
+Valid records are then inserted in batches of IMPORT_BATCH_SIZE. Each
+batch's passwords are hashed in parallel on a process pool first, since
+password hashing is deliberately slow.
+
+import_rows() yields one report row per record (row number, username,
+result, message), so callers can stream progress and keep a per-row record
+of what was created and why the rest was rejected.
+"""
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from werkzeug.security import generate_password_hash
+from extensions import db
+from models import User
+
+REPORT_HEADER = ['Row', 'Username', 'Result', 'Message']
+FIELDS = ('username', 'email', 'password', 'role', 'manager')
+REQUIRED_FIELDS = ('username', 'email', 'password', 'role')
+ROLES = ('employee', 'manager', 'admin')
+
+# Values per IN (...) list in the existence checks; well under every driver's parameter limit
+LOOKUP_CHUNK = 900
+# Below this many passwords a process pool costs more to start than it saves
+MIN_POOL_PASSWORDS = 8
+
+
+def read_rows(data, fmt):
+    """
+    Parse uploaded bytes as 'csv' (with a header row) or 'json' (a list of
+    objects). Returns a list of dicts with the FIELDS keys as stripped strings.
+    Raises ValueError for a file that cannot be read at all.
+    """
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ValueError("The file is not UTF-8 text.")
+
+    if fmt == 'json':
+        try:
+            records = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+            raise ValueError("JSON imports must be a list of objects.")
+    elif fmt == 'csv':
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise ValueError("The CSV file is empty.")
+        missing = [f for f in REQUIRED_FIELDS if f not in (n.strip().lower() for n in reader.fieldnames)]
+        if missing:
+            raise ValueError(f"CSV header is missing: {', '.join(missing)}")
+        records = [{(k or '').strip().lower(): v for k, v in r.items()} for r in reader]
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+    return [{f: str(r.get(f) or '').strip() for f in FIELDS} for r in records]
+
+
+def _chunks(items, size):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _existing(column, values):
+    """The subset of `values` already present in `column`, one query per LOOKUP_CHUNK values."""
+    found = set()
+    for chunk in _chunks(values, LOOKUP_CHUNK):
+        found.update(db.session.execute(db.select(column).where(column.in_(chunk))).scalars())
+    return found
+
+
+def _validate(rows):
+    """
+    Split rows into (valid, errors). `valid` is a list of (row number,
+    record); `errors` a list of report rows. Managers are resolved here:
+    each valid record gets 'manager_id' (an existing manager) or keeps
+    'manager' (a manager created by this file).
+    """
+    errors, candidates = [], []
+    seen_usernames, seen_emails = set(), set()
+    for number, row in enumerate(rows, start=1):
+        problems = [f"{f} is required" for f in REQUIRED_FIELDS if not row[f]]
+        if row['role'] and row['role'] not in ROLES:
+            problems.append(f"role must be one of {', '.join(ROLES)}")
+        if len(row['username']) > 80:
+            problems.append("username is longer than 80 characters")
+        if row['email'] and ('@' not in row['email'] or len(row['email']) > 120):
+            problems.append("email is not a valid address")
+        if row['manager'] and row['manager'] == row['username']:
+            problems.append("a user cannot be their own manager")
+        if row['username'] in seen_usernames:
+            problems.append("username appears earlier in the file")
+        if row['email'].lower() in seen_emails:
+            problems.append("email appears earlier in the file")
+        seen_usernames.add(row['username'])
+        seen_emails.add(row['email'].lower())
+        if problems:
+            errors.append([number, row['username'], 'error', '; '.join(problems)])
+        else:
+            candidates.append((number, row))
+
+    taken_usernames = _existing(User.username, {r['username'] for _, r in candidates})
+    taken_emails = _existing(User.email, {r['email'] for _, r in candidates})
+    manager_names = {r['manager'] for _, r in candidates if r['manager']}
+    existing_managers = {}
+    for chunk in _chunks(manager_names, LOOKUP_CHUNK):
+        existing_managers.update(db.session.execute(
+            db.select(User.username, User.id).where(User.username.in_(chunk), User.role == 'manager')
+        ).all())
+
+    valid = []
+    for number, row in candidates:
+        problems = []
+        if row['username'] in taken_usernames:
+            problems.append("username already exists")
+        if row['email'] in taken_emails:
+            problems.append("email already exists")
+        if problems:
+            errors.append([number, row['username'], 'error', '; '.join(problems)])
+        else:
+            valid.append((number, row))
+
+    new_managers = {r['username'] for _, r in valid if r['role'] == 'manager'}
+    resolved = []
+    for number, row in valid:
+        if row['manager'] in existing_managers:
+            row['manager_id'] = existing_managers[row['manager']]
+        elif row['manager'] and row['manager'] not in new_managers:
+            errors.append([number, row['username'], 'error',
+                           f"manager '{row['manager']}' is not an existing manager or a manager in this file"])
+            continue
+        resolved.append((number, row))
+    return resolved, errors
+
+
+def _usable_cpus():
+    # The CPUs this process may run on, which a container can limit below os.cpu_count()
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _hash_passwords(pool, workers, passwords):
+    if pool is None or len(passwords) < MIN_POOL_PASSWORDS:
+        return [generate_password_hash(p) for p in passwords]
+    return list(pool.map(generate_password_hash, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def _user_values(row, password_hash):
+    return {'username': row['username'], 'email': row['email'], 'password_hash': password_hash,
+            'role': row['role'], 'manager_id': row.get('manager_id')}
+
+
+def _insert_batch(batch, hashes):
+    """
+    Insert a batch with one multi-row INSERT ... RETURNING. If it violates a
+    constraint (a user created concurrently since validation), fall back to
+    one savepoint per row so only the offending rows are rejected.
+    Returns ({username: id}, report rows for the failures).
+    """
+    values = [_user_values(row, h) for (_, row), h in zip(batch, hashes)]
+    try:
+        with db.session.begin_nested():
+            ids = dict(db.session.execute(
+                db.insert(User).returning(User.username, User.id), values
+            ).all())
+        return ids, []
+    except IntegrityError:
+        pass
+
+    ids, failures = {}, []
+    for (number, row), value in zip(batch, values):
+        try:
+            with db.session.begin_nested():
+                ids[row['username']] = db.session.execute(db.insert(User).returning(User.id), value).scalar()
+        except IntegrityError:
+            failures.append([number, row['username'], 'error', "username or email already exists"])
+    return ids, failures
+
+
+def import_rows(rows, dry_run=False, batch_size=None, workers=None):
+    """
+    Validate and create the users in `rows` (from read_rows), yielding one
+    REPORT_HEADER row per record. Each batch is committed as it completes.
+    With dry_run only validation runs and nothing is written.
+    """
+    batch_size = batch_size or current_app.config.get('IMPORT_BATCH_SIZE', 500)
+    workers = workers or current_app.config.get('IMPORT_HASH_WORKERS') or _usable_cpus()
+
+    valid, errors = _validate(rows)
+    yield from errors
+    if dry_run:
+        for number, row in valid:
+            yield [number, row['username'], 'valid', '']
+        return
+
+    # Managers first, so most reports can be linked to them at insert time
+    valid.sort(key=lambda item: item[1]['role'] != 'manager')
+    created = {}
+    unlinked = []  # (row number, username, user id, manager) whose manager was created after them
+    pool = None
+    if workers > 1 and len(valid) >= MIN_POOL_PASSWORDS:
+        # spawn: forking a threaded server process can copy held locks into the children
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    try:
+        for batch in _chunks(valid, batch_size):
+            for _, row in batch:
+                if row['manager'] and 'manager_id' not in row and row['manager'] in created:
+                    row['manager_id'] = created[row['manager']]
+            hashes = _hash_passwords(pool, workers, [row['password'] for _, row in batch])
+            ids, failures = _insert_batch(batch, hashes)
+            db.session.commit()
+            created.update(ids)
+
+            yield from failures
+            for number, row in batch:
+                if row['username'] in ids:
+                    if row['manager'] and row.get('manager_id') is None:
+                        unlinked.append((number, row['username'], ids[row['username']], row['manager']))
+                    yield [number, row['username'], 'created', '']
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    links = [{'id': user_id, 'manager_id': created[manager]} for _, _, user_id, manager in unlinked if manager in created]
+    if links:
+        db.session.execute(db.update(User), links)
+        db.session.commit()
+    for number, username, user_id, manager in unlinked:
+        if manager not in created:
+            logging.error(f"User import row {number}: manager {manager} was not created; user {user_id} has no manager")
+            yield [number, username, 'warning', f"created without a manager: '{manager}' could not be created"]
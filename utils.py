@@ -1,7 +1,8 @@
 from functools import wraps
-from flask import abort
+from flask import abort, Response, stream_with_context
 from flask_login import current_user
 import datetime
+import csv
 
 def role_required(role):
     """
@@ -54,3 +55,35 @@ def get_week_start_end(date=None):
     end = start + datetime.timedelta(days=6)                # Sunday
     return start, end
 
+
+
+class _EchoBuffer:
+    """File-like object whose write() returns the value instead of storing it."""
+    def write(self, value):
+        return value
+
+def stream_csv(header, rows, chunk_rows=500):
+    """
+    Generate CSV text for `header` followed by `rows`, one chunk of up to
+    `chunk_rows` lines at a time, so the full file is never held in memory.
+    """
+    writer = csv.writer(_EchoBuffer())
+    chunk = [writer.writerow(header)]
+    for row in rows:
+        chunk.append(writer.writerow(row))
+        if len(chunk) >= chunk_rows:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+def csv_response(header, rows, filename):
+    """
+    Return a streamed CSV attachment. `rows` is consumed lazily while the
+    response is sent, inside the current request context.
+    """
+    return Response(
+        stream_with_context(stream_csv(header, rows)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment;filename={filename}'}
+    )
@@ -0,0 +1,122 @@
+from collections import defaultdict
+from datetime import timedelta
+from itertools import zip_longest
+from extensions import db
+from models import TimesheetEntry
+from entry_archive import week_entries
+from project_catalog import resolve
+from change_feed import record_deleted_entries
+
+# Entry columns edited through the weekly grid
+ENTRY_FIELDS = ('date', 'clock_in', 'clock_out', 'project_id', 'description', 'hours')
+
+
+def _normalized(row):
+    return (
+        row['date'], row['clock_in'], row['clock_out'],
+        row['project_id'], row['description'] or '', float(row['hours'] or 0),
+    )
+
+
+def save_week_entries(timesheet_id, rows, week_start=None):
+    """
+    Make the stored entries of a timesheet match `rows`, the submitted grid.
+
+    `rows` is a list of dicts keyed by ENTRY_FIELDS, with the project name
+    under 'project' instead of 'project_id', in display order. Names are
+    resolved through the project catalog, which adds new ones. Rows
+    are paired with the stored entries of the same day by position; pairs
+    that already match cost nothing, changed pairs become an UPDATE, and
+    extra rows on either side become an INSERT or DELETE. Each kind is sent
+    as one bulk statement, so with known project names a save issues at
+    most six statements (a SELECT of the stored entries and one of the
+    project ids, one per kind, and one recording the deleted entries for
+    the incremental export, see change_feed.py) however many rows the week
+    has, and unchanged entries keep their ids.
+
+    Pass the timesheet's week_start so the stored entries are read from its
+    week's partition only. Returns a dict with the number of inserted,
+    updated and deleted rows. The caller commits.
+    """
+    in_week = []
+    if week_start is not None:
+        in_week = [TimesheetEntry.date >= week_start, TimesheetEntry.date < week_start + timedelta(days=7)]
+    stored = (
+        db.session.query(TimesheetEntry.id, *(getattr(TimesheetEntry, f) for f in ENTRY_FIELDS))
+        .filter(TimesheetEntry.timesheet_id == timesheet_id, *in_week)
+        .order_by(TimesheetEntry.date, TimesheetEntry.id)
+        .all()
+    )
+
+    project_ids = resolve({row['project'] for row in rows})
+    rows = [{**{k: v for k, v in row.items() if k != 'project'}, 'project_id': project_ids[row['project']]}
+            for row in rows]
+
+    stored_by_day = defaultdict(list)
+    for entry in stored:
+        stored_by_day[entry.date].append(entry)
+    submitted_by_day = defaultdict(list)
+    for row in rows:
+        submitted_by_day[row['date']].append(row)
+
+    inserts, updates, deletes = [], [], []
+    for day in set(stored_by_day) | set(submitted_by_day):
+        for old, new in zip_longest(stored_by_day[day], submitted_by_day[day]):
+            if new is None:
+                deletes.append(old.id)
+            elif old is None:
+                inserts.append(dict(new, timesheet_id=timesheet_id))
+            elif _normalized(old._mapping) != _normalized(new):
+                updates.append(dict(new, id=old.id))
+
+    if inserts:
+        db.session.execute(db.insert(TimesheetEntry), inserts)
+    if updates:
+        db.session.execute(db.update(TimesheetEntry), updates)
+    if deletes:
+        db.session.execute(
+            db.delete(TimesheetEntry).where(TimesheetEntry.id.in_(deletes)),
+            execution_options={'synchronize_session': False}
+        )
+        record_deleted_entries(db.session, timesheet_id, deletes)
+
+    return {'inserted': len(inserts), 'updated': len(updates), 'deleted': len(deletes)}
+
+
+class WeekGrid:
+    """
+    The entries of one timesheet laid out day by day for the weekly pages.
+
+    All entries are loaded with a single ordered query and bucketed in
+    memory. `days` holds one dict per day of the week with the keys
+    date, entries, total_hours, clock_in (earliest) and clock_out (latest).
+    """
+
+    def __init__(self, timesheet, num_days=7):
+        self.timesheet = timesheet
+        dates = [timesheet.week_start + timedelta(days=i) for i in range(num_days)]
+
+        entries = week_entries(timesheet)
+        by_date = defaultdict(list)
+        for entry in entries:
+            by_date[entry.date].append(entry)
+
+        self.days = []
+        for day in dates:
+            day_entries = by_date.get(day, [])
+            clock_ins = [e.clock_in for e in day_entries if e.clock_in]
+            clock_outs = [e.clock_out for e in day_entries if e.clock_out]
+            self.days.append({
+                'date': day,
+                'entries': day_entries,
+                'total_hours': sum(e.hours or 0.0 for e in day_entries),
+                'clock_in': min(clock_ins) if clock_ins else None,
+                'clock_out': max(clock_outs) if clock_outs else None,
+            })
+
+        self.total_hours = sum(d['total_hours'] for d in self.days)
+
+    @property
+    def worked_days(self):
+        """Days that have at least one entry."""
+        return [d for d in self.days if d['entries']]